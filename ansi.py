@@ -0,0 +1,304 @@
+import html
+import re
+import threading
+from collections import deque
+from typing import List, NamedTuple, Optional, Tuple
+
+from output_store import DEFAULT_MAX_BYTES
+
+# Complete escape sequences: CSI, OSC (ended by BEL or ST), charset selection
+# and the remaining two-character escapes
+_SEQUENCE = re.compile(
+    r"\x1b(?:"
+    r"\[([0-?]*)[ -/]*([@-~])"
+    r"|\][^\x07\x1b]*(?:\x07|\x1b\\)"
+    r"|[()*+][0-9A-Za-z]"
+    r"|[0-Z\\^-~]"
+    r")"
+)
+
+# The start of an escape sequence that has not been completed yet
+_INCOMPLETE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*\x1b?|[()*+])?\Z")
+
+# A sequence that has not ended after this many characters is malformed
+MAX_SEQUENCE_LENGTH = 256
+
+# Standard 16-colour palette (normal, then bright)
+PALETTE = [
+    "#000000", "#cd3131", "#0dbc79", "#e5e510", "#2472c8", "#bc3fbc", "#11a8cd", "#e5e5e5",
+    "#666666", "#f14c4c", "#23d18b", "#f5f543", "#3b8eea", "#d670d6", "#29b8db", "#ffffff",
+]
+
+
+class Style(NamedTuple):
+    """Text attributes set by SGR sequences; colours are CSS colour strings"""
+    fg: Optional[str] = None
+    bg: Optional[str] = None
+    bold: bool = False
+    dim: bool = False
+    italic: bool = False
+    underline: bool = False
+    inverse: bool = False
+
+
+DEFAULT_STYLE = Style()
+
+# A run of text drawn in one style
+Span = Tuple[str, Style]
+
+
+def _xterm_color(index: int) -> str:
+    """CSS colour of an entry in the xterm 256-colour table"""
+    if index < 16:
+        return PALETTE[index]
+    if index < 232:
+        index -= 16
+        levels = [0 if value == 0 else 55 + value * 40 for value in
+                  (index // 36, (index // 6) % 6, index % 6)]
+        return "#{:02x}{:02x}{:02x}".format(*levels)
+    gray = 8 + (index - 232) * 10
+    return f"#{gray:02x}{gray:02x}{gray:02x}"
+
+
+def _extended_color(params: List[int], index: int) -> Tuple[Optional[str], int]:
+    """Parse the arguments of 38/48; returns the colour and the index of the next parameter"""
+    if index < len(params) and params[index] == 5 and index + 1 < len(params):
+        return _xterm_color(params[index + 1] & 0xff), index + 2
+    if index < len(params) and params[index] == 2 and index + 3 < len(params):
+        red, green, blue = (value & 0xff for value in params[index + 1:index + 4])
+        return f"#{red:02x}{green:02x}{blue:02x}", index + 4
+    return None, len(params)
+
+
+def apply_sgr(style: Style, params: List[int]) -> Style:
+    """Return the style after a Select Graphic Rendition sequence"""
+    if not params:
+        params = [0]
+    index = 0
+    while index < len(params):
+        code = params[index]
+        index += 1
+        if code == 0:
+            style = DEFAULT_STYLE
+        elif code == 1:
+            style = style._replace(bold=True)
+        elif code == 2:
+            style = style._replace(dim=True)
+        elif code == 3:
+            style = style._replace(italic=True)
+        elif code == 4:
+            style = style._replace(underline=True)
+        elif code == 7:
+            style = style._replace(inverse=True)
+        elif code == 22:
+            style = style._replace(bold=False, dim=False)
+        elif code == 23:
+            style = style._replace(italic=False)
+        elif code == 24:
+            style = style._replace(underline=False)
+        elif code == 27:
+            style = style._replace(inverse=False)
+        elif 30 <= code <= 37:
+            style = style._replace(fg=PALETTE[code - 30])
+        elif 90 <= code <= 97:
+            style = style._replace(fg=PALETTE[code - 90 + 8])
+        elif 40 <= code <= 47:
+            style = style._replace(bg=PALETTE[code - 40])
+        elif 100 <= code <= 107:
+            style = style._replace(bg=PALETTE[code - 100 + 8])
+        elif code == 39:
+            style = style._replace(fg=None)
+        elif code == 49:
+            style = style._replace(bg=None)
+        elif code in (38, 48):
+            color, index = _extended_color(params, index)
+            if color is not None:
+                style = style._replace(**{"fg" if code == 38 else "bg": color})
+    return style
+
+
+def parse_params(text: str) -> List[int]:
+    """Numeric parameters of a CSI sequence; empty ones are 0"""
+    params = []
+    for part in text.lstrip("<=>?").replace(":", ";").split(";"):
+        try:
+            params.append(int(part) if part else 0)
+        except ValueError:
+            params.append(0)
+    return params
+
+
+# Token kinds produced by AnsiTokenizer
+TEXT = "text"
+CSI = "csi"
+ESC = "esc"
+
+# (TEXT, text, None), (CSI, parameter string, final character) or (ESC, sequence, None)
+Token = Tuple[str, str, Optional[str]]
+
+
+class AnsiTokenizer:
+    """
+    Splits a stream into text runs and escape sequences.
+    Each chunk is scanned once; a sequence split across chunks is held back
+    until the rest of it arrives, and malformed escapes are dropped.
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def reset(self) -> None:
+        self._pending = ""
+
+    def feed(self, text: str) -> List[Token]:
+        if self._pending:
+            text = self._pending + text
+            self._pending = ""
+
+        tokens: List[Token] = []
+        position = 0
+        while position < len(text):
+            escape = text.find("\x1b", position)
+            if escape < 0:
+                tokens.append((TEXT, text[position:], None))
+                break
+            if escape > position:
+                tokens.append((TEXT, text[position:escape], None))
+
+            match = _SEQUENCE.match(text, escape)
+            if match is None:
+                if (_INCOMPLETE.match(text, escape)
+                        and len(text) - escape < MAX_SEQUENCE_LENGTH):
+                    self._pending = text[escape:]
+                    break
+                # Not a sequence we understand; drop the escape character
+                position = escape + 1
+                continue
+
+            if match.group(2) is not None:
+                tokens.append((CSI, match.group(1), match.group(2)))
+            else:
+                tokens.append((ESC, match.group(0), None))
+            position = match.end()
+        return tokens
+
+
+class AnsiParser:
+    """
+    Streaming ANSI/VT100 parser for output shown as a log.
+    SGR sequences update the current style and every other sequence is
+    dropped. The style and any partial escape carry over between chunks,
+    so nothing is ever re-parsed.
+    """
+
+    def __init__(self):
+        self.style = DEFAULT_STYLE
+        self._tokenizer = AnsiTokenizer()
+
+    def reset(self) -> None:
+        self.style = DEFAULT_STYLE
+        self._tokenizer.reset()
+
+    def feed(self, text: str) -> List[Span]:
+        """Consume a chunk and return the styled spans it completes"""
+        spans: List[Span] = []
+        for kind, value, final in self._tokenizer.feed(text):
+            if kind == TEXT:
+                self._emit(spans, value)
+            elif kind == CSI and final == "m":
+                self.style = apply_sgr(self.style, parse_params(value))
+        return spans
+
+    def _emit(self, spans: List[Span], text: str) -> None:
+        if spans and spans[-1][1] == self.style:
+            spans[-1] = (spans[-1][0] + text, self.style)
+        else:
+            spans.append((text, self.style))
+
+
+def strip_ansi(text: str) -> str:
+    """Remove escape sequences from complete text"""
+    return _SEQUENCE.sub("", text)
+
+
+def _style_css(style: Style) -> str:
+    fg, bg = style.fg, style.bg
+    if style.inverse:
+        fg, bg = bg or "var(--background-color, #ffffff)", fg or "currentColor"
+    rules = []
+    if fg:
+        rules.append(f"color:{fg}")
+    if bg:
+        rules.append(f"background-color:{bg}")
+    if style.bold:
+        rules.append("font-weight:bold")
+    if style.dim:
+        rules.append("opacity:0.7")
+    if style.italic:
+        rules.append("font-style:italic")
+    if style.underline:
+        rules.append("text-decoration:underline")
+    return ";".join(rules)
+
+
+def spans_to_html(spans: List[Span]) -> str:
+    """Render spans as escaped HTML with inline styles"""
+    parts = []
+    for text, style in spans:
+        escaped = html.escape(text, quote=False)
+        if style == DEFAULT_STYLE:
+            parts.append(escaped)
+        else:
+            parts.append(f'<span style="{_style_css(style)}">{escaped}</span>')
+    return "".join(parts)
+
+
+def ansi_to_html(text: str) -> str:
+    """Render complete ANSI text as HTML in one go"""
+    return spans_to_html(AnsiParser().feed(text))
+
+
+class StyledOutput:
+    """
+    HTML rendering of a stream of ANSI output, built chunk by chunk.
+    Each appended chunk is parsed and rendered once; the rendered fragments
+    are self-contained, so the oldest are dropped whole once more than
+    max_bytes are held, matching OutputStore's in-memory bound.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._parser = AnsiParser()
+        self._fragments = deque()
+        self._size = 0
+        self._truncated = False
+        self._cached = None
+        self._lock = threading.Lock()
+
+    def append(self, text: str) -> None:
+        with self._lock:
+            fragment = spans_to_html(self._parser.feed(text))
+            if not fragment:
+                return
+            self._fragments.append(fragment)
+            self._size += len(fragment)
+            while self._size > self.max_bytes and len(self._fragments) > 1:
+                self._size -= len(self._fragments.popleft())
+                self._truncated = True
+            self._cached = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._parser.reset()
+            self._fragments.clear()
+            self._size = 0
+            self._truncated = False
+            self._cached = None
+
+    def getvalue(self) -> str:
+        """Return the rendered HTML (without an enclosing <pre>)"""
+        with self._lock:
+            if self._cached is None:
+                marker = "[... earlier output truncated ...]\n" if self._truncated else ""
+                self._cached = marker + "".join(self._fragments)
+            return self._cached
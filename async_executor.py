@@ -0,0 +1,412 @@
+import asyncio
+import codecs
+import errno
+import fcntl
+import os
+import pty
+import signal
+import struct
+import sys
+import termios
+import threading
+import time
+from queue import Queue
+from typing import AsyncIterator, Optional, Set, Tuple
+
+from command_executor import READ_BUFFER_SIZE, is_interactive_command
+from output_store import OutputStore
+from terminal_screen import TerminalScreen, DEFAULT_COLUMNS, DEFAULT_ROWS, SCREEN_SCROLLBACK_LINES
+
+# Marks the end of a session's event stream
+_END_OF_STREAM = object()
+
+
+class AsyncCommandSession:
+    """
+    A single command running on an asyncio event loop.
+    Output is recorded in an OutputStore and published as the same
+    ('output' | 'status' | 'error', data) events CommandExecutor queues.
+    """
+
+    def __init__(self, command: str, interactive: Optional[bool] = None):
+        self.command = command
+        self.interactive = is_interactive_command(command) if interactive is None else interactive
+        self.output = OutputStore(spill_to_disk=True)
+        # Screen model of PTY sessions, where output redraws rather than appends
+        self.screen = TerminalScreen() if self.interactive else None
+        self.returncode = None
+        self._process = None
+        self._master_fd = None
+        self._pty_decoder = None
+        self._events = asyncio.Queue()
+        self._start_time = None
+        self._end_time = None
+        self._readers = []
+
+    @property
+    def running(self) -> bool:
+        return self._start_time is not None and self._end_time is None
+
+    @property
+    def progress(self) -> float:
+        """Elapsed-time based progress, matching CommandExecutor"""
+        if self._start_time is None:
+            return 0.0
+        if self._end_time is not None:
+            return 1.0
+        return round(min(0.99, (time.time() - self._start_time) / 10.0), 2)
+
+    async def start(self) -> None:
+        """Spawn the process and begin streaming its output"""
+        self._start_time = time.time()
+        try:
+            if self.interactive:
+                await self._start_pty()
+            else:
+                self._process = await asyncio.create_subprocess_shell(
+                    self.command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True
+                )
+                self._readers = [
+                    asyncio.ensure_future(self._pump_pipe(self._process.stdout, "")),
+                    asyncio.ensure_future(self._pump_pipe(self._process.stderr, "ERROR: "))
+                ]
+        except Exception as e:
+            self._fail(f"Error executing command: {str(e)}")
+            return
+
+        asyncio.ensure_future(self._wait())
+
+    async def events(self) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Yield events until the command finishes.
+        Output events already waiting in the queue are merged into one.
+        Only one consumer should iterate a session's events.
+        """
+        pending = None
+        while True:
+            event = pending if pending is not None else await self._events.get()
+            pending = None
+            if event is _END_OF_STREAM:
+                return
+
+            if event[0] == 'output':
+                texts = [event[1]]
+                while not self._events.empty():
+                    following = self._events.get_nowait()
+                    if following is _END_OF_STREAM or following[0] != 'output':
+                        pending = following
+                        break
+                    texts.append(following[1])
+                event = ('output', "".join(texts))
+
+            yield event
+
+    def send_input(self, input_text: str) -> bool:
+        """Send input to an interactive session"""
+        if not self.interactive or self._master_fd is None:
+            return False
+
+        try:
+            if not input_text.endswith('\n'):
+                input_text += '\n'
+            # The PTY echoes the input onto the screen itself
+            self._emit_output(f">>> {input_text}", to_screen=False)
+            os.write(self._master_fd, input_text.encode())
+            return True
+        except OSError as e:
+            self._events.put_nowait(('error', f"Failed to send input: {str(e)}"))
+            return False
+
+    async def terminate(self, timeout: float = 0.1) -> None:
+        """Terminate the process, killing it if it does not exit within the timeout"""
+        if self._process is None or self._process.returncode is not None:
+            return
+        try:
+            self._signal(signal.SIGTERM)
+            await asyncio.wait_for(self._process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._signal(signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _signal(self, signum: int) -> None:
+        """Signal the process, or its whole process group for shell commands"""
+        if self.interactive:
+            self._process.send_signal(signum)
+        else:
+            # The shell's children share its session, so they are stopped too
+            os.killpg(self._process.pid, signum)
+
+    async def _start_pty(self) -> None:
+        master_fd, slave_fd = pty.openpty()
+        try:
+            term_size = struct.pack('HHHH', DEFAULT_ROWS, DEFAULT_COLUMNS, 0, 0)
+            fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, term_size)
+            flags = fcntl.fcntl(master_fd, fcntl.F_GETFL)
+            fcntl.fcntl(master_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+            self._process = await asyncio.create_subprocess_exec(
+                *self.command.split(),
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                env=os.environ.copy()
+            )
+        except Exception:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+
+        self._master_fd = master_fd
+        self._pty_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        asyncio.get_running_loop().add_reader(master_fd, self._read_pty)
+
+    def _read_pty(self) -> bool:
+        """
+        Loop reader callback for the PTY master.
+        Returns False once there is nothing left to read right now.
+        """
+        try:
+            data = os.read(self._master_fd, READ_BUFFER_SIZE)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            # EIO means the child side of the PTY has been closed
+            if e.errno != errno.EIO:
+                self._events.put_nowait(('error', f"Error reading output: {str(e)}"))
+            data = b''
+
+        if data:
+            text = self._pty_decoder.decode(data)
+        else:
+            text = self._pty_decoder.decode(b'', final=True)
+            self._close_pty()
+        if text:
+            self._emit_output(text)
+        return bool(data)
+
+    def _close_pty(self) -> None:
+        if self._master_fd is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._master_fd)
+        os.close(self._master_fd)
+        self._master_fd = None
+
+    async def _pump_pipe(self, stream: asyncio.StreamReader, prefix: str) -> None:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            data = await stream.read(READ_BUFFER_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                self._emit_output(prefix + text)
+            if not data:
+                return
+
+    async def _wait(self) -> None:
+        """Wait for the process to exit, then publish the final status"""
+        try:
+            self.returncode = await self._process.wait()
+            if self._readers:
+                await asyncio.gather(*self._readers)
+            if self._master_fd is not None:
+                # Pick up whatever the program wrote just before exiting
+                while self._master_fd is not None and self._read_pty():
+                    pass
+                self._close_pty()
+
+            self._end_time = time.time()
+            status_text = (
+                f"Command completed (Return code: {self.returncode})\n"
+                f"Execution time: {self._end_time - self._start_time:.2f} seconds"
+            )
+            self._events.put_nowait(('status', (self.returncode == 0, status_text)))
+            self._events.put_nowait(_END_OF_STREAM)
+        except Exception as e:
+            self._fail(f"Error executing command: {str(e)}")
+
+    def _emit_output(self, text: str, to_screen: bool = True) -> None:
+        self.output.append(text)
+        if to_screen and self.screen is not None:
+            self.screen.feed(text)
+        self._events.put_nowait(('output', text))
+
+    def _fail(self, error_msg: str) -> None:
+        self._end_time = time.time()
+        if self._master_fd is not None:
+            self._close_pty()
+        self.output.append(f"\n{error_msg}\n")
+        self._events.put_nowait(('error', error_msg))
+        self._events.put_nowait(_END_OF_STREAM)
+
+
+class AsyncCommandExecutor:
+    """Runs any number of commands concurrently on a single event loop"""
+
+    def __init__(self):
+        self._sessions: Set[AsyncCommandSession] = set()
+
+    @property
+    def sessions(self) -> Set[AsyncCommandSession]:
+        return set(self._sessions)
+
+    async def start(self, command: str, interactive: Optional[bool] = None) -> AsyncCommandSession:
+        """Start a command and return its session without waiting for it to finish"""
+        session = AsyncCommandSession(command, interactive)
+        self._sessions.add(session)
+        await session.start()
+        return session
+
+    async def run(self, command: str, interactive: Optional[bool] = None) -> AsyncIterator[Tuple[str, object]]:
+        """Start a command and yield its events until it finishes"""
+        session = await self.start(command, interactive)
+        try:
+            async for event in session.events():
+                yield event
+        finally:
+            self._sessions.discard(session)
+
+    def forget(self, session: AsyncCommandSession) -> None:
+        """Stop tracking a finished session"""
+        self._sessions.discard(session)
+
+    async def terminate_all(self) -> None:
+        await asyncio.gather(*(session.terminate() for session in self._sessions))
+
+
+def _pidfd_supported() -> bool:
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+def _attach_child_watcher(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Have the loop learn about exited children through pidfds.
+    Before Python 3.12 the default ThreadedChildWatcher starts a waitpid
+    thread for every child, which would bring back a thread per command.
+    Child watchers are process-wide there, so subprocesses must only be
+    started on this loop. From 3.12 on asyncio picks pidfds by itself.
+    """
+    if sys.version_info >= (3, 12):
+        return
+    if _pidfd_supported():
+        watcher = asyncio.PidfdChildWatcher()
+    else:
+        # Kernels before Linux 5.3 and other platforms: one thread per child
+        watcher = asyncio.ThreadedChildWatcher()
+    watcher.attach_loop(loop)
+    # Deprecated, and it replaces the watcher for the whole process: this is
+    # only safe while every subprocess in the process is started on the
+    # shared loop (AsyncCommandSession never uses any other loop). Code that
+    # spawns asyncio subprocesses on its own loop would break it.
+    asyncio.set_child_watcher(watcher)
+
+
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
+
+def get_shared_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop used by sync adapters, starting it on first use"""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            _attach_child_watcher(_shared_loop)
+            thread = threading.Thread(target=_shared_loop.run_forever, name="command-event-loop")
+            thread.daemon = True
+            thread.start()
+        return _shared_loop
+
+
+class SyncCommandExecutor:
+    """
+    CommandExecutor-compatible adapter over AsyncCommandExecutor.
+    Every adapter schedules its commands on one shared event loop thread,
+    so many sessions cost one thread in total rather than one each.
+    """
+
+    def __init__(self, executor: Optional[AsyncCommandExecutor] = None):
+        self._loop = get_shared_loop()
+        self._executor = executor or AsyncCommandExecutor()
+        self._session = None
+        self._is_running = False
+        self._output_queue = Queue()
+
+    def is_running(self):
+        return self._is_running
+
+    def is_interactive(self):
+        return self._is_running and self._session is not None and self._session.interactive
+
+    def get_progress(self):
+        return self._session.progress if self._session else 0.0
+
+    def get_output(self):
+        return self._session.output.getvalue() if self._session else ""
+
+    def get_return_code(self):
+        return self._session.returncode if self._session else None
+
+    def get_output_store(self):
+        return self._session.output if self._session else None
+
+    def get_screen_html(self):
+        if self._session is None or self._session.screen is None:
+            return None
+        return self._session.screen.render_html(SCREEN_SCROLLBACK_LINES)
+
+    def get_output_tail(self, max_bytes):
+        return self._session.output.tail(max_bytes) if self._session else ""
+
+    def get_output_range(self, start, end=None):
+        return self._session.output.read_range(start, end) if self._session else ""
+
+    def send_input(self, input_text):
+        """Send input to interactive process"""
+        if not self.is_interactive():
+            return False
+        return self._call(self._session.send_input, input_text)
+
+    def execute_command(self, command):
+        """Execute a command with real-time output"""
+        if self._is_running:
+            return False
+
+        self._is_running = True
+        # A fresh queue per run, so a stopped command's late messages can't
+        # leak into this one
+        self._output_queue = Queue()
+        self._session = AsyncCommandSession(command)
+        asyncio.run_coroutine_threadsafe(self._run(self._session), self._loop)
+        return True
+
+    def terminate_current_process(self):
+        """Terminate the currently running process"""
+        if self._is_running and self._session:
+            asyncio.run_coroutine_threadsafe(self._session.terminate(), self._loop).result()
+            self._is_running = False
+
+    async def _run(self, session):
+        """Forward a session's events to the thread-safe output queue"""
+        output_queue = self._output_queue
+        self._executor._sessions.add(session)
+        try:
+            await session.start()
+            async for event in session.events():
+                output_queue.put(event)
+        finally:
+            self._executor.forget(session)
+            if session is self._session:
+                self._is_running = False
+
+    def _call(self, func, *args):
+        """Run a plain function on the event loop thread and return its result"""
+        async def call():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self._loop).result()
@@ -0,0 +1,201 @@
+import os
+import shlex
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from nsds_commands import CommandStructure
+
+# Verbs whose output only reflects current state and can be reused
+READ_ONLY_VERBS = {"status", "list", "show"}
+
+# Verbs that change state; running one invalidates cached results
+MUTATING_VERBS = {
+    "add", "apply", "clean", "commit", "destroy", "disable", "edit", "enable",
+    "init", "load", "remove", "rename", "restart", "start", "stop", "update"
+}
+
+# Categories whose state also changes when another category is mutated
+RELATED_CATEGORIES = {
+    "cluster": ("node",),
+    "node": ("cluster",),
+}
+
+DEFAULT_TTL = 30.0
+
+# Per-command TTLs in seconds, matched on the longest command path prefix
+COMMAND_TTLS = {
+    "cluster status": 10.0,
+    "node status": 10.0,
+    "upgrade": 10.0,
+    "auth show": 60.0,
+    "config": 120.0,
+    "prereq": 300.0,
+}
+
+DEFAULT_MAX_ENTRIES = 128
+
+
+def normalize_command(command: str) -> str:
+    """Collapse quoting and whitespace differences between equivalent command lines"""
+    try:
+        parts = shlex.split(command)
+    except ValueError:
+        parts = command.split()
+    return " ".join(shlex.quote(part) for part in parts)
+
+
+class CachedResult:
+    """Output of a read-only command captured at a point in time"""
+
+    def __init__(self, command: str, output: str, success: bool, status_text: str, ttl: float):
+        self.command = command
+        self.output = output
+        self.success = success
+        self.status_text = status_text
+        self.cached_at = time.time()
+        self.expires_at = self.cached_at + ttl
+        self.category = None
+        self.parsed = None
+
+    def age(self) -> float:
+        return time.time() - self.cached_at
+
+    def age_label(self) -> str:
+        """Human readable marker such as 'cached 12s ago'"""
+        return f"cached {int(self.age())}s ago"
+
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+
+class ResultCache:
+    """
+    TTL + LRU cache for read-only nsds commands (status/list/show).
+    Commands are classified by walking the CommandStructure tree; running a
+    mutating command drops cached results in the same category.
+    Each category also has a generation that every invalidation bumps, so a
+    read that started before a mutating command cannot be cached after it.
+    """
+
+    def __init__(self, command_structure: Optional[CommandStructure] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.command_structure = command_structure or CommandStructure()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def classify(self, command: str) -> Optional[List[str]]:
+        """Return the nsds command path (e.g. ['cluster', 'status']) or None for other commands"""
+        try:
+            parts = shlex.split(command)
+        except ValueError:
+            return None
+        if len(parts) < 2 or os.path.basename(parts[0]) != "nsds":
+            return None
+        return self.command_structure.resolve_command(parts[1:])
+
+    def is_cacheable(self, command: str) -> bool:
+        path = self.classify(command)
+        return path is not None and path[-1] in READ_ONLY_VERBS
+
+    def is_mutating(self, command: str) -> bool:
+        path = self.classify(command)
+        return path is not None and path[-1] in MUTATING_VERBS
+
+    def ttl_for(self, path: List[str]) -> float:
+        """Return the TTL for the longest configured prefix of the command path"""
+        for length in range(len(path), 0, -1):
+            ttl = COMMAND_TTLS.get(" ".join(path[:length]))
+            if ttl is not None:
+                return ttl
+        return DEFAULT_TTL
+
+    def generation(self, command: str) -> Optional[int]:
+        """Return the current generation of the command's category, to pass to put once it finishes"""
+        path = self.classify(command)
+        if path is None:
+            return None
+        with self._lock:
+            return self._generations.get(path[0], 0)
+
+    def get(self, command: str) -> Optional[CachedResult]:
+        """Return a fresh cached result for the command, if any"""
+        key = normalize_command(command)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expired():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, command: str, output: str, success: bool, status_text: str = "",
+            parsed=None, generation: Optional[int] = None) -> bool:
+        """
+        Cache a successful read-only command's output; returns True if it was stored
+        parsed is the structured form of the output (see output_parser), kept alongside it
+        generation is the category's generation when the command started; the
+        output is not stored if the category was invalidated since
+        """
+        path = self.classify(command)
+        if not success or path is None or path[-1] not in READ_ONLY_VERBS:
+            return False
+
+        entry = CachedResult(command, output, success, status_text, self.ttl_for(path))
+        entry.category = path[0]
+        entry.parsed = parsed
+        key = normalize_command(command)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(entry.category, 0):
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def note_executed(self, command: str) -> int:
+        """
+        Invalidate results made stale by a command that is starting or has
+        just finished; reads running meanwhile are invalidated by both
+        Returns: Number of entries dropped
+        """
+        path = self.classify(command)
+        if path is None or path[-1] not in MUTATING_VERBS:
+            return 0
+        return self.invalidate_category(path[0])
+
+    def invalidate_category(self, category: str) -> int:
+        categories = {category, *RELATED_CATEGORIES.get(category, ())}
+        with self._lock:
+            for name in categories:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            stale = [key for key, entry in self._entries.items() if entry.category in categories]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def invalidate(self, command: str) -> None:
+        with self._lock:
+            self._entries.pop(normalize_command(command), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache shared by all sessions"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
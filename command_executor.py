@@ -4,21 +4,71 @@ import time
 import os
 import pty
 import select
+import selectors
+import codecs
 import fcntl
 import termios
 import struct
+import weakref
 from queue import Queue, Empty
 from datetime import datetime
+from output_store import OutputStore
+from ansi import StyledOutput
+from terminal_screen import TerminalScreen, DEFAULT_COLUMNS, DEFAULT_ROWS, SCREEN_SCROLLBACK_LINES
+from shell_session import PersistentShell, MAX_COMMAND_SIZE
+
+# Output chunks read within the same frame are merged into one queue message
+OUTPUT_FRAME_INTERVAL = 0.05
+
+# Size of the reusable buffer pipe output is read into
+READ_BUFFER_SIZE = 64 * 1024
+
+# Progress is published to a latest-value slot at most this often
+PROGRESS_INTERVAL = 0.25
+
+# Commands that are run behind a PTY so they can be driven interactively
+INTERACTIVE_COMMANDS = ['python', 'python3', 'ipython', 'node', 'mysql']
+
+def is_interactive_command(command):
+    """Return True if the command should run in an interactive PTY session"""
+    return any(cmd in command.split()[0] for cmd in INTERACTIVE_COMMANDS)
 
 class CommandExecutor:
-    def __init__(self):
+    def __init__(self, persistent_shell=False, single_flight=True):
         self._process = None
         self._is_running = False
         self._output_queue = Queue()
         self._interactive = False
         self._master_fd = None
         self._slave_fd = None
-        self._output_buffer = ""
+        self._output = OutputStore(spill_to_disk=True)
+        # Output rendered to HTML as it arrives, so colours never need re-parsing
+        self._styled = StyledOutput()
+        # Screen model of the current PTY session, None for plain commands
+        self._screen = None
+        self._pending_output = []
+        self._pending_lock = threading.Lock()
+        self._last_flush = 0.0
+        self._progress = 0.0
+        self._last_progress_update = 0.0
+        # Opt-in long-lived shell that keeps cwd/env between commands. It is
+        # also closed when the executor is garbage collected with its session
+        self._shell = PersistentShell() if persistent_shell else None
+        self._close_shell = weakref.finalize(self, self._shell.close) if self._shell else None
+        # Identical read-only commands already running elsewhere are shared
+        self._single_flight = single_flight
+        self._flight = None
+        self._flight_start_time = None
+        self._flight_loop = None
+        self._flush_due = False
+        self._return_code = None
+
+    def uses_persistent_shell(self):
+        return self._shell is not None
+
+    def get_working_directory(self):
+        """Return the directory commands currently run in"""
+        return self._shell.cwd if self._shell else os.getcwd()
 
     def is_running(self):
         return self._is_running
@@ -26,8 +76,36 @@ class CommandExecutor:
     def is_interactive(self):
         return self._interactive
 
+    def get_return_code(self):
+        """Return the exit code of the last finished command, or None"""
+        return self._return_code
+
+    def get_progress(self):
+        """Return the latest progress value between 0.0 and 1.0"""
+        return self._progress
+
     def get_output(self):
-        return self._output_buffer
+        return self._output.getvalue()
+
+    def get_output_store(self):
+        """Return the line-indexed store holding the current command's output"""
+        return self._output
+
+    def get_styled_output(self):
+        """Return the output as HTML with ANSI colours applied"""
+        return self._styled.getvalue()
+
+    def get_screen_html(self):
+        """Return the PTY session's recent scrollback and screen as HTML, or None"""
+        return self._screen.render_html(SCREEN_SCROLLBACK_LINES) if self._screen else None
+
+    def get_output_tail(self, max_bytes):
+        """Return the last max_bytes bytes of output"""
+        return self._output.tail(max_bytes)
+
+    def get_output_range(self, start, end=None):
+        """Return output between two byte offsets"""
+        return self._output.read_range(start, end)
 
     def send_input(self, input_text):
         """Send input to interactive process"""
@@ -38,8 +116,9 @@ class CommandExecutor:
             if not input_text.endswith('\n'):
                 input_text += '\n'
             input_display = f">>> {input_text}"
-            self._output_buffer += input_display
-            self._output_queue.put(('output', input_display))
+            # The PTY echoes the input onto the screen itself
+            self._queue_output(input_display, to_screen=False)
+            self._flush_output(force=True)
             os.write(self._master_fd, input_text.encode())
             return True
         except OSError as e:
@@ -53,18 +132,35 @@ class CommandExecutor:
             return False
 
         self._is_running = True
-        self._output_buffer = ""
+        # A fresh queue per run, so a stopped command's late messages can't
+        # leak into this one
+        output_queue = self._output_queue = Queue()
+        self._output.clear()
+        self._styled.clear()
+        self._return_code = None
+        self._set_progress(0.0, force=True)
+        with self._pending_lock:
+            self._pending_output = []
         start_time = time.time()
 
-        interactive_commands = ['python', 'python3', 'ipython', 'node', 'mysql']
-        self._interactive = any(cmd in command.split()[0] for cmd in interactive_commands)
+        self._interactive = is_interactive_command(command)
+        self._screen = TerminalScreen() if self._interactive else None
+
+        if not self._interactive and self._single_flight and self._join_flight(command):
+            return True
+
+        def on_poll():
+            self._flush_output()
+            elapsed = time.time() - start_time
+            self._set_progress(min(0.99, elapsed / 10.0))
 
         def run_command():
+            return_code = None
             try:
                 if self._interactive:
                     # Interactive mode with PTY
                     self._master_fd, self._slave_fd = pty.openpty()
-                    term_size = struct.pack('HHHH', 24, 80, 0, 0)
+                    term_size = struct.pack('HHHH', DEFAULT_ROWS, DEFAULT_COLUMNS, 0, 0)
                     fcntl.ioctl(self._slave_fd, termios.TIOCSWINSZ, term_size)
                     flags = fcntl.fcntl(self._master_fd, fcntl.F_GETFL)
                     fcntl.fcntl(self._master_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
@@ -82,20 +178,38 @@ class CommandExecutor:
 
                     time.sleep(0.1)  # Initial delay for startup
 
+                    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
                     while self._is_running and self._process.poll() is None:
                         r, _, _ = select.select([self._master_fd], [], [], 0.1)
                         if self._master_fd in r:
                             try:
-                                data = os.read(self._master_fd, 1024).decode(errors='replace')
+                                data = decoder.decode(os.read(self._master_fd, READ_BUFFER_SIZE))
                                 if data:
-                                    self._output_buffer += data
-                                    self._output_queue.put(('output', data))
+                                    self._queue_output(data)
                             except OSError as e:
                                 if e.errno != 11:  # EAGAIN
                                     break
 
+                        self._flush_output()
+
                         elapsed = time.time() - start_time
-                        self._output_queue.put(('progress', min(0.99, elapsed / 10.0)))
+                        self._set_progress(min(0.99, elapsed / 10.0))
+
+                    # Pick up whatever the program wrote just before exiting
+                    while self._is_running and self._master_fd is not None:
+                        try:
+                            data = os.read(self._master_fd, READ_BUFFER_SIZE)
+                        except OSError:
+                            data = b''
+                        text = decoder.decode(data, final=not data)
+                        if text:
+                            self._queue_output(text)
+                        if not data:
+                            break
+
+                elif self._shell is not None and len(command.encode()) <= MAX_COMMAND_SIZE:
+                    # Persistent shell mode
+                    return_code = self._shell.run(command, self._queue_output, on_poll=on_poll)
 
                 else:
                     # Non-interactive mode
@@ -104,42 +218,19 @@ class CommandExecutor:
                         shell=True,
                         stdout=subprocess.PIPE,
                         stderr=subprocess.PIPE,
-                        text=True,
-                        bufsize=1
+                        bufsize=0
                     )
+                    self._read_pipes(start_time)
 
-                    # Handle stdout and stderr in real-time
-                    while self._is_running and self._process.poll() is None:
-                        # Check stdout
-                        stdout_data = self._process.stdout.read1().decode(errors='replace')
-                        if stdout_data:
-                            self._output_buffer += stdout_data
-                            self._output_queue.put(('output', stdout_data))
-
-                        # Check stderr
-                        stderr_data = self._process.stderr.read1().decode(errors='replace')
-                        if stderr_data:
-                            error_text = f"ERROR: {stderr_data}"
-                            self._output_buffer += error_text
-                            self._output_queue.put(('output', error_text))
-
-                        # Update progress
-                        elapsed = time.time() - start_time
-                        self._output_queue.put(('progress', min(0.99, elapsed / 10.0)))
-                        time.sleep(0.05)  # Small delay to prevent CPU overuse
-
-                    # Get any remaining output
-                    remaining_out, remaining_err = self._process.communicate()
-                    if remaining_out:
-                        self._output_buffer += remaining_out
-                        self._output_queue.put(('output', remaining_out))
-                    if remaining_err:
-                        error_text = f"ERROR: {remaining_err}"
-                        self._output_buffer += error_text
-                        self._output_queue.put(('output', error_text))
+                    if self._is_running:
+                        self._process.wait()
+
+                self._flush_output(force=True)
 
                 # Send final status
-                return_code = self._process.poll() or 0
+                if return_code is None:
+                    return_code = self._process.poll() or 0
+                self._return_code = return_code
                 execution_time = time.time() - start_time
 
                 status_text = (
@@ -147,13 +238,14 @@ class CommandExecutor:
                     f"Command completed (Return code: {return_code})\n"
                     f"Execution time: {execution_time:.2f} seconds"
                 )
-                self._output_queue.put(('status', (return_code == 0, status_text)))
-                self._output_queue.put(('progress', 1.0))
+                output_queue.put(('status', (return_code == 0, status_text)))
+                self._set_progress(1.0, force=True)
 
             except Exception as e:
                 error_msg = f"Error executing command: {str(e)}"
-                self._output_buffer += f"\n{error_msg}\n"
-                self._output_queue.put(('error', error_msg))
+                self._flush_output(force=True)
+                self._append_output(f"\n{error_msg}\n")
+                output_queue.put(('error', error_msg))
             finally:
                 if not self._interactive:
                     self._cleanup()
@@ -164,10 +256,130 @@ class CommandExecutor:
         command_thread.start()
         return True
 
+    def _join_flight(self, command):
+        """Subscribe to a shared run of a read-only command; returns False if it is not shareable"""
+        # Imported here because single_flight builds on async_executor, which imports this module
+        from async_executor import get_shared_loop
+        from single_flight import get_single_flight
+
+        group = get_single_flight()
+        if not group.should_share(command):
+            return False
+        self._flight_start_time = time.time()
+        self._flight_loop = get_shared_loop()
+        self._flight = group.join(command, self._on_flight_event)
+        return True
+
+    def _on_flight_event(self, msg_type, data):
+        """Receive events from a shared command run"""
+        if msg_type == 'output':
+            self._queue_output(data)
+            elapsed = time.time() - self._flight_start_time
+            self._set_progress(min(0.99, elapsed / 10.0))
+            # Nothing polls a shared run between its events, so output held
+            # back by the frame limit needs a flush of its own
+            self._flush_later()
+            return
+
+        self._flush_output(force=True)
+        if msg_type == 'error':
+            self._append_output(f"\n{data}\n")
+        self._return_code = self._flight.session.returncode if self._flight else None
+        self._output_queue.put((msg_type, data))
+        self._set_progress(1.0, force=True)
+        self._flight = None
+        self._is_running = False
+
+    def _flush_later(self):
+        """Force a flush one frame from now on the shared loop, unless one is already due"""
+        with self._pending_lock:
+            if self._flush_due or not self._pending_output:
+                return
+            self._flush_due = True
+
+        def flush():
+            with self._pending_lock:
+                self._flush_due = False
+            self._flush_output(force=True)
+
+        self._flight_loop.call_soon_threadsafe(self._flight_loop.call_later, OUTPUT_FRAME_INTERVAL, flush)
+
+    def _read_pipes(self, start_time):
+        """Stream stdout and stderr, servicing whichever pipe is ready until both hit EOF"""
+        buffer = bytearray(READ_BUFFER_SIZE)
+        view = memoryview(buffer)
+
+        with selectors.DefaultSelector() as selector:
+            for pipe, prefix in ((self._process.stdout, ""), (self._process.stderr, "ERROR: ")):
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+                selector.register(pipe, selectors.EVENT_READ, (decoder, prefix))
+
+            while self._is_running and selector.get_map():
+                for key, _ in selector.select(timeout=0.1):
+                    decoder, prefix = key.data
+                    size = os.readv(key.fd, [buffer])
+                    if size:
+                        text = decoder.decode(view[:size])
+                    else:
+                        text = decoder.decode(b'', final=True)
+                        selector.unregister(key.fileobj)
+                    if text:
+                        self._queue_output(prefix + text)
+
+                self._flush_output()
+
+                elapsed = time.time() - start_time
+                self._set_progress(min(0.99, elapsed / 10.0))
+
+    def _append_output(self, text):
+        self._output.append(text)
+        self._styled.append(text)
+
+    def _queue_output(self, text, to_screen=True):
+        """Store output and hold it for the next coalesced queue message"""
+        self._append_output(text)
+        if to_screen and self._screen is not None:
+            self._screen.feed(text)
+        with self._pending_lock:
+            self._pending_output.append(text)
+        self._flush_output()
+
+    def _flush_output(self, force=False):
+        """Send pending output as a single message, at most once per frame unless forced"""
+        with self._pending_lock:
+            if not self._pending_output:
+                return
+            now = time.monotonic()
+            if not force and now - self._last_flush < OUTPUT_FRAME_INTERVAL:
+                return
+            text = "".join(self._pending_output)
+            self._pending_output = []
+            self._last_flush = now
+        self._output_queue.put(('output', text))
+
+    def _set_progress(self, value, force=False):
+        """Publish progress out-of-band, only when it changed and not more than once per interval"""
+        value = round(value, 2)
+        if value == self._progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress_update < PROGRESS_INTERVAL:
+            return
+        self._progress = value
+        self._last_progress_update = now
+
     def _cleanup(self):
         """Clean up resources"""
         self._is_running = False
 
+        if self._shell is not None and self._shell.busy:
+            self._shell.interrupt()
+
+        if self._flight is not None:
+            from single_flight import get_single_flight
+            get_single_flight().leave(self._flight, self._on_flight_event)
+            self._flight = None
+
         if self._master_fd:
             try:
                 os.close(self._master_fd)
@@ -197,4 +409,10 @@ class CommandExecutor:
     def terminate_current_process(self):
         """Terminate the currently running process"""
         if self._is_running:
-            self._cleanup()
\ No newline at end of file
+            self._cleanup()
+
+    def close(self):
+        """Stop any running command and the persistent shell, releasing its PTY"""
+        self.terminate_current_process()
+        if self._close_shell is not None:
+            self._close_shell()
\ No newline at end of file
@@ -0,0 +1,163 @@
+import bisect
+import heapq
+import re
+import threading
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+# (full path, "category" or "command", description)
+CommandRow = Tuple[str, str, str]
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+class _TokenIndex:
+    """Rows filed under tokens, with the tokens kept sorted for prefix lookups"""
+
+    def __init__(self):
+        self.rows: Dict[str, List[int]] = {}
+        self._sorted: List[str] = []
+
+    def add(self, token: str, row: int) -> None:
+        rows = self.rows.setdefault(token, [])
+        if not rows or rows[-1] != row:
+            rows.append(row)
+
+    def freeze(self) -> None:
+        self._sorted = sorted(self.rows)
+
+    def exact(self, token: str) -> List[int]:
+        return self.rows.get(token, [])
+
+    def prefixed(self, prefix: str) -> Set[int]:
+        """Rows with a token that starts with prefix (including prefix itself)"""
+        found: Set[int] = set()
+        start = bisect.bisect_left(self._sorted, prefix)
+        for token in self._sorted[start:]:
+            if not token.startswith(prefix):
+                break
+            found.update(self.rows[token])
+        return found
+
+
+class CommandIndex:
+    """
+    Search index over a command tree.
+    The tree is flattened once into rows of (path, type, description) with
+    their lowercased text. Every row is filed under the trigrams of its
+    text, so a query word of three or more characters only checks the rows
+    that contain all of its trigrams; shorter words are checked against
+    the rows left by the longer ones. Each query word must appear in the
+    path or description, and results are ranked by where the words match:
+    the command's own name first, then the rest of its path, then its
+    description. The tiers are looked up in inverted indexes of names,
+    path tokens and description tokens rather than row by row.
+    """
+
+    def __init__(self, tree: Mapping):
+        self.rows: List[CommandRow] = []
+        self._texts: List[str] = []
+        self._paths: List[str] = []
+        self._deprecated: List[bool] = []
+        self._names = _TokenIndex()
+        self._path_tokens = _TokenIndex()
+        self._description_tokens = _TokenIndex()
+        self._trigrams: Dict[str, List[int]] = {}
+
+        pending = [([category], data) for category, data in reversed(list(tree.items()))]
+        while pending:
+            path, data = pending.pop()
+            if isinstance(data, dict):
+                self._add_row(path, "category", data.get("title", ""))
+                subcommands = data.get("subcommands", {})
+                pending.extend((path + [name], child) for name, child in reversed(list(subcommands.items())))
+            else:
+                self._add_row(path, "command", data)
+        for tokens in (self._names, self._path_tokens, self._description_tokens):
+            tokens.freeze()
+
+    def _add_row(self, path: List[str], kind: str, description: str) -> None:
+        row = len(self.rows)
+        full_path = " ".join(path)
+        self.rows.append((full_path, kind, description))
+        path_text, description_text = full_path.lower(), description.lower()
+        text = f"{path_text}\n{description_text}"
+        self._texts.append(text)
+        self._paths.append(path_text)
+        self._deprecated.append(description == "(deprecated)")
+        self._names.add(path[-1].lower(), row)
+        for token in _TOKEN.findall(path_text):
+            self._path_tokens.add(token, row)
+        for token in _TOKEN.findall(description_text):
+            self._description_tokens.add(token, row)
+        for trigram in _trigrams(text):
+            self._trigrams.setdefault(trigram, []).append(row)
+
+    def _candidates(self, term: str, within: Optional[Set[int]]) -> Set[int]:
+        """Rows whose text contains term, optionally only among within"""
+        if len(term) >= 3:
+            postings = sorted((self._trigrams.get(trigram, ()) for trigram in _trigrams(term)), key=len)
+            rows = set(postings[0]) if within is None else within.intersection(postings[0])
+            for posting in postings[1:]:
+                if not rows:
+                    break
+                rows.intersection_update(posting)
+        else:
+            rows = set(range(len(self.rows))) if within is None else within
+        # Trigrams only show the pieces are there; check the whole term
+        return {row for row in rows if term in self._texts[row]}
+
+    def _term_ranks(self, term: str, rows: Set[int]) -> Dict[int, int]:
+        """
+        How well term matches each of rows, 0 (the command's name) to 7 (inside
+        a description word). Tiers are filled in worst first, so a row ends up
+        with the best tier it belongs to.
+        """
+        ranks = dict.fromkeys(rows, 7)
+        tiers = (
+            (6, self._description_tokens.prefixed(term)),
+            (5, self._description_tokens.exact(term)),
+            (4, {row for row in rows if term in self._paths[row]}),
+            (3, self._path_tokens.prefixed(term)),
+            (2, self._path_tokens.exact(term)),
+            (1, self._names.prefixed(term)),
+            (0, self._names.exact(term)),
+        )
+        for rank, matched in tiers:
+            ranks.update(dict.fromkeys(rows.intersection(matched), rank))
+        return ranks
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[CommandRow]:
+        """Rows matching every word of the query, best first"""
+        terms = query.lower().split()
+        if not terms:
+            return []
+        rows = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            rows = self._candidates(term, rows)
+            if not rows:
+                return []
+        term_ranks = [self._term_ranks(term, rows) for term in terms]
+
+        # Deprecated commands go last, then shallower paths come first
+        def rank(row: int) -> tuple:
+            return (self._deprecated[row], sum(ranks[row] for ranks in term_ranks),
+                    self._paths[row].count(" "), row)
+
+        ranked = sorted(rows, key=rank) if limit is None else heapq.nsmallest(limit, rows, key=rank)
+        return [self.rows[row] for row in ranked]
+
+
+_indexes: Dict[int, Tuple[Mapping, CommandIndex]] = {}
+_indexes_lock = threading.Lock()
+
+def get_command_index(tree: Mapping) -> CommandIndex:
+    """Return the index of a command tree, building it once per process"""
+    with _indexes_lock:
+        entry = _indexes.get(id(tree))
+        if entry is None or entry[0] is not tree:
+            entry = _indexes[id(tree)] = (tree, CommandIndex(tree))
+        return entry[1]
@@ -1,9 +1,33 @@
 import re
 import time
 from datetime import datetime
-from collections import Counter
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from itertools import islice
 from typing import List, Dict, Tuple, Optional, Set
 
+from next_command_model import NextCommandModel, SESSION_GAP
+from nsds_commands import CommandStructure
+from prefix_index import PrefixCursor, PrefixIndex
+
+# Most used commands loaded from the persistent history at startup
+PRELOADED_FREQUENT_COMMANDS = 200
+
+# Distinct commands from the persistent history offered as completions
+INDEXED_HISTORY_COMMANDS = 5000
+
+# History the next-command model is trained on at startup
+MODEL_TRAINING_WINDOW = 30 * 24 * 3600.0
+
+# Predicted next commands less likely than this are not suggested
+MIN_PREDICTION_PROBABILITY = 0.05
+
+# Distinct commands whose context classification is remembered
+CONTEXT_CACHE_SIZE = 4096
+
+# Recent inputs whose suggestions a SuggestionSession keeps
+SESSION_CACHED_PREFIXES = 64
+
 class CommandSuggestionEngine:
     """
     Enhanced Contextual Command Suggestion Engine for NSDS Terminal
@@ -11,20 +35,18 @@ class CommandSuggestionEngine:
     usage patterns, and contextual relationships between commands.
     """
     
-    def __init__(self, command_data=None):
-        # Base command categories and common commands for suggestions
+    def __init__(self, command_data=None, history_store=None, command_structure=None):
+        self.command_structure = command_structure or CommandStructure()
+
+        # Base command categories and common commands for suggestions; the
+        # nsds categories come from the shared command tree
         self.base_commands = {
             "nsds": {
                 "description": "NSDS Command Line Interface",
                 "subcommands": {
-                    "auth": ["show", "clean", "commit", "edit", "init"], 
-                    "cluster": ["status", "init", "destroy", "rename", "restart", "start", "stop"],
-                    "config": ["cluster", "docker", "file", "nfs", "node", "smb", "upgrade"],
-                    "export": ["nfs", "smb"],
-                    "filesystem": ["add", "list", "remove"],
-                    "node": ["status", "add", "remove", "rename", "restart", "start", "stop"],
-                    "prereq": ["check", "list", "show"],
-                    "diag": ["collect"]
+                    category: list(data.get("subcommands", {}))
+                    for category, data in self.command_structure.commands.items()
+                    if data.get("title") != "(deprecated)"
                 }
             },
             "system": {
@@ -40,15 +62,13 @@ class CommandSuggestionEngine:
             self.command_data = self.base_commands
             
         # Enhanced command context tracking
-        self.command_history = []
-        self.command_timestamps = []  # For time-based context analysis
         self.max_history = 50
+        self.command_history = deque(maxlen=self.max_history)
+        self.command_timestamps = deque(maxlen=self.max_history)  # For time-based context analysis
         self.command_frequency = Counter()  # Track command usage frequency
         self.last_context = None  # Last command context
         self.current_working_directory = "~"  # Track working directory for context
-        
-        # Command sequence patterns - what commands frequently follow others
-        self.sequence_patterns = {}
+        self.history_version = 0  # Bumped on every add_to_history, for SuggestionSession
         
         # Common command patterns for detection
         self.patterns = {
@@ -69,7 +89,105 @@ class CommandSuggestionEngine:
             "nsds_config": {"nsds config nfs", "nsds config smb", "nsds config cluster"},
             "nsds_export": {"nsds export nfs", "nsds export smb"}
         }
-        
+
+        # command_contexts and patterns compiled into one classifier (see
+        # _compile_context_classifier), with results remembered per command;
+        # context_counts tracks the contexts of the commands in command_history
+        self._context_classifier = self._compile_context_classifier()
+        self._classify_command = lru_cache(maxsize=CONTEXT_CACHE_SIZE)(self._match_context)
+        self.context_counts = Counter()
+
+        # Prefix indexes answering completions without scanning: one over every
+        # nsds command path and the system commands, one over history
+        self.completion_index = self._build_completion_index()
+        self.history_index = PrefixIndex(recency_first=True)
+
+        # Model of which commands follow which, for suggestions on empty input
+        self.next_command_model = NextCommandModel(command_structure=self.command_structure)
+
+        # Optional persistent history (see history_store); recent commands and
+        # the most used ones are loaded from it instead of starting empty
+        self.history_store = history_store
+        if history_store is not None:
+            self._load_history()
+
+    def _build_completion_index(self) -> PrefixIndex:
+        """
+        Index the system commands and every nsds command path, shallowest first.
+        A path can also be completed from any of its trailing words, so
+        "show" and "nfs list" find "nsds auth show" and "nsds config nfs list".
+        """
+        index = PrefixIndex()
+        for cmd in self.base_commands["system"]["commands"]:
+            index.add(cmd, f"System command: {cmd}")
+
+        level = [([category], data) for category, data in self.command_structure.commands.items()]
+        while level:
+            next_level = []
+            for path, data in level:
+                if isinstance(data, dict):
+                    description = data.get("title", "")
+                    next_level.extend(
+                        (path + [name], child) for name, child in data.get("subcommands", {}).items()
+                    )
+                else:
+                    description = data
+                if description == "(deprecated)":
+                    continue
+                index.add(
+                    "nsds " + " ".join(path),
+                    description,
+                    keys=[" ".join(path[start:]) for start in range(len(path))]
+                )
+            level = next_level
+
+        return index
+
+    def _load_history(self) -> None:
+        """Seed the in-memory history, frequencies, indexes and next-command model from the persistent store"""
+        for cmd, uses, last_used in self.history_store.search_prefix("", limit=INDEXED_HISTORY_COMMANDS):
+            self.history_index.add(cmd, "From history")
+            self.history_index.record_use(cmd, uses, last_used)
+            self.completion_index.record_use(cmd, uses, last_used)
+        self.next_command_model.train(
+            self.history_store.iter_entries(since=time.time() - MODEL_TRAINING_WINDOW)
+        )
+        for entry in reversed(self.history_store.recent(self.max_history)):
+            self.last_context = self._remember(entry.command, entry.started_at)
+        self.command_frequency.update(dict(self.history_store.frequent(PRELOADED_FREQUENT_COMMANDS)))
+
+    def _remember(self, command: str, timestamp: float) -> Optional[str]:
+        """
+        Append a command to the bounded in-memory history, keeping the
+        context counts in step with it. Returns the command's context.
+        """
+        if len(self.command_history) == self.max_history:
+            evicted = self._determine_command_context(self.command_history[0])
+            if evicted:
+                self.context_counts[evicted] -= 1
+                if not self.context_counts[evicted]:
+                    del self.context_counts[evicted]
+        self.command_history.append(command)
+        self.command_timestamps.append((command, timestamp))
+        context = self._determine_command_context(command)
+        if context:
+            self.context_counts[context] += 1
+        return context
+        
+    def _current_session(self, now: float) -> List[str]:
+        """
+        The latest commands the next-command model looks at, oldest first,
+        cut at the last gap longer than SESSION_GAP as when the model is trained
+        """
+        session = []
+        later = now
+        for command, timestamp in islice(reversed(self.command_timestamps), self.next_command_model.order - 1):
+            if later - timestamp > SESSION_GAP:
+                break
+            session.append(command)
+            later = timestamp
+        return session[::-1]
+
     def add_to_history(self, command: str) -> None:
         """
         Add command to history with enhanced context tracking
@@ -78,25 +196,23 @@ class CommandSuggestionEngine:
         if command and command.strip():
             command = command.strip()
             
-            # Add to basic history
-            self.command_history.append(command)
-            if len(self.command_history) > self.max_history:
-                self.command_history.pop(0)
+            # Add to basic history (bounded deque, oldest entries fall off)
+            # with a timestamp for time-based analysis, and its context
+            now = time.time()
+            previous = self._current_session(now)
+            self.last_context = self._remember(command, now)
                 
             # Add to command frequency tracker
             self.command_frequency[command] += 1
-            
-            # Add timestamp for time-based analysis
-            self.command_timestamps.append((command, time.time()))
-            if len(self.command_timestamps) > self.max_history:
-                self.command_timestamps.pop(0)
-                
-            # Update command sequence patterns if we have previous commands
-            if len(self.command_history) > 1:
-                prev_cmd = self.command_history[-2]
-                if prev_cmd not in self.sequence_patterns:
-                    self.sequence_patterns[prev_cmd] = Counter()
-                self.sequence_patterns[prev_cmd][command] += 1
+
+            # Keep the completion indexes' rankings current
+            self.history_index.add(command, "From history")
+            self.history_index.record_use(command, when=now)
+            self.completion_index.record_use(command, when=now)
+
+            # Learn what this command followed
+            self.next_command_model.observe(previous, command, now)
+            self.history_version += 1
                 
             # Track directory changes for context
             if command.startswith('cd '):
@@ -117,9 +233,6 @@ class CommandSuggestionEngine:
                             self.current_working_directory += '/' + new_dir
                 except:
                     pass  # Ignore errors in directory tracking
-                    
-            # Determine the command context category
-            self.last_context = self._determine_command_context(command)
     
     def get_suggestions(self, current_input: str, max_suggestions: int = 5) -> List[Dict[str, str]]:
         """
@@ -128,20 +241,17 @@ class CommandSuggestionEngine:
         """
         if not current_input or current_input.isspace():
             return self._get_recent_suggestions(max_suggestions)
-        
-        suggestions = []
-        
-        # First priority: direct command completion
-        direct_matches = self._get_direct_completion_suggestions(current_input)
-        suggestions.extend(direct_matches)
-        
-        # Second priority: contextual based on command patterns
-        context_matches = self._get_contextual_suggestions(current_input)
-        suggestions.extend(context_matches)
-        
-        # Third priority: history-based suggestions
-        history_matches = self._get_history_suggestions(current_input)
-        suggestions.extend(history_matches)
+        return self._merge_suggestions(
+            self._get_direct_completion_suggestions(current_input),
+            self._get_contextual_suggestions(current_input),
+            self._get_history_suggestions(current_input),
+            max_suggestions
+        )
+
+    def _merge_suggestions(self, direct_matches: List[Dict[str, str]], context_matches: List[Dict[str, str]],
+                           history_matches: List[Dict[str, str]], max_suggestions: int) -> List[Dict[str, str]]:
+        """Combine direct completions, contextual and history suggestions, in that priority"""
+        suggestions = direct_matches + context_matches + history_matches
         
         # Deduplicate while preserving order
         unique_suggestions = []
@@ -156,87 +266,16 @@ class CommandSuggestionEngine:
         
         return unique_suggestions
     
-    def _get_direct_completion_suggestions(self, current_input: str) -> List[Dict[str, str]]:
-        """Get suggestions by direct completion of the current command"""
-        suggestions = []
-        
-        # Check for NSDS command completions
-        if current_input.startswith("nsds"):
-            parts = current_input.split()
-            if len(parts) == 1:
-                # Just "nsds" - suggest main categories
-                for category in self.base_commands["nsds"]["subcommands"]:
-                    suggestions.append({
-                        "command": f"nsds {category}",
-                        "description": f"NSDS {category} commands"
-                    })
-            elif len(parts) == 2:
-                # "nsds category" - suggest subcommands for category
-                category = parts[1]
-                if category in self.base_commands["nsds"]["subcommands"]:
-                    for subcmd in self.base_commands["nsds"]["subcommands"][category]:
-                        suggestions.append({
-                            "command": f"nsds {category} {subcmd}",
-                            "description": f"NSDS {category} {subcmd} command"
-                        })
-            elif len(parts) >= 3:
-                # Handle deeper completion like "nsds config nfs"
-                category = parts[1]
-                subcategory = parts[2]
-                if category == "config" and subcategory in ["nfs", "smb"]:
-                    for action in ["enable", "disable", "list", "update"]:
-                        suggestions.append({
-                            "command": f"nsds config {subcategory} {action}",
-                            "description": f"{action.capitalize()} {subcategory.upper()} service"
-                        })
-                elif category == "export" and subcategory in ["nfs", "smb"]:
-                    for action in ["add", "list", "show", "remove", "update"]:
-                        suggestions.append({
-                            "command": f"nsds export {subcategory} {action}",
-                            "description": f"{action.capitalize()} {subcategory.upper()} export"
-                        })
-        # Check for NSDS subcommands without nsds prefix
-        elif current_input in self.base_commands["nsds"]["subcommands"]:
-            # Direct match for a main NSDS category, suggest the full NSDS command
-            category = current_input
-            suggestions.append({
-                "command": f"nsds {category}",
-                "description": f"NSDS {category} commands"
-            })
-            # Also suggest specific subcommands for this category
-            for subcmd in self.base_commands["nsds"]["subcommands"][category]:
-                suggestions.append({
-                    "command": f"nsds {category} {subcmd}",
-                    "description": f"NSDS {category} {subcmd} command"
-                })
-        elif any(category.startswith(current_input) for category in self.base_commands["nsds"]["subcommands"]):
-            # Partial match for a main NSDS category
-            for category in self.base_commands["nsds"]["subcommands"]:
-                if category.startswith(current_input):
-                    suggestions.append({
-                        "command": f"nsds {category}",
-                        "description": f"NSDS {category} commands"
-                    })
-        else:
-            # Check if the input might be a subcommand (like "show" or "list")
-            for category, subcommands in self.base_commands["nsds"]["subcommands"].items():
-                if any(subcmd == current_input or subcmd.startswith(current_input) for subcmd in subcommands):
-                    matching_subcommands = [subcmd for subcmd in subcommands if subcmd.startswith(current_input)]
-                    for subcmd in matching_subcommands:
-                        suggestions.append({
-                            "command": f"nsds {category} {subcmd}",
-                            "description": f"NSDS {category} {subcmd} command"
-                        })
-        
-        # Always check for system command completions
-        for cmd in self.base_commands["system"]["commands"]:
-            if cmd.startswith(current_input):
-                suggestions.append({
-                    "command": cmd,
-                    "description": f"System command: {cmd}"
-                })
-        
-        return suggestions
+    def _get_direct_completion_suggestions(self, current_input: str,
+                                           cursor: Optional[PrefixCursor] = None) -> List[Dict[str, str]]:
+        """Get suggestions by direct completion of the current command (at cursor when given)"""
+        if cursor is None:
+            cursor = self.completion_index.find(current_input)
+        return [
+            {"command": command, "description": description}
+            for command, description in self.completion_index.complete_at(cursor)
+            if command != current_input
+        ]
     
     def _get_contextual_suggestions(self, current_input: str) -> List[Dict[str, str]]:
         """Get contextually relevant suggestions based on command patterns"""
@@ -316,19 +355,16 @@ class CommandSuggestionEngine:
         
         return suggestions
     
-    def _get_history_suggestions(self, current_input: str) -> List[Dict[str, str]]:
-        """Get suggestions based on command history"""
-        suggestions = []
-        
-        # Match against history for similar commands
-        for cmd in reversed(self.command_history):
-            if cmd.startswith(current_input) and cmd != current_input:
-                suggestions.append({
-                    "command": cmd,
-                    "description": "From history"
-                })
-        
-        return suggestions
+    def _get_history_suggestions(self, current_input: str,
+                                 cursor: Optional[PrefixCursor] = None) -> List[Dict[str, str]]:
+        """Get suggestions based on command history, most recently used first (at cursor when given)"""
+        if cursor is None:
+            cursor = self.history_index.find(current_input)
+        return [
+            {"command": command, "description": description}
+            for command, description in self.history_index.complete_at(cursor)
+            if command != current_input
+        ]
     
     def _get_recent_suggestions(self, max_count: int) -> List[Dict[str, str]]:
         """
@@ -336,6 +372,15 @@ class CommandSuggestionEngine:
         recent commands, command frequency, and contextual patterns
         """
         suggestions = []
+
+        # Most likely next commands given the last few
+        for cmd, probability in self.next_command_model.predict(self._current_session(time.time()),
+                                                                limit=max_count):
+            if probability >= MIN_PREDICTION_PROBABILITY:
+                suggestions.append({
+                    "command": cmd,
+                    "description": f"Suggested next command ({probability:.0%})"
+                })
         
         # Get contextual suggestions based on the last command
         if self.command_history:
@@ -352,7 +397,7 @@ class CommandSuggestionEngine:
         
         # Add recent history if not already included
         recent_history_set = {sugg["command"] for sugg in suggestions}
-        for cmd in reversed(self.command_history[-5:]):
+        for cmd in islice(reversed(self.command_history), 5):
             if cmd not in recent_history_set:
                 suggestions.append({
                     "command": cmd,
@@ -379,43 +424,48 @@ class CommandSuggestionEngine:
             if cmd["command"] not in fallback_set:
                 suggestions.append(cmd)
         
-        return suggestions[:max_count]
+        # Predictions and the other sources can name the same command
+        unique_suggestions = []
+        seen_commands = set()
+        for suggestion in suggestions:
+            if suggestion["command"] not in seen_commands:
+                seen_commands.add(suggestion["command"])
+                unique_suggestions.append(suggestion)
+        return unique_suggestions[:max_count]
         
+    def _compile_context_classifier(self) -> re.Pattern:
+        """
+        Combine command_contexts and patterns into one anchored alternation.
+        Each context or pattern becomes a named group, in the order they are
+        checked, and the regex engine tries alternatives left to right, so
+        the first group to match is the one the separate checks would pick.
+        """
+        alternatives = []
+        for context, commands in self.command_contexts.items():
+            literals = "|".join(re.escape(cmd) for cmd in sorted(commands, key=len, reverse=True))
+            alternatives.append(f"(?P<{context}>{literals})")
+        for pattern_name, pattern in self.patterns.items():
+            alternatives.append(f"(?P<{pattern_name}>{pattern.pattern.lstrip('^')})")
+        return re.compile("|".join(alternatives))
+
+    def _match_context(self, command: str) -> Optional[str]:
+        match = self._context_classifier.match(command)
+        return match.lastgroup if match else None
+
     def _determine_command_context(self, command: str) -> Optional[str]:
         """
         Determine the context category of a command
         Returns the context name or None if no specific context is found
         """
-        # Check each context type
-        for context, commands in self.command_contexts.items():
-            for cmd_pattern in commands:
-                if command.startswith(cmd_pattern):
-                    return context
-        
-        # Check using regex patterns
-        for pattern_name, pattern in self.patterns.items():
-            if pattern.match(command):
-                return pattern_name
-                
-        return None
+        return self._classify_command(command)
         
     def _get_next_command_suggestions(self, last_command: str) -> List[Dict[str, str]]:
         """
         Get suggestions for commands that typically follow the last executed command
-        based on historical command sequences and command context
+        based on its context (learned sequences come from next_command_model)
         """
         suggestions = []
         
-        # Check sequence patterns for direct follow-up commands
-        if last_command in self.sequence_patterns:
-            # Get the most common next commands for this command
-            next_commands = self.sequence_patterns[last_command]
-            for cmd, count in next_commands.most_common(2):
-                suggestions.append({
-                    "command": cmd,
-                    "description": "Suggested next command"
-                })
-        
         # Add context-specific suggestions
         context = self._determine_command_context(last_command)
         
@@ -452,19 +502,68 @@ class CommandSuggestionEngine:
         Get statistics about command usage for display
         """
         stats = {
-            "total_commands": len(self.command_history),
+            "total_commands": self.history_store.count() if self.history_store else len(self.command_history),
             "unique_commands": len(self.command_frequency),
             "most_used": self.command_frequency.most_common(5),
             "contexts": {}
         }
         
-        # Count commands by context
-        context_counts = Counter()
-        for cmd in self.command_history:
-            context = self._determine_command_context(cmd)
-            if context:
-                context_counts[context] += 1
-        
-        stats["contexts"] = dict(context_counts)
+        # Commands by context, counted as they enter and leave the history
+        stats["contexts"] = dict(self.context_counts)
         
-        return stats
\ No newline at end of file
+        return stats
+
+
+class SuggestionSession:
+    """
+    Suggestions for one input box, updated keystroke by keystroke.
+    Each input's suggestions are kept in a small LRU, so returning to an
+    earlier input (backspace, or a rerun with unchanged input) is a lookup.
+    When the input extends the previous one, the completion and history
+    lookups carry on from where the previous input's trie cursors stopped
+    instead of starting again at the root; any other edit searches afresh.
+    Everything is dropped once the engine records a new command, since
+    that changes the rankings.
+    """
+
+    def __init__(self, engine: CommandSuggestionEngine, max_prefixes: int = SESSION_CACHED_PREFIXES):
+        self.engine = engine
+        self.max_prefixes = max_prefixes
+        self._results = OrderedDict()  # (input, max_suggestions) -> suggestions
+        self._cursors = None           # (completion cursor, history cursor) of the last input
+        self._version = engine.history_version
+
+    def suggest(self, current_input: str, max_suggestions: int = 5) -> List[Dict[str, str]]:
+        engine = self.engine
+        if engine.history_version != self._version:
+            self._results.clear()
+            self._cursors = None
+            self._version = engine.history_version
+        if not current_input or current_input.isspace():
+            return engine.get_suggestions(current_input, max_suggestions)
+
+        key = (current_input, max_suggestions)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return list(self._results[key])
+
+        if self._cursors is not None and current_input.startswith(self._cursors[0].prefix):
+            # Typed further: narrow the previous input's candidates
+            added = current_input[len(self._cursors[0].prefix):]
+            cursors = (engine.completion_index.extend(self._cursors[0], added),
+                       engine.history_index.extend(self._cursors[1], added))
+        else:
+            cursors = (engine.completion_index.find(current_input),
+                       engine.history_index.find(current_input))
+        self._cursors = cursors
+
+        suggestions = engine._merge_suggestions(
+            engine._get_direct_completion_suggestions(current_input, cursors[0]),
+            engine._get_contextual_suggestions(current_input),
+            engine._get_history_suggestions(current_input, cursors[1]),
+            max_suggestions
+        )
+        self._results[key] = suggestions
+        if len(self._results) > self.max_prefixes:
+            self._results.popitem(last=False)
+        return list(suggestions)
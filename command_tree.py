@@ -0,0 +1,145 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from typing import Mapping, Optional
+
+from ansi import strip_ansi
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "CLI2GUI_TREE_CACHE", os.path.join(os.path.expanduser("~"), ".cli2gui", "command_tree.json")
+)
+
+# Seconds to wait for `nsds -t` or `nsds --version`
+NSDS_TIMEOUT = 10.0
+
+# "name -> description", after the tree drawing: four columns per ancestor
+# ("│   " or "    ") and a branch ("├── " or "└── ") for nested entries
+_TREE_LINE = re.compile(r"^(?P<indent>(?:[│ ]   )*)(?P<branch>[├└]── )?(?P<name>\S+) -> (?P<description>.*)$")
+
+
+class FrozenDict(dict):
+    """A dict that refuses changes, so a tree shared between modules stays intact"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("the command tree is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+def freeze(tree):
+    """Recursively copy a command tree into FrozenDicts"""
+    if isinstance(tree, dict):
+        return FrozenDict((key, freeze(value)) for key, value in tree.items())
+    return tree
+
+
+def parse_tree(output: str) -> dict:
+    """
+    Parse `nsds -t` output into the nested form CommandStructure uses:
+    categories are {"title": ..., "subcommands": {...}}, nested groups are
+    the same, and leaf commands map to their description.
+    """
+    root = {"subcommands": {}}
+    stack = [root]  # stack[depth] is the node entries at depth + 1 are added to
+    for line in strip_ansi(output).splitlines():
+        match = _TREE_LINE.match(line.rstrip())
+        if not match:
+            continue
+        depth = len(match.group("indent")) // 4 + 1 if match.group("branch") else 0
+        if depth >= len(stack):
+            # Deeper than the entry above it allows; not a tree we understand
+            continue
+        del stack[depth + 1:]
+        node = {"title": match.group("description").strip()}
+        stack[depth].setdefault("subcommands", {})[match.group("name")] = node
+        stack.append(node)
+
+    def finish(node: dict, top_level: bool):
+        children = node.get("subcommands")
+        if not children:
+            return node if top_level else node["title"]
+        return {"title": node["title"],
+                "subcommands": {name: finish(child, False) for name, child in children.items()}}
+
+    return {name: finish(node, True) for name, node in root["subcommands"].items()}
+
+
+def _run(executable: str, *args: str) -> str:
+    try:
+        result = subprocess.run(
+            [executable, *args], stdin=subprocess.DEVNULL, capture_output=True,
+            text=True, timeout=NSDS_TIMEOUT
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return result.stdout if result.returncode == 0 else ""
+
+
+def _read_cache(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(path: str, key: dict, tree: dict) -> None:
+    """Write the cache through a temporary file so readers never see half of it"""
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "tree": tree}, f)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+
+
+def load_command_tree(fallback: Mapping, executable: Optional[str] = None,
+                      cache_path: str = DEFAULT_CACHE_PATH) -> FrozenDict:
+    """
+    Load the command tree of the nsds executable on PATH (or executable).
+    The parsed tree is cached on disk keyed on the executable's path,
+    modification time, size and reported version, so `nsds -t` only runs
+    again after nsds changes. Falls back to the given tree when nsds is
+    missing or its output cannot be parsed.
+    """
+    executable = executable or shutil.which("nsds")
+    if executable is None:
+        return freeze(fallback)
+    try:
+        stat = os.stat(executable)
+    except OSError:
+        return freeze(fallback)
+
+    key = {
+        "path": os.path.realpath(executable),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "version": _run(executable, "--version").strip(),
+    }
+    cached = _read_cache(cache_path)
+    if cached and cached.get("key") == key and cached.get("tree"):
+        return freeze(cached["tree"])
+
+    tree = parse_tree(_run(executable, "-t"))
+    if not tree:
+        return freeze(fallback)
+    _write_cache(cache_path, key, tree)
+    return freeze(tree)
+
+
+_command_tree = None
+_command_tree_lock = threading.Lock()
+
+def get_command_tree(fallback: Mapping) -> FrozenDict:
+    """Return the process-wide command tree, loading it on first use"""
+    global _command_tree
+    with _command_tree_lock:
+        if _command_tree is None:
+            _command_tree = load_command_tree(fallback)
+        return _command_tree
@@ -1,7 +1,72 @@
+import os
+import shlex
 import shutil
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from nsds_commands import CommandStructure
+
+# Largest edit distance accepted for a correction
+DEFAULT_MAX_DISTANCE = 2
+
+# Corrections offered for an unknown command
+DEFAULT_MAX_SUGGESTIONS = 3
+
+
+def _deletions(word: str, count: int) -> Set[str]:
+    """The word and every string made by deleting up to count of its characters"""
+    found = {word}
+    frontier = {word}
+    for _ in range(count):
+        frontier = {text[:index] + text[index + 1:] for text in frontier for index in range(len(text))}
+        found |= frontier
+    return found
+
+
+class DeletionIndex:
+    """
+    Words within a bounded edit distance of a query.
+    Every word is filed under each string obtained by deleting up to
+    max_distance of its characters. Two words within that distance always
+    share such a string, so a query only looks up its own deletions and
+    measures the distance to the handful of words filed there, instead of
+    comparing itself with the whole vocabulary.
+    """
+
+    def __init__(self, distance: Callable[..., int], max_distance: int = DEFAULT_MAX_DISTANCE):
+        self._distance = distance
+        self.max_distance = max_distance
+        self._words: Set[str] = set()
+        self._index: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, word: str) -> None:
+        if word in self._words:
+            return
+        self._words.add(word)
+        for key in _deletions(word, self.max_distance):
+            self._index.setdefault(key, []).append(word)
+
+    def search(self, word: str, max_distance: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Words within max_distance of word as (distance, word), closest first"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        candidates = set()
+        for key in _deletions(word, max_distance):
+            candidates.update(self._index.get(key, ()))
+        matches = []
+        for candidate in candidates:
+            distance = self._distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        matches.sort()
+        return matches
+
 
 class CommandValidator:
-    def __init__(self):
+    def __init__(self, command_structure: Optional[CommandStructure] = None):
         # Basic list of common commands
         self._common_commands = {
             'ls': 'List directory contents',
@@ -10,6 +75,11 @@ class CommandValidator:
             'python': 'Python interpreter',
             'pip': 'Python package manager',
         }
+        self.command_structure = command_structure or CommandStructure()
+
+        # Fuzzy index of command names for "did you mean", built on first use
+        self._executables: Optional[DeletionIndex] = None
+        self._index_lock = threading.Lock()
 
     def validate_command(self, command: str) -> tuple[bool, str]:
         """Simple command validation"""
@@ -21,14 +91,127 @@ class CommandValidator:
 
         # Check if command exists
         if base_command in self._common_commands or shutil.which(base_command):
+            if base_command == "nsds" and self._unknown_nsds_word(command):
+                return False, "Unknown nsds command" + self._did_you_mean(command)
             return True, "Valid command"
 
-        return False, f"Command '{base_command}' not found"
+        return False, f"Command '{base_command}' not found" + self._did_you_mean(command)
+
+    def suggest_corrections(self, command: str, max_distance: int = DEFAULT_MAX_DISTANCE,
+                            limit: int = DEFAULT_MAX_SUGGESTIONS) -> List[str]:
+        """
+        Close matches for a mistyped command, best first.
+        The command name is matched against the executables on PATH, and
+        each subcommand word of an nsds command against the subcommands
+        the command tree allows at that point; arguments after a leaf
+        command are kept as typed.
+        """
+        words = command.split()
+        if not words:
+            return []
+        with self._index_lock:
+            if self._executables is None:
+                self._executables = self._build_executable_index()
 
-    def _levenshtein_distance(self, s1: str, s2: str) -> int:
-        """Calculate the Levenshtein distance between two strings"""
+        # (distance, tie breakers, corrected command); among names at the
+        # same distance, those fewer edits away when swapping two adjacent
+        # letters counts as one come first, then anagrams, then names of the
+        # same length and first letter
+        ranked = []
+        if words[0] == "nsds":
+            ranked.extend((distance, swapped, False, 0, False, corrected)
+                          for distance, swapped, corrected in self._nsds_corrections(words, max_distance))
+        else:
+            typed = words[0]
+            for distance, name in self._executables.search(typed, max_distance):
+                swapped = self._transposition_distance(typed, name)
+                if name == "nsds":
+                    # Fix the rest of a mistyped nsds command too
+                    ranked.extend((distance + extra, swapped + extra_swapped, False, 0, False, corrected)
+                                  for extra, extra_swapped, corrected
+                                  in self._nsds_corrections(["nsds"] + words[1:], max_distance))
+                ranked.append((distance, swapped, sorted(name) != sorted(typed),
+                               abs(len(name) - len(typed)), name[0] != typed[0],
+                               " ".join([name] + words[1:])))
+
+        suggestions = []
+        for *_, corrected in sorted(ranked):
+            if corrected != " ".join(words) and corrected not in suggestions:
+                suggestions.append(corrected)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    def _nsds_corrections(self, words: List[str], max_distance: int) -> List[Tuple[int, int, str]]:
+        """
+        Corrections of the subcommand words of an nsds command as
+        (total distance, total distance counting adjacent swaps as one edit, command)
+        Every level only has a handful of subcommands, so each word is
+        compared with its siblings directly.
+        """
+        corrections = []
+        pending = [(1, ["nsds"], {"subcommands": self.command_structure.commands}, 0, 0)]
+        while pending:
+            index, fixed, node, total, swapped = pending.pop()
+            subcommands = node.get("subcommands") if isinstance(node, dict) else None
+            if index == len(words) or not subcommands or words[index].startswith("-"):
+                corrections.append((total, swapped, " ".join(fixed + words[index:])))
+                continue
+            word = words[index]
+            if word in subcommands:
+                pending.append((index + 1, fixed + [word], subcommands[word], total, swapped))
+                continue
+            for name, child in subcommands.items():
+                distance = self._levenshtein_distance(word, name, max_distance)
+                if distance <= max_distance:
+                    pending.append((index + 1, fixed + [name], child, total + distance,
+                                    swapped + self._transposition_distance(word, name)))
+        return corrections
+
+    def _unknown_nsds_word(self, command: str) -> bool:
+        """True when an nsds command names a subcommand that does not exist"""
+        try:
+            words = shlex.split(command)[1:]
+        except ValueError:
+            return False
+        node = {"subcommands": self.command_structure.commands}
+        for word in words:
+            if word.startswith("-"):
+                return False
+            subcommands = node.get("subcommands")
+            if not subcommands:
+                # A leaf command; the rest are its arguments
+                return False
+            if word not in subcommands:
+                return True
+            node = subcommands[word]
+            if not isinstance(node, dict):
+                return False
+        return False
+
+    def _did_you_mean(self, command: str) -> str:
+        suggestions = self.suggest_corrections(command)
+        if not suggestions:
+            return ""
+        return ". Did you mean: " + ", ".join(f"'{suggestion}'" for suggestion in suggestions) + "?"
+
+    def _build_executable_index(self) -> DeletionIndex:
+        index = DeletionIndex(self._levenshtein_distance)
+        for name in set(self._common_commands) | {"nsds"} | set(_path_executables()):
+            index.add(name)
+        return index
+
+    def _levenshtein_distance(self, s1: str, s2: str, max_distance: Optional[int] = None) -> int:
+        """
+        Calculate the Levenshtein distance between two strings
+        With max_distance, stops as soon as the distance is known to exceed
+        it and returns max_distance + 1.
+        """
         if len(s1) < len(s2):
-            return self._levenshtein_distance(s2, s1)
+            return self._levenshtein_distance(s2, s1, max_distance)
+
+        if max_distance is not None and len(s1) - len(s2) > max_distance:
+            return max_distance + 1
 
         if len(s2) == 0:
             return len(s1)
@@ -41,6 +224,54 @@ class CommandValidator:
                 deletions = current_row[j] + 1
                 substitutions = previous_row[j] + (c1 != c2)
                 current_row.append(min(insertions, deletions, substitutions))
+            if max_distance is not None and min(current_row) > max_distance:
+                return max_distance + 1
             previous_row = current_row
 
-        return previous_row[-1]
\ No newline at end of file
+        return previous_row[-1]
+
+    def _transposition_distance(self, s1: str, s2: str) -> int:
+        """
+        Optimal string alignment distance: the Levenshtein distance with a
+        swap of two adjacent characters counted as a single edit
+        """
+        rows = [list(range(len(s2) + 1))]
+        for i, c1 in enumerate(s1, 1):
+            row = [i]
+            for j, c2 in enumerate(s2, 1):
+                cost = min(rows[-1][j] + 1, row[j - 1] + 1, rows[-1][j - 1] + (c1 != c2))
+                if i > 1 and j > 1 and c1 == s2[j - 2] and s1[i - 2] == c2:
+                    cost = min(cost, rows[-2][j - 2] + 1)
+                row.append(cost)
+            rows.append(row)
+        return rows[-1][-1]
+
+
+def _path_executables() -> List[str]:
+    """Names of the executable files in the directories on PATH"""
+    names = []
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        try:
+            entries = os.scandir(directory or ".")
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        names.append(entry.name)
+                except OSError:
+                    continue
+    return names
+
+
+_command_validator = None
+_command_validator_lock = threading.Lock()
+
+def get_command_validator() -> CommandValidator:
+    """Return the process-wide validator, whose index of PATH executables is built once"""
+    global _command_validator
+    with _command_validator_lock:
+        if _command_validator is None:
+            _command_validator = CommandValidator()
+        return _command_validator
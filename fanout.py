@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import re
+import shlex
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ansi import StyledOutput
+from async_executor import get_shared_loop
+from history_store import HistoryStore
+from job_scheduler import Job, QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED
+
+# Node-scoped nsds verbs that can be fanned out across nodes
+NODE_VERBS = ("status", "start", "stop", "restart")
+
+# Command run for each node; {verb} and {node} are substituted
+DEFAULT_COMMAND_TEMPLATE = "nsds node {verb} {node}"
+
+DEFAULT_WINDOW = 8
+
+# Rendered output kept per node; only the tail of a node's output is shown
+NODE_OUTPUT_HTML_BYTES = 64 * 1024
+
+# Matches a numeric range such as node[1-50] or rack[01-12]
+_RANGE_PATTERN = re.compile(r"^(.*)\[(\d+)-(\d+)\](.*)$")
+
+
+def parse_nodes(text: str) -> List[str]:
+    """
+    Parse a comma or whitespace separated node list.
+    Numeric ranges like node[1-3] expand to node1, node2, node3 (zero padding
+    of the lower bound is kept). Duplicates are dropped, order is preserved.
+    """
+    nodes = []
+    for item in re.split(r"[,\s]+", text.strip()):
+        if not item:
+            continue
+        match = _RANGE_PATTERN.match(item)
+        if match:
+            prefix, low, high, suffix = match.groups()
+            width = len(low) if low.startswith("0") else 0
+            for number in range(int(low), int(high) + 1):
+                nodes.append(f"{prefix}{number:0{width}d}{suffix}")
+        else:
+            nodes.append(item)
+    return list(dict.fromkeys(nodes))
+
+
+class NodeRun(Job):
+    """One node's share of a fan-out"""
+
+    def __init__(self, run_id: int, node: str, command: str, user: Optional[str] = None):
+        super().__init__(run_id, command, priority=0, user=user)
+        self.node = node
+        self._styled = StyledOutput(NODE_OUTPUT_HTML_BYTES)
+
+
+class FanOut:
+    """A node-scoped command run against a list of nodes"""
+
+    def __init__(self, fanout_id: int, verb: str, nodes: List[str], window: int, template: str,
+                 user: Optional[str] = None):
+        self.id = fanout_id
+        self.verb = verb
+        self.window = window
+        self.user = user
+        self.started_at = time.time()
+        self.finished_at = None
+        self.runs = [
+            NodeRun(run_id, node, template.format(verb=verb, node=shlex.quote(node)), user)
+            for run_id, node in enumerate(nodes, 1)
+        ]
+        self._cancelled = False
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def get_run(self, node: str) -> Optional[NodeRun]:
+        for run in self.runs:
+            if run.node == node:
+                return run
+        return None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of nodes in each state"""
+        counts = {state: 0 for state in (QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED)}
+        for run in self.runs:
+            counts[run.state] += 1
+        return counts
+
+    def duration(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def summary(self) -> List[Dict[str, object]]:
+        """One row per node with its state, exit code and duration"""
+        rows = []
+        for run in self.runs:
+            duration = run.duration()
+            rows.append({
+                "node": run.node,
+                "state": run.state,
+                "exit code": run.returncode,
+                "duration (s)": round(duration, 2) if duration is not None else None,
+            })
+        return rows
+
+
+class FanOutExecutor:
+    """
+    Runs node-scoped nsds commands across many nodes in parallel.
+    At most `window` nodes of a fan-out run at once; each node gets its own
+    AsyncCommandSession and output store on the process-wide event loop.
+    Every node's command is recorded in the history store, if one is given.
+    """
+
+    def __init__(self, template: str = DEFAULT_COMMAND_TEMPLATE,
+                 history_store: Optional[HistoryStore] = None):
+        self.template = template
+        self.history_store = history_store
+        self._loop = get_shared_loop()
+        self._lock = threading.Lock()
+        self._fanouts: Dict[int, FanOut] = {}
+        self._fanout_ids = itertools.count(1)
+
+    def start(self, verb: str, nodes: List[str], window: int = DEFAULT_WINDOW,
+              user: Optional[str] = None) -> FanOut:
+        """Start running `verb` on every node and return the fan-out without waiting"""
+        if verb not in NODE_VERBS:
+            raise ValueError(f"Unsupported node command: {verb}")
+        if not nodes:
+            raise ValueError("No nodes given")
+
+        with self._lock:
+            fanout = FanOut(next(self._fanout_ids), verb, nodes, max(1, window), self.template, user)
+            self._fanouts[fanout.id] = fanout
+        asyncio.run_coroutine_threadsafe(self._run(fanout), self._loop)
+        return fanout
+
+    def cancel(self, fanout: FanOut) -> None:
+        """Skip nodes that have not started yet and terminate the running ones"""
+        fanout._cancelled = True
+        for run in fanout.runs:
+            run.cancel()
+
+    def get_fanout(self, fanout_id: int) -> Optional[FanOut]:
+        return self._fanouts.get(fanout_id)
+
+    def list_fanouts(self) -> List[FanOut]:
+        """Return all fan-outs, newest first"""
+        with self._lock:
+            return sorted(self._fanouts.values(), key=lambda fanout: fanout.id, reverse=True)
+
+    def forget(self, fanout: FanOut) -> None:
+        """Drop a finished fan-out and release its output"""
+        if not fanout.finished:
+            return
+        with self._lock:
+            self._fanouts.pop(fanout.id, None)
+        for run in fanout.runs:
+            if run.session is not None:
+                run.session.output.close()
+
+    async def _run(self, fanout: FanOut) -> None:
+        window = asyncio.Semaphore(fanout.window)
+        try:
+            await asyncio.gather(*(self._run_node(run, window) for run in fanout.runs))
+        finally:
+            fanout.finished_at = time.time()
+
+    async def _run_node(self, run: NodeRun, window: asyncio.Semaphore) -> None:
+        async with window:
+            if run.start():
+                await run.run(self.history_store)
@@ -0,0 +1,211 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+DEFAULT_DB_PATH = os.environ.get(
+    "CLI2GUI_HISTORY_DB", os.path.join(os.path.expanduser("~"), ".cli2gui", "history.db")
+)
+
+# Pending entries are written together once there are this many, or once
+# the oldest has waited FLUSH_INTERVAL seconds
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    command TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL,
+    exit_code INTEGER,
+    user TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_command ON history (command, started_at);
+CREATE INDEX IF NOT EXISTS idx_history_started_at ON history (started_at);
+"""
+
+
+class HistoryEntry(NamedTuple):
+    command: str
+    started_at: float
+    duration: Optional[float]
+    exit_code: Optional[int]
+    user: Optional[str]
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every string starting with prefix"""
+    return prefix + "\U0010ffff"
+
+
+class HistoryStore:
+    """
+    Command history persisted in SQLite and shared by every session.
+    The database runs in WAL mode so several app processes can read while
+    one writes. Recorded commands are buffered and written in batches; reads
+    flush the buffer first so they always see every recorded command.
+    Queries use the command and timestamp indexes instead of loading the
+    history into memory.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: List[HistoryEntry] = []
+        self._oldest_pending = None
+        self._conn = self._connect(path)
+        self._closed = False
+
+        flusher = threading.Thread(target=self._flush_periodically, name="history-flush")
+        flusher.daemon = True
+        flusher.start()
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+        except (OSError, sqlite3.Error):
+            # An unwritable location should not take the terminal down with it
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.executescript(SCHEMA)
+        return conn
+
+    def record(self, command: str, started_at: Optional[float] = None, duration: Optional[float] = None,
+               exit_code: Optional[int] = None, user: Optional[str] = None) -> None:
+        """
+        Buffer a command for the next batched write
+        user identifies whoever ran the command (such as the signed-in user of
+        the web session); it is left empty when the caller does not know.
+        """
+        command = command.strip()
+        if not command:
+            return
+        entry = HistoryEntry(
+            command,
+            started_at if started_at is not None else time.time(),
+            duration,
+            exit_code,
+            user
+        )
+        with self._lock:
+            self._pending.append(entry)
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def recent(self, limit: int = 50, user: Optional[str] = None) -> List[HistoryEntry]:
+        """Most recent commands, newest first"""
+        if user is None:
+            return self._query(
+                "SELECT command, started_at, duration, exit_code, user FROM history "
+                "ORDER BY started_at DESC LIMIT ?", (limit,))
+        return self._query(
+            "SELECT command, started_at, duration, exit_code, user FROM history "
+            "WHERE user = ? ORDER BY started_at DESC LIMIT ?", (user, limit))
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> List[Tuple[str, int, float]]:
+        """Distinct commands starting with prefix as (command, uses, last used), most recent first"""
+        return [tuple(row) for row in self._execute(
+            "SELECT command, COUNT(*), MAX(started_at) AS last_used FROM history "
+            "WHERE command >= ? AND command < ? GROUP BY command "
+            "ORDER BY last_used DESC LIMIT ?",
+            (prefix, _prefix_upper_bound(prefix), limit))]
+
+    def frequent(self, limit: int = 10, since: Optional[float] = None) -> List[Tuple[str, int]]:
+        """Most used commands as (command, uses), optionally only since a timestamp"""
+        return [tuple(row) for row in self._execute(
+            "SELECT command, COUNT(*) AS uses FROM history WHERE started_at >= ? "
+            "GROUP BY command ORDER BY uses DESC LIMIT ?",
+            (since or 0.0, limit))]
+
+    def between(self, start: float, end: float, user: Optional[str] = None,
+                limit: int = 1000) -> List[HistoryEntry]:
+        """Commands started in [start, end), oldest first, for audits"""
+        sql = ("SELECT command, started_at, duration, exit_code, user FROM history "
+               "WHERE started_at >= ? AND started_at < ?")
+        params: tuple = (start, end)
+        if user is not None:
+            sql += " AND user = ?"
+            params += (user,)
+        return self._query(sql + " ORDER BY started_at LIMIT ?", params + (limit,))
+
+    def iter_entries(self, since: float = 0.0, batch_size: int = 1000) -> Iterator[HistoryEntry]:
+        """Stream every entry since a timestamp in time order, a batch at a time"""
+        last_started, last_id = since, 0
+        while True:
+            rows = self._execute(
+                "SELECT id, command, started_at, duration, exit_code, user FROM history "
+                "WHERE (started_at, id) > (?, ?) ORDER BY started_at, id LIMIT ?",
+                (last_started, last_id, batch_size))
+            if not rows:
+                return
+            for row in rows:
+                yield HistoryEntry(*row[1:])
+            last_id, last_started = rows[-1][0], rows[-1][2]
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM history")[0][0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._closed = True
+            self._conn.close()
+
+    def _query(self, sql: str, params: tuple) -> List[HistoryEntry]:
+        return [HistoryEntry(*row) for row in self._execute(sql, params)]
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            self._flush()
+            return self._conn.execute(sql, params).fetchall()
+
+    def _flush(self) -> None:
+        """Write buffered entries in one transaction (lock must be held)"""
+        if not self._pending or self._closed:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO history (command, started_at, duration, exit_code, user) "
+                "VALUES (?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+        self._oldest_pending = None
+
+    def _flush_periodically(self) -> None:
+        while not self._closed:
+            time.sleep(FLUSH_INTERVAL)
+            with self._lock:
+                if (self._oldest_pending is not None
+                        and time.monotonic() - self._oldest_pending >= FLUSH_INTERVAL):
+                    try:
+                        self._flush()
+                    except sqlite3.Error:
+                        pass
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+def get_history_store() -> HistoryStore:
+    """Return the process-wide history store, opening the database on first use"""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+            atexit.register(_history_store.close)
+        return _history_store
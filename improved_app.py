@@ -5,24 +5,45 @@ from datetime import datetime
 import threading
 from queue import Queue, Empty
 from voice_input import handle_voice_input
-from command_suggestions import CommandSuggestionEngine
+from command_suggestions import CommandSuggestionEngine, SuggestionSession
 from styles import apply_styles, get_theme_names
+from ansi import StyledOutput
+from output_store import OutputStore
+from history_store import get_history_store
+from command_validator import get_command_validator
+from output_viewer import output_viewer, output_search, is_long_output
 from mascot_system import create_mascot_instance, render_mascot_reaction, mascot_settings
 
+# Output streaming: while a command runs only the output pane fragment reruns.
+# Each run blocks until output arrives, then keeps gathering follow-up
+# messages for a short window that widens while the producer keeps up.
+OUTPUT_REFRESH_INTERVAL = 0.5  # seconds between output pane runs
+OUTPUT_MAX_WAIT = 0.4  # longest a run waits for the first message
+OUTPUT_BATCH_WINDOW = 0.02  # initial window for gathering a batch
+OUTPUT_MAX_BATCH_WINDOW = 0.2
+
 # Initialize session state variables
 def initialize_session_state():
     if 'command_history' not in st.session_state:
         st.session_state.command_history = []
-    if 'current_output' not in st.session_state:
-        st.session_state.current_output = ""
+    if 'output_store' not in st.session_state:
+        # Line-indexed output; long outputs are shown a window at a time
+        st.session_state.output_store = OutputStore()
+    if 'styled_output' not in st.session_state:
+        # ANSI colours rendered once per chunk as output streams in
+        st.session_state.styled_output = StyledOutput()
     if 'is_command_running' not in st.session_state:
         st.session_state.is_command_running = False
+    if 'command_status' not in st.session_state:
+        st.session_state.command_status = None
     if 'command_process' not in st.session_state:
         st.session_state.command_process = None
     if 'output_queue' not in st.session_state:
         st.session_state.output_queue = Queue()
     if 'suggestion_engine' not in st.session_state:
-        st.session_state.suggestion_engine = CommandSuggestionEngine()
+        st.session_state.suggestion_engine = CommandSuggestionEngine(history_store=get_history_store())
+    if 'suggestion_session' not in st.session_state:
+        st.session_state.suggestion_session = SuggestionSession(st.session_state.suggestion_engine)
     if 'next_command' not in st.session_state:
         st.session_state.next_command = ""
     if 'accessibility_mode' not in st.session_state:
@@ -41,8 +62,14 @@ def format_timestamp():
     """Return formatted current timestamp"""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def execute_command(command, output_queue):
+def session_user():
+    """The signed-in user of this session, or None when the app has no login"""
+    return st.user.get("email")
+
+def execute_command(command, output_queue, user=None):
     """Execute a shell command and put output in the queue"""
+    started_at = time.time()
+    exit_code = None
     try:
         process = subprocess.Popen(
             command,
@@ -62,12 +89,18 @@ def execute_command(command, output_queue):
         
         # Wait for process to complete
         process.wait()
+        exit_code = process.returncode
         
         # Put completion status in queue
         if process.returncode == 0:
             output_queue.put(('status', (True, f"Command completed successfully (exit code: {process.returncode})")))
         else:
-            output_queue.put(('status', (False, f"Command failed with exit code: {process.returncode}")))
+            text = f"Command failed with exit code: {process.returncode}"
+            # Point out a likely typo in the command that failed
+            is_valid, message = get_command_validator().validate_command(command)
+            if not is_valid:
+                text = f"{text}\n{message}"
+            output_queue.put(('status', (False, text)))
         
         # Clear process reference
         st.session_state.command_process = None
@@ -77,6 +110,13 @@ def execute_command(command, output_queue):
         output_queue.put(('error', f"Error executing command: {str(e)}"))
         st.session_state.is_command_running = False
         st.session_state.command_process = None
+    finally:
+        get_history_store().record(
+            command, started_at=started_at, duration=time.time() - started_at,
+            exit_code=exit_code, user=user
+        )
+        # Tell the output pane the stream has ended
+        output_queue.put(('done', None))
 
 def terminate_process():
     """Terminate the currently running process"""
@@ -89,31 +129,106 @@ def terminate_process():
             return False
     return False
 
-def update_output_area(output_placeholder, status_placeholder):
-    """Update the output area with any new content from the queue"""
+def drain_output_queue(output_queue, max_wait=OUTPUT_MAX_WAIT):
+    """
+    Wait for the next message, then collect everything that arrives within
+    an adaptive batching window so bursts are rendered in a single pass
+    """
     try:
-        # Process up to 10 messages at a time to avoid blocking
-        for _ in range(10):
-            try:
-                msg_type, data = st.session_state.output_queue.get_nowait()
-                
-                if msg_type == 'output':
-                    st.session_state.current_output += data
-                    output_placeholder.code(st.session_state.current_output)
-                elif msg_type == 'status':
-                    is_success, text = data
-                    if is_success:
-                        status_placeholder.success(text)
-                    else:
-                        status_placeholder.error(text)
-                elif msg_type == 'error':
-                    status_placeholder.error(data)
-                    
-            except Empty:
-                # No more messages in queue
-                break
+        messages = [output_queue.get(timeout=max_wait)]
+    except Empty:
+        return []
+
+    window = OUTPUT_BATCH_WINDOW
+    deadline = time.monotonic() + window
+    while True:
+        try:
+            messages.append(output_queue.get_nowait())
+            continue
+        except Empty:
+            pass
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            messages.append(output_queue.get(timeout=remaining))
+        except Empty:
+            break
+
+        # The producer is keeping up, so widen the window for a bigger batch
+        if window < OUTPUT_MAX_BATCH_WINDOW:
+            window = min(window * 2, OUTPUT_MAX_BATCH_WINDOW)
+            deadline = time.monotonic() + window
+
+    return messages
+
+def update_output_area():
+    """
+    Apply a batch of queued messages to the output.
+    Returns True when the command's output stream has ended.
+    """
+    finished = False
+    try:
+        chunks = []
+        for msg_type, data in drain_output_queue(st.session_state.output_queue):
+            if msg_type == 'output':
+                chunks.append(data)
+            elif msg_type == 'status':
+                st.session_state.command_status = data
+            elif msg_type == 'error':
+                st.session_state.command_status = (False, data)
+            elif msg_type == 'done':
+                finished = True
+
+        if chunks:
+            text = "".join(chunks)
+            st.session_state.output_store.append(text)
+            st.session_state.styled_output.append(text)
     except Exception as e:
         st.error(f"Error updating output: {str(e)}")
+    return finished
+
+def render_output(output_placeholder):
+    """Show the output with its ANSI colours, windowed when it is long or being searched"""
+    source = st.session_state.output_store
+    with output_placeholder.container():
+        highlight, jump = output_search(source, key="output_search")
+        if highlight is not None or is_long_output(source):
+            # The viewer can scroll to and mark the current match
+            output_viewer(source, key="output_viewer", highlight_line=highlight,
+                          scroll_to=highlight if jump else None)
+        else:
+            st.markdown(
+                f'<pre class="terminal-output">{st.session_state.styled_output.getvalue()}</pre>',
+                unsafe_allow_html=True
+            )
+
+def output_pane():
+    """Command output area, rerun on its own while a command is streaming"""
+    output_placeholder = st.empty()
+    status_placeholder = st.empty()
+
+    finished = False
+    # The worker thread may clear the running flag before its last messages are drained
+    if st.session_state.is_command_running or not st.session_state.output_queue.empty():
+        finished = update_output_area()
+
+    # Rendered once per run, after the batch is applied, so the viewer's widgets are unique
+    if len(st.session_state.output_store):
+        render_output(output_placeholder)
+
+    if st.session_state.command_status:
+        is_success, text = st.session_state.command_status
+        if is_success:
+            status_placeholder.success(text)
+        else:
+            status_placeholder.error(text)
+
+    if finished:
+        # Rerun the whole page once so the stop button goes away and the pane stops polling
+        st.session_state.is_command_running = False
+        st.rerun()
 
 def nsds_basic_commands():
     """Display professional NSDS command sidebar based on the new design reference"""
@@ -970,16 +1085,18 @@ def main():
         
         # Command History Section in an expander
         with st.expander("📜 Command History", expanded=True):
-            # Display command history in reverse order (newest first)
-            if st.session_state.command_history:
-                for i, cmd_entry in enumerate(reversed(st.session_state.command_history[-10:])):
+            # Newest first, from the persistent store so it survives refreshes
+            recent_history = get_history_store().recent(10)
+            if recent_history:
+                for i, entry in enumerate(recent_history):
                     # Create a clickable history item that runs the command when clicked
+                    executed_at = datetime.fromtimestamp(entry.started_at).strftime("%Y-%m-%d %H:%M:%S")
                     if st.button(
-                        f"{cmd_entry['command']}",
+                        f"{entry.command}",
                         key=f"history_{i}",
-                        help=f"Executed at {cmd_entry['timestamp']}"
+                        help=f"Executed at {executed_at}"
                     ):
-                        st.session_state.next_command = cmd_entry['command']
+                        st.session_state.next_command = entry.command
                         st.rerun()
             else:
                 st.info("No commands executed yet.")
@@ -1082,7 +1199,7 @@ def main():
             
         # Command suggestions section - only show if there's input to suggest from and execute wasn't clicked
         if command and not st.session_state.hide_suggestions:
-            suggestions = st.session_state.suggestion_engine.get_suggestions(command)
+            suggestions = st.session_state.suggestion_session.suggest(command)
             if suggestions:
                 st.markdown("""
                 <style>
@@ -1171,15 +1288,6 @@ def main():
             if terminate_process():
                 st.error("Command execution stopped by user")
     
-    # Output area
-    st.markdown("### Command Output")
-    output_placeholder = st.empty()
-    status_placeholder = st.empty()
-    
-    # Show current output if any
-    if st.session_state.current_output:
-        output_placeholder.code(st.session_state.current_output)
-    
     # Execute command if requested
     if execute and command.strip():
         try:
@@ -1187,9 +1295,11 @@ def main():
             st.session_state.hide_suggestions = True
             
             # Reset output
-            st.session_state.current_output = ""
-            output_placeholder.code("")
-            status_placeholder.empty()
+            st.session_state.output_store.clear()
+            st.session_state.styled_output.clear()
+            st.session_state.command_status = None
+            # Fresh queue so a stopped command's late messages can't leak into this one
+            st.session_state.output_queue = Queue()
             
             # Add to history
             cmd_entry = {
@@ -1207,7 +1317,7 @@ def main():
             # Execute command in thread
             thread = threading.Thread(
                 target=execute_command,
-                args=(command, st.session_state.output_queue)
+                args=(command, st.session_state.output_queue, session_user())
             )
             thread.daemon = True
             thread.start()
@@ -1220,12 +1330,10 @@ def main():
     elif execute:
         st.error("Please enter a command")
     
-    # Update output if command is running
-    if st.session_state.is_command_running:
-        update_output_area(output_placeholder, status_placeholder)
-        # Rerun to continue updating
-        time.sleep(0.1)  # Small delay to prevent too frequent refreshes
-        st.rerun()
+    # Output area; only this fragment reruns while a command is streaming
+    st.markdown("### Command Output")
+    run_every = OUTPUT_REFRESH_INTERVAL if st.session_state.is_command_running else None
+    st.fragment(output_pane, run_every=run_every)()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ansi import StyledOutput
+from async_executor import AsyncCommandSession, get_shared_loop
+from command_cache import get_result_cache
+from history_store import HistoryStore
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class Job:
+    """
+    A command run in the background on the process-wide event loop.
+    Its state changes are guarded by a lock of its own, so it can be
+    started, cancelled and finished from different threads.
+    """
+
+    def __init__(self, job_id: int, command: str, priority: int, user: Optional[str] = None):
+        self.id = job_id
+        self.command = command
+        self.priority = priority
+        self.user = user
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.status_text = ""
+        self.session: Optional[AsyncCommandSession] = None
+        self._lock = threading.Lock()
+        # Output rendered as HTML so far, and the output offset it reaches
+        self._styled = StyledOutput()
+        self._styled_offset = 0
+        self._styled_lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def get_output(self) -> str:
+        return self.session.output.getvalue() if self.session else ""
+
+    def get_output_tail(self, max_bytes: int) -> str:
+        return self.session.output.tail(max_bytes) if self.session else ""
+
+    def get_styled_output(self) -> str:
+        """Return the output rendered as HTML, parsing only what arrived since the last call"""
+        if self.session is None:
+            return ""
+        with self._styled_lock:
+            # Output older than the rendered bound would be dropped again at once
+            text, self._styled_offset = self.session.output.read_from(self._styled_offset,
+                                                                      self._styled.max_bytes)
+            self._styled.append(text)
+            return self._styled.getvalue()
+
+    def duration(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def start(self) -> bool:
+        """Move a queued job to running and create its session; False if it is no longer queued"""
+        with self._lock:
+            if self.state != QUEUED:
+                return False
+            self.state = RUNNING
+            self.started_at = time.time()
+            self.session = AsyncCommandSession(self.command, interactive=False)
+        # Mutating commands make cached results in their category stale
+        get_result_cache().note_executed(self.command)
+        return True
+
+    def cancel(self) -> bool:
+        """Cancel a queued or running job"""
+        with self._lock:
+            if self.finished:
+                return False
+            was_running = self.state == RUNNING
+            self.state = CANCELLED
+            self.finished_at = time.time()
+            self.status_text = "Cancelled by user"
+
+        # Queued jobs are skipped when started; running ones are terminated
+        if was_running and self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.terminate(), get_shared_loop())
+        return True
+
+    async def run(self, history_store: Optional[HistoryStore] = None) -> None:
+        """Run the started job to completion and record it in the history store, if one is given"""
+        failed = False
+        try:
+            await self.session.start()
+            if self.state == CANCELLED:
+                # Cancelled before the process existed to be terminated
+                await self.session.terminate()
+            async for msg_type, data in self.session.events():
+                if msg_type == 'status':
+                    _, self.status_text = data
+                elif msg_type == 'error':
+                    failed = True
+                    self.status_text = data
+        finally:
+            with self._lock:
+                self.returncode = self.session.returncode
+                if self.state == RUNNING:
+                    self.finished_at = time.time()
+                    self.state = COMPLETED if not failed and self.returncode == 0 else FAILED
+            # Reads that ran alongside a mutating command may have seen the old state
+            get_result_cache().note_executed(self.command)
+            if history_store is not None:
+                history_store.record(self.command, started_at=self.started_at, duration=self.duration(),
+                                     exit_code=self.returncode, user=self.user)
+
+
+class JobScheduler:
+    """
+    Runs commands as background jobs with bounded concurrency.
+    Jobs wait in a priority queue (lower number runs first, FIFO within a
+    priority) and each gets its own output store. All jobs share the
+    process-wide event loop used by SyncCommandExecutor. Finished jobs are
+    recorded in the history store, if one is given.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 history_store: Optional[HistoryStore] = None):
+        self.max_concurrency = max_concurrency
+        self.history_store = history_store
+        self._loop = get_shared_loop()
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Job] = {}
+        self._queue = []  # (priority, sequence, job) heap
+        self._sequence = itertools.count()
+        self._job_ids = itertools.count(1)
+        self._running = 0
+
+    def submit(self, command: str, priority: int = 0, user: Optional[str] = None) -> int:
+        """Queue a command and return its job ID"""
+        with self._lock:
+            job = Job(next(self._job_ids), command, priority, user)
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (priority, next(self._sequence), job))
+            self._dispatch()
+        return job.id
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job"""
+        job = self._jobs.get(job_id)
+        return job.cancel() if job is not None else False
+
+    def get_job(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        """Return all jobs, newest first"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.id, reverse=True)
+
+    def get_output(self, job_id: int) -> str:
+        job = self._jobs.get(job_id)
+        return job.get_output() if job else ""
+
+    def running_count(self) -> int:
+        return self._running
+
+    def queued_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state == QUEUED)
+
+    def clear_finished(self) -> None:
+        """Forget jobs that are no longer queued or running"""
+        with self._lock:
+            for job_id in [job.id for job in self._jobs.values() if job.finished]:
+                job = self._jobs.pop(job_id)
+                if job.session is not None:
+                    job.session.output.close()
+
+    def _dispatch(self) -> None:
+        """Start queued jobs while there is spare capacity (lock must be held)"""
+        while self._queue and self._running < self.max_concurrency:
+            _, _, job = heapq.heappop(self._queue)
+            if not job.start():
+                continue
+            self._running += 1
+            asyncio.run_coroutine_threadsafe(self._run(job), self._loop)
+
+    async def _run(self, job: Job) -> None:
+        try:
+            await job.run(self.history_store)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._dispatch()
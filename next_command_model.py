@@ -0,0 +1,200 @@
+import re
+import shlex
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from nsds_commands import CommandStructure
+
+# Longest n-gram: the next command given up to two previous ones
+DEFAULT_ORDER = 3
+
+# Observations lose half their weight every week
+DEFAULT_HALF_LIFE = 7 * 24 * 3600.0
+
+# Contexts (runs of previous commands) kept, and followers kept per context
+MAX_CONTEXTS = 5000
+MAX_FOLLOWERS = 20
+
+# Commands further apart than this do not follow each other
+SESSION_GAP = 30 * 60.0
+
+# How much each order contributes to a prediction, unigram first; orders
+# whose context was never seen are left out and the rest renormalized
+INTERPOLATION_WEIGHTS = (0.1, 0.3, 0.6)
+
+# Placeholder for the arguments of a command template
+ARGUMENT = "<arg>"
+
+# A subcommand-like word such as "status" or "show-config"
+_SUBCOMMAND_WORD = re.compile(r"^[a-z][a-z_-]*$")
+
+
+class _Context:
+    __slots__ = ("total", "updated", "followers")
+
+    def __init__(self):
+        self.total = 0.0
+        self.updated = 0.0
+        self.followers: Dict[str, list] = {}  # template -> [weight, updated, latest command]
+
+
+class NextCommandModel:
+    """
+    Predicts the next command from the ones run just before it.
+    Commands are reduced to templates (the command and subcommand words
+    and flags, with arguments replaced by <arg>) so that runs differing
+    only in node names or paths count together. Unigram to order-n counts
+    are kept per context, decay exponentially with the given half-life and
+    are interpolated into probabilities. Memory is bounded by pruning the
+    weakest contexts and followers. Predictions are returned as the latest
+    concrete command seen for each template.
+    """
+
+    def __init__(self, order: int = DEFAULT_ORDER, half_life: float = DEFAULT_HALF_LIFE,
+                 max_contexts: int = MAX_CONTEXTS, max_followers: int = MAX_FOLLOWERS,
+                 command_structure: Optional[CommandStructure] = None):
+        self.order = order
+        self.half_life = half_life
+        self.max_contexts = max_contexts
+        self.max_followers = max_followers
+        self.command_structure = command_structure or CommandStructure()
+        self._contexts: Dict[Tuple[str, ...], _Context] = {(): _Context()}
+        self.template = lru_cache(maxsize=4096)(self._template)
+
+    def _template(self, command: str) -> str:
+        """Reduce a command to its template"""
+        try:
+            tokens = shlex.split(command)
+        except ValueError:
+            tokens = command.split()
+        if not tokens:
+            return ""
+
+        words = [tokens[0]]
+        node = {"subcommands": self.command_structure.commands} if tokens[0] == "nsds" else None
+        in_words = True
+        for token in tokens[1:]:
+            if token.startswith("-"):
+                words.append(token.split("=", 1)[0])
+                continue
+            if in_words:
+                if node is not None:
+                    # nsds: keep the words that walk the command tree
+                    subcommands = node.get("subcommands") if isinstance(node, dict) else None
+                    if subcommands and token in subcommands:
+                        words.append(token)
+                        node = subcommands[token]
+                        continue
+                elif len(words) == 1 and _SUBCOMMAND_WORD.match(token):
+                    # Other commands: keep one subcommand such as "git status"
+                    words.append(token)
+                    continue
+                in_words = False
+            if words[-1] != ARGUMENT:
+                words.append(ARGUMENT)
+        return " ".join(words)
+
+    def _context_templates(self, previous: Sequence[str]) -> List[str]:
+        """Templates of the previous commands that make up a context"""
+        recent = list(previous)[max(0, len(previous) - (self.order - 1)):]
+        return [self.template(command) for command in recent]
+
+    def _decay(self, elapsed: float) -> float:
+        return 0.5 ** (max(elapsed, 0.0) / self.half_life)
+
+    def observe(self, previous: Sequence[str], command: str, timestamp: Optional[float] = None) -> None:
+        """Count command as following the previous commands (oldest first)"""
+        now = timestamp if timestamp is not None else time.time()
+        template = self.template(command)
+        if not template:
+            return
+
+        history = self._context_templates(previous)
+        for length in range(min(len(history), self.order - 1) + 1):
+            key = tuple(history[len(history) - length:])
+            context = self._contexts.get(key)
+            if context is None:
+                context = self._contexts[key] = _Context()
+            decay = self._decay(now - context.updated)
+            context.total = context.total * decay + 1.0
+            context.updated = now
+            follower = context.followers.get(template)
+            if follower is None:
+                context.followers[template] = [1.0, now, command]
+                if len(context.followers) > self.max_followers * 2:
+                    self._prune_followers(context, now)
+            else:
+                follower[0] = follower[0] * self._decay(now - follower[1]) + 1.0
+                follower[1] = now
+                follower[2] = command
+
+        if len(self._contexts) > self.max_contexts * 5 // 4:
+            self._prune_contexts(now)
+
+    def train(self, entries: Iterable, session_gap: float = SESSION_GAP) -> int:
+        """
+        Learn from history entries (with command, started_at and user, such
+        as HistoryStore.iter_entries()) in time order. Each user's commands
+        form separate sessions, and a gap longer than session_gap starts a
+        new one. Returns the number of entries learned from.
+        """
+        sessions = defaultdict(list)  # user -> recent commands
+        last_seen: Dict[Optional[str], float] = {}
+        count = 0
+        for entry in entries:
+            user = getattr(entry, "user", None)
+            previous = sessions[user]
+            if entry.started_at - last_seen.get(user, entry.started_at) > session_gap:
+                previous.clear()
+            self.observe(previous, entry.command, entry.started_at)
+            previous.append(entry.command)
+            del previous[:max(0, len(previous) - (self.order - 1))]
+            last_seen[user] = entry.started_at
+            count += 1
+        return count
+
+    def predict(self, previous: Sequence[str], limit: int = 5,
+                now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Likely next commands after the previous ones (oldest first), as (command, probability)"""
+        now = now if now is not None else time.time()
+        history = self._context_templates(previous)
+
+        weighted = []
+        for length in range(min(len(history), self.order - 1) + 1):
+            context = self._contexts.get(tuple(history[len(history) - length:]))
+            if context is not None and context.total > 0:
+                weighted.append((INTERPOLATION_WEIGHTS[min(length, len(INTERPOLATION_WEIGHTS) - 1)], context))
+        norm = sum(weight for weight, _ in weighted)
+        if not norm:
+            return []
+
+        scores: Dict[str, float] = defaultdict(float)
+        examples: Dict[str, Tuple[float, str]] = {}
+        for weight, context in weighted:
+            total = context.total * self._decay(now - context.updated)
+            if total <= 0:
+                continue
+            for template, (count, updated, command) in context.followers.items():
+                scores[template] += weight / norm * count * self._decay(now - updated) / total
+                if template not in examples or updated > examples[template][0]:
+                    examples[template] = (updated, command)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [(examples[template][1], probability) for template, probability in ranked[:limit]]
+
+    def _prune_followers(self, context: _Context, now: float) -> None:
+        """Keep the strongest followers; the mass of the dropped ones stays in the total"""
+        ranked = sorted(context.followers.items(),
+                        key=lambda item: -item[1][0] * self._decay(now - item[1][1]))
+        context.followers = dict(ranked[:self.max_followers])
+
+    def _prune_contexts(self, now: float) -> None:
+        """Drop the weakest contexts; the unigram context is always kept"""
+        ranked = sorted(
+            (key for key in self._contexts if key),
+            key=lambda key: -self._contexts[key].total * self._decay(now - self._contexts[key].updated)
+        )
+        for key in ranked[self.max_contexts - 1:]:
+            del self._contexts[key]
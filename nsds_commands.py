@@ -1,203 +1,211 @@
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Mapping, Optional, Tuple
 
-class CommandStructure:
-    def __init__(self):
-        self.commands = {
-            "auth": {
-                "title": "Auth management for NFS/SMB services",
+from command_index import get_command_index
+from command_tree import get_command_tree
+
+# The command tree used when no nsds executable can describe its own (see command_tree)
+BUILTIN_COMMANDS = {
+    "auth": {
+        "title": "Auth management for NFS/SMB services",
+        "subcommands": {
+            "clean": "Remove the auth configuration",
+            "commit": "Commit the edited auth configuration",
+            "edit": "Edit the auth configuration",
+            "init": "Initialize the authentication configuration",
+            "show": "Display the current auth configuration"
+        }
+    },
+    "cluster": {
+        "title": "Cluster wide operations",
+        "subcommands": {
+            "destroy": "Stop and remove nsds components from all the nodes in the cluster",
+            "init": "Create and initialize the NSDS cluster",
+            "rename": "Rename the cluster",
+            "restart": "Restart the NSDS services on all the nodes in the cluster",
+            "start": "Start the NSDS services on all the nodes in the cluster",
+            "status": "Display the cluster status",
+            "stop": "Stop the NSDS services on all the nodes in the cluster"
+        }
+    },
+    "config": {
+        "title": "Configuration management",
+        "subcommands": {
+            "cluster": {
+                "title": "Cluster config operations",
                 "subcommands": {
-                    "clean": "Remove the auth configuration",
-                    "commit": "Commit the edited auth configuration",
-                    "edit": "Edit the auth configuration",
-                    "init": "Initialize the authentication configuration",
-                    "show": "Display the current auth configuration"
+                    "backup": "Backup the configurations of nsds components",
+                    "list": "Display the current cluster configurations"
                 }
             },
-            "cluster": {
-                "title": "Cluster wide operations",
+            "docker": {
+                "title": "Control NSDS docker (container) parameters",
                 "subcommands": {
-                    "destroy": "Stop and remove nsds components from all the nodes in the cluster",
-                    "init": "Create and initialize the NSDS cluster",
-                    "rename": "Rename the cluster",
-                    "restart": "Restart the NSDS services on all the nodes in the cluster",
-                    "start": "Start the NSDS services on all the nodes in the cluster",
-                    "status": "Display the cluster status",
-                    "stop": "Stop the NSDS services on all the nodes in the cluster"
+                    "list": "Show current docker runtime options",
+                    "update": "Update docker runtime options"
                 }
             },
-            "config": {
-                "title": "Configuration management",
+            "file": {
+                "title": "List/Edit various config files",
                 "subcommands": {
-                    "cluster": {
-                        "title": "Cluster config operations",
-                        "subcommands": {
-                            "backup": "Backup the configurations of nsds components",
-                            "list": "Display the current cluster configurations"
-                        }
-                    },
-                    "docker": {
-                        "title": "Control NSDS docker (container) parameters",
-                        "subcommands": {
-                            "list": "Show current docker runtime options",
-                            "update": "Update docker runtime options"
-                        }
-                    },
-                    "file": {
-                        "title": "List/Edit various config files",
-                        "subcommands": {
-                            "list": "List the config files",
-                            "update": "Update NSDS config file"
-                        }
-                    },
-                    "nfs": {
-                        "title": "NFS global config operations",
-                        "subcommands": {
-                            "disable": "Disable the NFS service",
-                            "enable": "Enable the NFS service",
-                            "list": "List NFS global config",
-                            "update": "Update NFS config",
-                            "feature": {
-                                "title": "NFS related feature operations",
-                                "subcommands": {
-                                    "list": "Get the list of available features and feature values",
-                                    "update": "Set the feature value"
-                                }
-                            }
-                        }
-                    },
-                    "node": {
-                        "title": "Config operations related to node",
-                        "subcommands": {
-                            "list": "List node-specific config options",
-                            "update": "Update node-specific config options"
-                        }
-                    },
-                    "smb": {
-                        "title": "SMB global config operations",
-                        "subcommands": {
-                            "disable": "Disable the SMB service",
-                            "enable": "Enable the SMB service",
-                            "list": "List SMB global config",
-                            "update": "Update the SMB global config",
-                            "feature": {
-                                "title": "SMB related feature operations",
-                                "subcommands": {
-                                    "list": "Get the list of available features and feature values",
-                                    "update": "Set the feature value"
-                                }
-                            }
-                        }
-                    },
-                    "upgrade": {
-                        "title": "Check or apply the NSDS config upgrades",
-                        "subcommands": {
-                            "apply": "Apply NSDS config upgrades on all nodes",
-                            "check": "Check if NSDS config can be upgraded on all the nodes",
-                            "status": "Check the upgrade status of all the nodes"
-                        }
-                    }
+                    "list": "List the config files",
+                    "update": "Update NSDS config file"
                 }
             },
-            "diag": {
-                "title": "Diagnostics and debugging",
+            "nfs": {
+                "title": "NFS global config operations",
                 "subcommands": {
-                    "collect": "Collect the support bundle for nsds nodes",
-                    "lustre": {
-                        "title": "Manage Lustre client diagnostics and debug",
+                    "disable": "Disable the NFS service",
+                    "enable": "Enable the NFS service",
+                    "list": "List NFS global config",
+                    "update": "Update NFS config",
+                    "feature": {
+                        "title": "NFS related feature operations",
                         "subcommands": {
-                            "debug": "Enable/disable debug for lustre client"
-                        }
-                    },
-                    "nfs": {
-                        "title": "Manage NFS service diagnostics and debug",
-                        "subcommands": {
-                            "debug": "Enable/disable debug for NFS service"
-                        }
-                    },
-                    "smb": {
-                        "title": "Manage SMB service diagnostics and debug",
-                        "subcommands": {
-                            "debug": "Enable/disable debug for SMB service"
+                            "list": "Get the list of available features and feature values",
+                            "update": "Set the feature value"
                         }
                     }
                 }
             },
-            "export": {
-                "title": "Export management",
+            "node": {
+                "title": "Config operations related to node",
                 "subcommands": {
-                    "nfs": {
-                        "title": "NFS Export management",
-                        "subcommands": {
-                            "add": "Add a new export",
-                            "list": "List exports",
-                            "load": "Load exports from conf",
-                            "remove": "Remove exports",
-                            "show": "Show export(s)",
-                            "update": "Update an existing export"
-                        }
-                    },
-                    "smb": {
-                        "title": "SMB Export management",
+                    "list": "List node-specific config options",
+                    "update": "Update node-specific config options"
+                }
+            },
+            "smb": {
+                "title": "SMB global config operations",
+                "subcommands": {
+                    "disable": "Disable the SMB service",
+                    "enable": "Enable the SMB service",
+                    "list": "List SMB global config",
+                    "update": "Update the SMB global config",
+                    "feature": {
+                        "title": "SMB related feature operations",
                         "subcommands": {
-                            "add": "Add a new export",
-                            "list": "List exports",
-                            "load": "Load exports from conf",
-                            "remove": "Remove exports",
-                            "show": "Show export(s)",
-                            "update": "Update an existing export"
+                            "list": "Get the list of available features and feature values",
+                            "update": "Set the feature value"
                         }
                     }
                 }
             },
-            "filesystem": {
-                "title": "File system (export root) management",
+            "upgrade": {
+                "title": "Check or apply the NSDS config upgrades",
                 "subcommands": {
-                    "add": "Add a new file system",
-                    "list": "List file system(s)",
-                    "remove": "Remove a file system"
+                    "apply": "Apply NSDS config upgrades on all nodes",
+                    "check": "Check if NSDS config can be upgraded on all the nodes",
+                    "status": "Check the upgrade status of all the nodes"
                 }
-            },
-            "node": {
-                "title": "Node specific operations",
+            }
+        }
+    },
+    "diag": {
+        "title": "Diagnostics and debugging",
+        "subcommands": {
+            "collect": "Collect the support bundle for nsds nodes",
+            "lustre": {
+                "title": "Manage Lustre client diagnostics and debug",
                 "subcommands": {
-                    "add": "Add a new node to the cluster",
-                    "remove": "Remove a node from the cluster",
-                    "rename": "Rename the specific node",
-                    "restart": "Restart the NSDS services on the current node",
-                    "start": "Start the NSDS services on the current node",
-                    "status": "Show the current node status",
-                    "stop": "Stop the NSDS services on the current node"
+                    "debug": "Enable/disable debug for lustre client"
                 }
             },
-            "prereq": {
-                "title": "Run or test the prerequisites checks",
+            "nfs": {
+                "title": "Manage NFS service diagnostics and debug",
                 "subcommands": {
-                    "check": "Runs the prerequisites checks on given nodes and displays results",
-                    "list": "List all the checks",
-                    "show": "Display the check information"
+                    "debug": "Enable/disable debug for NFS service"
                 }
             },
-            "nfs_export": {
-                "title": "(deprecated)",
+            "smb": {
+                "title": "Manage SMB service diagnostics and debug",
                 "subcommands": {
-                    "add": "(deprecated)",
-                    "list": "(deprecated)",
-                    "remove": "(deprecated)"
+                    "debug": "Enable/disable debug for SMB service"
                 }
-            },
-            "smb_export": {
-                "title": "(deprecated)",
+            }
+        }
+    },
+    "export": {
+        "title": "Export management",
+        "subcommands": {
+            "nfs": {
+                "title": "NFS Export management",
                 "subcommands": {
-                    "add": "(deprecated)",
-                    "list": "(deprecated)",
-                    "remove": "(deprecated)"
+                    "add": "Add a new export",
+                    "list": "List exports",
+                    "load": "Load exports from conf",
+                    "remove": "Remove exports",
+                    "show": "Show export(s)",
+                    "update": "Update an existing export"
                 }
             },
-            "restart": {"title": "(deprecated)"},
-            "start": {"title": "(deprecated)"},
-            "stop": {"title": "(deprecated)"},
-            "status": {"title": "(deprecated)"}
+            "smb": {
+                "title": "SMB Export management",
+                "subcommands": {
+                    "add": "Add a new export",
+                    "list": "List exports",
+                    "load": "Load exports from conf",
+                    "remove": "Remove exports",
+                    "show": "Show export(s)",
+                    "update": "Update an existing export"
+                }
+            }
+        }
+    },
+    "filesystem": {
+        "title": "File system (export root) management",
+        "subcommands": {
+            "add": "Add a new file system",
+            "list": "List file system(s)",
+            "remove": "Remove a file system"
+        }
+    },
+    "node": {
+        "title": "Node specific operations",
+        "subcommands": {
+            "add": "Add a new node to the cluster",
+            "remove": "Remove a node from the cluster",
+            "rename": "Rename the specific node",
+            "restart": "Restart the NSDS services on the current node",
+            "start": "Start the NSDS services on the current node",
+            "status": "Show the current node status",
+            "stop": "Stop the NSDS services on the current node"
         }
+    },
+    "prereq": {
+        "title": "Run or test the prerequisites checks",
+        "subcommands": {
+            "check": "Runs the prerequisites checks on given nodes and displays results",
+            "list": "List all the checks",
+            "show": "Display the check information"
+        }
+    },
+    "nfs_export": {
+        "title": "(deprecated)",
+        "subcommands": {
+            "add": "(deprecated)",
+            "list": "(deprecated)",
+            "remove": "(deprecated)"
+        }
+    },
+    "smb_export": {
+        "title": "(deprecated)",
+        "subcommands": {
+            "add": "(deprecated)",
+            "list": "(deprecated)",
+            "remove": "(deprecated)"
+        }
+    },
+    "restart": {"title": "(deprecated)"},
+    "start": {"title": "(deprecated)"},
+    "stop": {"title": "(deprecated)"},
+    "status": {"title": "(deprecated)"}
+}
+
+
+class CommandStructure:
+    def __init__(self, commands: Optional[Mapping] = None):
+        # The tree parsed from `nsds -t`, shared by every instance in the process
+        self.commands = commands if commands is not None else get_command_tree(BUILTIN_COMMANDS)
 
     def get_main_categories(self) -> List[str]:
         """Get list of main command categories"""
@@ -213,37 +221,29 @@ class CommandStructure:
             return self.commands.get(category, {}).get("subcommands", {}).get(subcategory, {}).get("subcommands", {})
         return self.commands.get(category, {}).get("subcommands", {})
 
-    def search_commands(self, query: str) -> List[Tuple[str, str, str]]:
+    def resolve_command(self, parts: List[str]) -> Optional[List[str]]:
         """
-        Search through all commands and subcommands
-        Returns: List of tuples (full_path, command_type, description)
+        Match the leading words of a command (without the 'nsds' prefix) against the tree
+        Returns: Path to the leaf command, or None if the words don't name one
         """
-        results = []
-        query = query.lower()
+        node = {"subcommands": self.commands}
+        path = []
+        for part in parts:
+            subcommands = node.get("subcommands", {})
+            if part not in subcommands:
+                return None
+            node = subcommands[part]
+            path.append(part)
+            if not isinstance(node, dict):
+                return path
+        return None
 
-        def search_nested(category: str, data: dict, current_path: List[str]):
-            if "title" in data:
-                title = data["title"].lower()
-                if query in title:
-                    results.append((" ".join(current_path), "category", data["title"]))
-
-            if "subcommands" in data:
-                subcommands = data["subcommands"]
-                for cmd, value in subcommands.items():
-                    cmd_path = current_path + [cmd]
-                    if isinstance(value, dict):
-                        search_nested(category, value, cmd_path)
-                    else:
-                        if query in cmd.lower() or query in value.lower():
-                            results.append((" ".join(cmd_path), "command", value))
-
-        # Search through all categories
-        for category, data in self.commands.items():
-            if query in category.lower():
-                results.append((category, "category", data.get("title", "")))
-            search_nested(category, data, [category])
-
-        return results
+    def search_commands(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, str, str]]:
+        """
+        Search through all commands and subcommands, best matches first
+        Returns: List of tuples (full_path, command_type, description)
+        """
+        return get_command_index(self.commands).search(query, limit)
 
     def get_command_description(self, category: str, command: str) -> str:
         """Get description for a command"""
@@ -27,74 +27,122 @@ print_command() {
     echo -e "${CYAN}$1${NC} -> $2"
 }
 
+# Tree entries take the indentation drawn for their ancestors, then the name
+# and the description; nested entries are indented four columns per level
 print_tree_item() {
-    echo -e "├── ${YELLOW}$1${NC} -> $2"
+    echo -e "$1├── ${YELLOW}$2${NC} -> $3"
 }
 
 print_tree_last() {
-    echo -e "└── ${YELLOW}$1${NC} -> $2"
+    echo -e "$1└── ${YELLOW}$2${NC} -> $3"
 }
 
+NSDS_VERSION="1.0.0-stub"
+
+# Version, used to tell when a cached copy of the command tree is stale
+if [[ "$1" == "--version" ]]; then
+    echo "nsds $NSDS_VERSION"
+    exit 0
+fi
+
 # Check if help is requested
 if [[ "$1" == "-t" || "$1" == "--tree" ]]; then
     print_header "NSDS CLI Subcommands:"
-    
-    # Auth section
+
     print_command "auth" "Auth management for NFS/SMB services"
-    print_tree_item "clean" "Remove the auth configuration"
-    print_tree_item "commit" "Commit the edited auth configuration"
-    print_tree_item "edit" "Edit the auth configuration"
-    print_tree_item "init" "Initialize the authentication configuration"
-    print_tree_last "show" "Display the current auth configuration"
-    
-    # Cluster section
+    print_tree_item "" "clean" "Remove the auth configuration"
+    print_tree_item "" "commit" "Commit the edited auth configuration"
+    print_tree_item "" "edit" "Edit the auth configuration"
+    print_tree_item "" "init" "Initialize the authentication configuration"
+    print_tree_last "" "show" "Display the current auth configuration"
     print_command "cluster" "Cluster wide operations"
-    print_tree_item "destroy" "Stop and remove nsds components from all the nodes in the cluster"
-    print_tree_item "init" "Create and initialize the NSDS cluster"
-    print_tree_item "rename" "Rename the cluster"
-    print_tree_item "restart" "Restart the NSDS services on all the nodes in the cluster"
-    print_tree_item "start" "Start the NSDS services on all the nodes in the cluster"
-    print_tree_item "status" "Display the cluster status"
-    print_tree_last "stop" "Stop the NSDS services on all the nodes in the cluster"
-    
-    # Config section
+    print_tree_item "" "destroy" "Stop and remove nsds components from all the nodes in the cluster"
+    print_tree_item "" "init" "Create and initialize the NSDS cluster"
+    print_tree_item "" "rename" "Rename the cluster"
+    print_tree_item "" "restart" "Restart the NSDS services on all the nodes in the cluster"
+    print_tree_item "" "start" "Start the NSDS services on all the nodes in the cluster"
+    print_tree_item "" "status" "Display the cluster status"
+    print_tree_last "" "stop" "Stop the NSDS services on all the nodes in the cluster"
     print_command "config" "Configuration management"
-    print_tree_item "cluster" "Cluster config operations"
-    print_tree_item "backup" "Backup the configurations of nsds components"
-    print_tree_last "list" "Display the current cluster configurations"
-    print_tree_item "docker" "Control NSDS docker (container) parameters"
-    print_tree_item "list" "Show current docker runtime options"
-    print_tree_last "update" "Update docker runtime options"
-    print_tree_item "file" "List/Edit various config files"
-    print_tree_item "list" "List the config files"
-    print_tree_last "update" "Update NSDS config file"
-    print_tree_item "nfs" "NFS global config operations"
-    print_tree_item "disable" "Disable the NFS service"
-    print_tree_item "enable" "Enable the NFS service"
-    print_tree_item "list" "List NFS global config"
-    print_tree_item "update" "Update NFS config"
-    print_tree_last "feature" "NFS related feature operations"
-    print_tree_item "node" "Config operations related to node"
-    print_tree_item "list" "List node-specific config options"
-    print_tree_last "update" "Update node-specific config options"
-    print_tree_item "smb" "SMB global config operations"
-    print_tree_item "disable" "Disable the SMB service"
-    print_tree_item "enable" "Enable the SMB service"
-    print_tree_item "list" "List SMB global config"
-    print_tree_item "update" "Update the SMB global config"
-    print_tree_last "feature" "SMB related feature operations"
-    print_tree_last "upgrade" "Check or apply the NSDS config upgrades"
-    
-    # More sections
+    print_tree_item "" "cluster" "Cluster config operations"
+    print_tree_item "│   " "backup" "Backup the configurations of nsds components"
+    print_tree_last "│   " "list" "Display the current cluster configurations"
+    print_tree_item "" "docker" "Control NSDS docker (container) parameters"
+    print_tree_item "│   " "list" "Show current docker runtime options"
+    print_tree_last "│   " "update" "Update docker runtime options"
+    print_tree_item "" "file" "List/Edit various config files"
+    print_tree_item "│   " "list" "List the config files"
+    print_tree_last "│   " "update" "Update NSDS config file"
+    print_tree_item "" "nfs" "NFS global config operations"
+    print_tree_item "│   " "disable" "Disable the NFS service"
+    print_tree_item "│   " "enable" "Enable the NFS service"
+    print_tree_item "│   " "list" "List NFS global config"
+    print_tree_item "│   " "update" "Update NFS config"
+    print_tree_last "│   " "feature" "NFS related feature operations"
+    print_tree_item "│       " "list" "Get the list of available features and feature values"
+    print_tree_last "│       " "update" "Set the feature value"
+    print_tree_item "" "node" "Config operations related to node"
+    print_tree_item "│   " "list" "List node-specific config options"
+    print_tree_last "│   " "update" "Update node-specific config options"
+    print_tree_item "" "smb" "SMB global config operations"
+    print_tree_item "│   " "disable" "Disable the SMB service"
+    print_tree_item "│   " "enable" "Enable the SMB service"
+    print_tree_item "│   " "list" "List SMB global config"
+    print_tree_item "│   " "update" "Update the SMB global config"
+    print_tree_last "│   " "feature" "SMB related feature operations"
+    print_tree_item "│       " "list" "Get the list of available features and feature values"
+    print_tree_last "│       " "update" "Set the feature value"
+    print_tree_last "" "upgrade" "Check or apply the NSDS config upgrades"
+    print_tree_item "    " "apply" "Apply NSDS config upgrades on all nodes"
+    print_tree_item "    " "check" "Check if NSDS config can be upgraded on all the nodes"
+    print_tree_last "    " "status" "Check the upgrade status of all the nodes"
     print_command "diag" "Diagnostics and debugging"
+    print_tree_item "" "collect" "Collect the support bundle for nsds nodes"
+    print_tree_item "" "lustre" "Manage Lustre client diagnostics and debug"
+    print_tree_last "│   " "debug" "Enable/disable debug for lustre client"
+    print_tree_item "" "nfs" "Manage NFS service diagnostics and debug"
+    print_tree_last "│   " "debug" "Enable/disable debug for NFS service"
+    print_tree_last "" "smb" "Manage SMB service diagnostics and debug"
+    print_tree_last "    " "debug" "Enable/disable debug for SMB service"
     print_command "export" "Export management"
+    print_tree_item "" "nfs" "NFS Export management"
+    print_tree_item "│   " "add" "Add a new export"
+    print_tree_item "│   " "list" "List exports"
+    print_tree_item "│   " "load" "Load exports from conf"
+    print_tree_item "│   " "remove" "Remove exports"
+    print_tree_item "│   " "show" "Show export(s)"
+    print_tree_last "│   " "update" "Update an existing export"
+    print_tree_last "" "smb" "SMB Export management"
+    print_tree_item "    " "add" "Add a new export"
+    print_tree_item "    " "list" "List exports"
+    print_tree_item "    " "load" "Load exports from conf"
+    print_tree_item "    " "remove" "Remove exports"
+    print_tree_item "    " "show" "Show export(s)"
+    print_tree_last "    " "update" "Update an existing export"
     print_command "filesystem" "File system (export root) management"
+    print_tree_item "" "add" "Add a new file system"
+    print_tree_item "" "list" "List file system(s)"
+    print_tree_last "" "remove" "Remove a file system"
     print_command "node" "Node specific operations"
+    print_tree_item "" "add" "Add a new node to the cluster"
+    print_tree_item "" "remove" "Remove a node from the cluster"
+    print_tree_item "" "rename" "Rename the specific node"
+    print_tree_item "" "restart" "Restart the NSDS services on the current node"
+    print_tree_item "" "start" "Start the NSDS services on the current node"
+    print_tree_item "" "status" "Show the current node status"
+    print_tree_last "" "stop" "Stop the NSDS services on the current node"
     print_command "prereq" "Run or test the prerequisites checks"
-    
-    # Deprecated commands
+    print_tree_item "" "check" "Runs the prerequisites checks on given nodes and displays results"
+    print_tree_item "" "list" "List all the checks"
+    print_tree_last "" "show" "Display the check information"
     print_command "nfs_export" "(deprecated)"
+    print_tree_item "" "add" "(deprecated)"
+    print_tree_item "" "list" "(deprecated)"
+    print_tree_last "" "remove" "(deprecated)"
     print_command "smb_export" "(deprecated)"
+    print_tree_item "" "add" "(deprecated)"
+    print_tree_item "" "list" "(deprecated)"
+    print_tree_last "" "remove" "(deprecated)"
     print_command "restart" "(deprecated)"
     print_command "start" "(deprecated)"
     print_command "stop" "(deprecated)"
@@ -0,0 +1,131 @@
+import os
+import re
+import shlex
+from typing import Dict, List, Optional
+
+from ansi import strip_ansi
+
+# "Key: value" lines such as "Cluster Name: NSDS-Main"
+_FIELD_PATTERN = re.compile(r"^([A-Za-z][\w ./-]*?):\s+(\S.*)$")
+
+_INT_PATTERN = re.compile(r"^[+-]?\d+$")
+_FLOAT_PATTERN = re.compile(r"^[+-]?(\d+\.\d*|\.\d+)([eE][+-]?\d+)?$")
+
+# Column names of the tables nsds prints, keyed on the title line above them
+KNOWN_COLUMNS = {
+    "Node Status": ["Node", "Status", "IP Address", "Role"],
+    "Services Status": ["Service", "Status", "Nodes"],
+}
+
+
+def _split_row(line: str) -> List[str]:
+    return [cell.strip() for cell in line.split("|")]
+
+
+def _convert_column(values: List[str]) -> list:
+    """Convert a column to ints or floats when every non-empty cell allows it"""
+    cells = [value for value in values if value]
+    if cells and all(_INT_PATTERN.match(value) for value in cells):
+        return [int(value) if value else None for value in values]
+    if cells and all(_INT_PATTERN.match(value) or _FLOAT_PATTERN.match(value) for value in cells):
+        return [float(value) if value else None for value in values]
+    return values
+
+
+class ParsedTable:
+    """A pipe-delimited table stored column by column"""
+
+    def __init__(self, title: str, columns: List[str], rows: List[List[str]]):
+        self.title = title
+        self.columns: Dict[str, list] = {
+            name: _convert_column([row[index] for row in rows])
+            for index, name in enumerate(columns)
+        }
+        self.row_count = len(rows)
+        self._frame = None
+
+    def column(self, name: str):
+        """Return a column as a NumPy array"""
+        import numpy as np
+        return np.asarray(self.columns[name])
+
+    def to_dataframe(self):
+        """Return the table as a pandas DataFrame, built once and reused"""
+        if self._frame is None:
+            import pandas as pd
+            self._frame = pd.DataFrame(self.columns)
+        return self._frame
+
+    def filter(self, query: str):
+        """Rows of the DataFrame with a cell containing the query (case-insensitive)"""
+        frame = self.to_dataframe()
+        if not query:
+            return frame
+        mask = frame.astype(str).apply(
+            lambda column: column.str.contains(query, case=False, regex=False)
+        ).any(axis=1)
+        return frame[mask]
+
+
+class ParsedOutput:
+    """Structured view of an nsds command's output"""
+
+    def __init__(self, fields: Dict[str, str], tables: List[ParsedTable]):
+        self.fields = fields
+        self.tables = tables
+
+    def __bool__(self) -> bool:
+        return bool(self.fields or self.tables)
+
+
+def is_nsds_command(command: str) -> bool:
+    try:
+        parts = shlex.split(command)
+    except ValueError:
+        return False
+    return bool(parts) and os.path.basename(parts[0]) == "nsds"
+
+
+def parse_output(command: str, output: str) -> Optional[ParsedOutput]:
+    """
+    Parse the output of an nsds command into key/value fields and tables.
+    Consecutive lines with the same number of '|' separated cells form a
+    table; the non-empty line just above names it. Returns None for other
+    commands or when nothing structured was found.
+    """
+    if not is_nsds_command(command):
+        return None
+
+    fields = {}
+    tables = []
+    title = ""
+    rows: List[List[str]] = []
+
+    def finish_table():
+        if rows:
+            names = KNOWN_COLUMNS.get(title)
+            if names is None or len(names) != len(rows[0]):
+                names = [f"Column {index + 1}" for index in range(len(rows[0]))]
+            tables.append(ParsedTable(title, names, rows))
+        rows.clear()
+
+    for line in strip_ansi(output).splitlines():
+        stripped = line.strip()
+        if "|" in stripped:
+            cells = _split_row(stripped)
+            if rows and len(cells) != len(rows[0]):
+                finish_table()
+            rows.append(cells)
+            continue
+
+        finish_table()
+        if not stripped:
+            continue
+        title = stripped.rstrip(":").strip("= ").strip()
+        match = _FIELD_PATTERN.match(stripped)
+        if match:
+            fields[match.group(1)] = match.group(2).strip()
+    finish_table()
+
+    parsed = ParsedOutput(fields, tables)
+    return parsed if parsed else None
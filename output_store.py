@@ -0,0 +1,590 @@
+import mmap
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# Default capacity limits for a single command's output
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_LINES = 100000
+
+# Upper bound for output spilled to disk before the oldest data is dropped
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+# Small appends are staged and joined into chunks of roughly this size so
+# that the chunk deque does not fill up with thousands of tiny strings
+CHUNK_SIZE = 64 * 1024
+
+# Searches read spilled output in blocks of this size, taking the lock per block
+SEARCH_BLOCK_SIZE = 1024 * 1024
+DEFAULT_MAX_SEARCH_RESULTS = 1000
+
+# The line index keeps the start offset of every LINE_INDEX_STRIDE-th line;
+# lines in between are found by scanning forward from the nearest one
+LINE_INDEX_STRIDE = 64
+
+
+def _text_size(text: str) -> int:
+    """Return the UTF-8 size of text without encoding pure ASCII strings"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-8', errors='replace'))
+
+
+def _line_ends(text: str) -> List[int]:
+    """Return the UTF-8 offset just past each newline in text"""
+    data = text if text.isascii() else text.encode('utf-8', errors='replace')
+    pieces = data.split('\n' if isinstance(data, str) else b'\n')
+    ends = list(accumulate(len(piece) + 1 for piece in pieces))
+    ends.pop()
+    return ends
+
+
+class SearchHit(NamedTuple):
+    """A line matching a search"""
+    line: int  # line number, as used by read_lines
+    offset: int  # absolute byte offset of the match
+    text: str
+
+
+class OutputStore:
+    """
+    Chunked, capacity-bounded store for command output.
+    Appends are O(1) amortized; once the byte or line limit is exceeded the
+    oldest chunks are evicted and a truncation marker is prepended on read.
+
+    With spill_to_disk enabled, output that outgrows the in-memory limits is
+    moved to an anonymous temp file instead and read back through an mmap
+    view, so only the requested byte ranges are ever materialized.
+
+    A sparse line-offset index is kept up to date on every append, so any
+    range of lines can be read by scanning at most LINE_INDEX_STRIDE lines
+    rather than the whole output. Line numbers count from the start of the
+    command's output and keep counting after older lines are evicted.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_lines: int = DEFAULT_MAX_LINES,
+                 spill_to_disk: bool = False, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.spill_to_disk = spill_to_disk
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._chunks = deque()  # (text, size, line_count) tuples
+        self._staged = []
+        self._staged_size = 0
+        self._staged_lines = 0
+        self._size = 0
+        self._lines = 0
+        self._truncated_bytes = 0
+        self._cached_value = None
+
+        # Absolute byte offset where every LINE_INDEX_STRIDE-th line starts;
+        # entry i is line number (self._mark_base + i) * LINE_INDEX_STRIDE
+        self._line_marks = array('q', [0])
+        self._mark_base = 0
+        self._line_total = 0  # newlines ever appended, the number of the newest line
+        self._last_line_start = 0
+
+        # Disk backing, only used once the output has been spilled
+        self._file = None
+        self._mmap = None
+        self._start = 0  # file offset of the first retained byte
+        self._end = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def line_count(self) -> int:
+        return self._lines
+
+    @property
+    def truncated_bytes(self) -> int:
+        return self._truncated_bytes
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    @property
+    def end_offset(self) -> int:
+        """Absolute byte offset just past the newest output"""
+        return self._truncated_bytes + self._size
+
+    def append(self, text: str) -> None:
+        """Append a chunk of output, evicting or spilling the oldest data if over capacity"""
+        if not text:
+            return
+
+        with self._lock:
+            self._cached_value = None
+
+            self._index_lines(text)
+            if self._file is not None:
+                self._append_to_disk(text.encode('utf-8', errors='replace'), text.count('\n'))
+                return
+
+            size = _text_size(text)
+            lines = text.count('\n')
+            self._staged.append(text)
+            self._staged_size += size
+            self._staged_lines += lines
+            self._size += size
+            self._lines += lines
+
+            if self._staged_size >= CHUNK_SIZE:
+                self._flush_staged()
+
+            if self._size > self.max_bytes or self._lines > self.max_lines:
+                self._flush_staged()
+                if self.spill_to_disk:
+                    self._spill()
+                else:
+                    self._evict()
+
+    def clear(self) -> None:
+        """Discard all stored output and release any disk backing"""
+        with self._lock:
+            self._chunks.clear()
+            self._staged = []
+            self._staged_size = 0
+            self._staged_lines = 0
+            self._size = 0
+            self._lines = 0
+            self._truncated_bytes = 0
+            self._cached_value = None
+            self._line_marks = array('q', [0])
+            self._mark_base = 0
+            self._line_total = 0
+            self._last_line_start = 0
+            self._close_file()
+
+    def close(self) -> None:
+        """Release the disk backing, if any"""
+        self.clear()
+
+    def getvalue(self) -> str:
+        """
+        Return the stored output, prefixed with a marker if data was evicted.
+        Spilled output is capped at the in-memory byte limit and read from the
+        end of the file.
+        """
+        with self._lock:
+            if self._cached_value is None:
+                if self._file is not None:
+                    hidden = self._truncated_bytes + max(0, self._size - self.max_bytes)
+                    text = self._read_disk(max(0, self._size - self.max_bytes), self._size)
+                    marker = f"[... truncated {hidden} bytes ...]\n" if hidden else None
+                else:
+                    self._flush_staged()
+                    text = "".join(chunk for chunk, _, _ in self._chunks)
+                    marker = self._truncation_marker()
+                self._cached_value = marker + text if marker else text
+            return self._cached_value
+
+    def tail(self, max_bytes: int) -> str:
+        """Return roughly the last max_bytes bytes of output"""
+        with self._lock:
+            return self._read(max(0, self._size - max_bytes), self._size)
+
+    def read_from(self, offset: int, max_bytes: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Return the retained output from absolute offset onwards, or only its
+        last max_bytes bytes, and the absolute offset to continue from
+        """
+        with self._lock:
+            start = max(0, offset - self._truncated_bytes)
+            if max_bytes is not None:
+                start = max(start, self._size - max_bytes)
+            return self._read(start, self._size), self._truncated_bytes + self._size
+
+    def read_range(self, start: int, end: Optional[int] = None) -> str:
+        """Return the output between two byte offsets of the retained data"""
+        with self._lock:
+            end = self._size if end is None else min(end, self._size)
+            return self._read(max(0, start), end)
+
+    def line_span(self) -> Tuple[int, int]:
+        """
+        Return (first, end): the numbers of the first retained line and one
+        past the last. A trailing line without a newline counts as a line.
+        """
+        with self._lock:
+            end = self._line_total + (self._last_line_start < self._truncated_bytes + self._size)
+            return self._first_line(), end
+
+    def read_lines(self, first: int, count: int) -> List[str]:
+        """Return up to count lines starting at line number first, without their newlines"""
+        with self._lock:
+            first = max(first, self._first_line())
+            if count <= 0 or first > self._line_total:
+                return []
+            start = self._line_start(first)
+            end = self._line_start(first + count) if first + count <= self._line_total else self.end_offset
+            text = self._read(start - self._truncated_bytes, end - self._truncated_bytes)
+        lines = text.split('\n')
+        if lines and not lines[-1] and text.endswith('\n'):
+            lines.pop()
+        return lines[:count]
+
+    def line_at_offset(self, offset: int) -> int:
+        """Return the number of the line containing a byte offset of the retained data"""
+        with self._lock:
+            position = self._truncated_bytes + offset
+            line, start = self._offset_anchor(position)
+            return line + self._count_newlines(start, position)
+
+    def search(self, pattern: str, regex: bool = False, ignore_case: bool = False,
+               max_results: int = DEFAULT_MAX_SEARCH_RESULTS, start: int = 0) -> Tuple[List[SearchHit], int]:
+        """
+        Find lines matching a substring or regular expression.
+        The output is scanned as UTF-8 bytes a chunk or block at a time, so it
+        is never joined into one string; ignore_case only folds ASCII.
+        Only complete lines from absolute offset start onwards are searched.
+        Returns the hits (at most max_results, one per line) and the offset to
+        pass as start to continue once more output has arrived.
+        ^ and $ match at the start and end of each line.
+        Raises re.error for an invalid regular expression.
+        """
+        source = pattern.encode('utf-8') if regex else re.escape(pattern.encode('utf-8'))
+        compiled = re.compile(source, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+        matches = []  # (absolute offset, line text)
+        carry = b""
+        carry_start = start
+        for offset, data in self._iter_blocks(start):
+            if not carry:
+                carry_start = offset
+            buffer = carry + data if carry else data
+            # Only search up to the last newline; the rest waits for the next block
+            cut = buffer.rfind(b"\n") + 1
+            carry = buffer[cut:]
+            if cut:
+                resume = self._scan(compiled, buffer, cut, carry_start, matches, max_results)
+                if resume is not None:
+                    return self._resolve_hits(matches), resume
+            carry_start += cut
+
+        return self._resolve_hits(matches), carry_start
+
+    @staticmethod
+    def _scan(compiled, buffer: bytes, end: int, base: int, matches: list,
+              max_results: int) -> Optional[int]:
+        """
+        Collect one match per line from buffer[:end]
+        Returns the absolute offset after the last matching line once max_results is reached
+        """
+        position = 0
+        while position < end:
+            match = compiled.search(buffer, position, end)
+            if match is None:
+                break
+            line_start = buffer.rfind(b"\n", 0, match.start()) + 1
+            line_end = buffer.find(b"\n", match.start(), end)
+            line_end = end if line_end < 0 else line_end
+            text = buffer[line_start:line_end].decode('utf-8', errors='replace')
+            matches.append((base + match.start(), text))
+            position = line_end + 1
+            if len(matches) >= max_results:
+                return base + position
+        return None
+
+    def _iter_blocks(self, start: int) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield (absolute offset, bytes) blocks of the retained output from start.
+        In memory the chunk list is snapshotted and encoded chunk by chunk;
+        on disk each block is copied under the lock so appends are never held up.
+        """
+        with self._lock:
+            if self._file is None:
+                self._flush_staged()
+                chunks = [(text, size) for text, size, _ in self._chunks]
+                offset = self._truncated_bytes
+            else:
+                chunks = None
+
+        if chunks is not None:
+            for text, size in chunks:
+                if offset + size > start:
+                    data = text.encode('utf-8', errors='replace')
+                    yield max(offset, start), data[max(0, start - offset):]
+                offset += size
+            return
+
+        position = start
+        while True:
+            with self._lock:
+                if self._file is None:
+                    return
+                position = max(position, self._truncated_bytes)
+                relative = position - self._truncated_bytes
+                if relative >= self._size:
+                    return
+                view = self._view()
+                length = min(SEARCH_BLOCK_SIZE, self._size - relative)
+                data = view[self._start + relative:self._start + relative + length]
+            yield position, data
+            position += length
+
+    def _resolve_hits(self, matches: list) -> List[SearchHit]:
+        """Turn match offsets into line numbers, skipping lines evicted meanwhile"""
+        hits = []
+        previous = None  # (line, offset) of the previous hit, which may be a closer anchor
+        with self._lock:
+            for offset, text in matches:
+                if offset < self._truncated_bytes:
+                    continue
+                line, start = self._offset_anchor(offset)
+                if previous is not None and start <= previous[1] <= offset:
+                    line, start = previous
+                line += self._count_newlines(start, offset)
+                hits.append(SearchHit(line, offset, text))
+                previous = (line, offset)
+        return hits
+
+    def _first_line(self) -> int:
+        """Number of the line containing the first retained byte (lock must be held)"""
+        return self._line_total - self._lines
+
+    def _line_anchor(self, line: int) -> Tuple[int, int]:
+        """
+        Nearest indexed (line number, absolute offset) at or before the start
+        of a retained line (lock must be held)
+        Lines whose mark was evicted are found from the first retained byte.
+        """
+        mark = line // LINE_INDEX_STRIDE - self._mark_base
+        if 0 <= mark < len(self._line_marks) and self._line_marks[mark] >= self._truncated_bytes:
+            return line - line % LINE_INDEX_STRIDE, self._line_marks[mark]
+        return self._first_line(), self._truncated_bytes
+
+    def _offset_anchor(self, position: int) -> Tuple[int, int]:
+        """Nearest indexed (line number, absolute offset) at or before a retained byte (lock must be held)"""
+        mark = bisect_right(self._line_marks, position) - 1
+        if mark >= 0 and self._line_marks[mark] >= self._truncated_bytes:
+            return (self._mark_base + mark) * LINE_INDEX_STRIDE, self._line_marks[mark]
+        return self._first_line(), self._truncated_bytes
+
+    def _line_start(self, line: int) -> int:
+        """Absolute offset where a retained line starts, clamped to the retained data (lock must be held)"""
+        anchor, start = self._line_anchor(line)
+        return self._skip_lines(start, line - anchor)
+
+    def _count_newlines(self, start: int, end: int) -> int:
+        """Count the newlines between two absolute offsets of the retained data (lock must be held)"""
+        return self._read(start - self._truncated_bytes, end - self._truncated_bytes).count('\n')
+
+    def _skip_lines(self, start: int, count: int) -> int:
+        """Absolute offset just past the count-th newline from absolute offset start (lock must be held)"""
+        if count <= 0:
+            return start
+        if self._file is not None:
+            view = self._view()
+            position = self._start + start - self._truncated_bytes
+            for _ in range(count):
+                position = view.find(b'\n', position, self._end) + 1
+            return position - self._start + self._truncated_bytes
+
+        self._flush_staged()
+        offset = self._truncated_bytes
+        for text, size, _ in self._chunks:
+            if offset + size > start:
+                data = text if text.isascii() else text.encode('utf-8', errors='replace')
+                newline = '\n' if isinstance(data, str) else b'\n'
+                position = max(0, start - offset)
+                while count:
+                    found = data.find(newline, position)
+                    if found < 0:
+                        break
+                    position = found + 1
+                    count -= 1
+                if not count:
+                    return offset + position
+            offset += size
+        return offset
+
+    def _index_lines(self, text: str) -> None:
+        """Record where the lines in newly appended text start (lock must be held)"""
+        newlines = text.count('\n')
+        if not newlines:
+            return
+        base = self._truncated_bytes + self._size
+        # The first newline in text that starts an indexed line
+        first = LINE_INDEX_STRIDE - self._line_total % LINE_INDEX_STRIDE
+        if newlines >= first:
+            ends = _line_ends(text)
+            self._line_marks.extend(base + end for end in ends[first - 1::LINE_INDEX_STRIDE])
+            self._last_line_start = base + ends[-1]
+        else:
+            self._last_line_start = base + _text_size(text[:text.rindex('\n') + 1])
+        self._line_total += newlines
+
+    def _trim_index(self) -> None:
+        """Forget marks of lines that were evicted (lock must be held)"""
+        # The first retained line may have lost its head, so lookups anchor
+        # it at the first retained byte rather than at a mark
+        first_mark = -(-self._first_line() // LINE_INDEX_STRIDE)
+        drop = min(len(self._line_marks), first_mark - self._mark_base)
+        if drop > 0:
+            del self._line_marks[:drop]
+            self._mark_base += drop
+
+    def _truncation_marker(self) -> Optional[str]:
+        if not self._truncated_bytes:
+            return None
+        return f"[... truncated {self._truncated_bytes} bytes ...]\n"
+
+    def _read(self, start: int, end: int) -> str:
+        """Decode the retained bytes in [start, end) (lock must be held)"""
+        if start >= end:
+            return ""
+        if self._file is not None:
+            return self._read_disk(start, end)
+
+        self._flush_staged()
+        pieces = []
+        offset = 0
+        for text, size, _ in self._chunks:
+            chunk_end = offset + size
+            if chunk_end > start:
+                if offset >= start and chunk_end <= end:
+                    pieces.append(text)
+                else:
+                    data = text.encode('utf-8', errors='replace')
+                    pieces.append(data[max(0, start - offset):end - offset].decode('utf-8', errors='replace'))
+            if chunk_end >= end:
+                break
+            offset = chunk_end
+        return "".join(pieces)
+
+    def _flush_staged(self) -> None:
+        """Join staged small appends into a single chunk (lock must be held)"""
+        if not self._staged:
+            return
+        text = self._staged[0] if len(self._staged) == 1 else "".join(self._staged)
+        self._chunks.append((text, self._staged_size, self._staged_lines))
+        self._staged = []
+        self._staged_size = 0
+        self._staged_lines = 0
+
+    def _evict(self) -> None:
+        """Drop the oldest data until both limits are respected (lock must be held)"""
+        # Evict down to a low-water mark so that trimming runs once per
+        # chunk's worth of new output rather than on every append
+        target_bytes = self.max_bytes - min(CHUNK_SIZE, self.max_bytes // 4)
+        target_lines = self.max_lines - max(1, self.max_lines // 10)
+
+        while self._chunks and (self._size > target_bytes or self._lines > target_lines):
+            text, size, lines = self._chunks[0]
+            excess_bytes = self._size - target_bytes
+            excess_lines = self._lines - target_lines
+
+            if (excess_bytes > 0 and size <= excess_bytes) or (excess_lines > 0 and lines <= excess_lines):
+                self._chunks.popleft()
+                self._drop(size, lines)
+                continue
+
+            # Trim the head of the oldest chunk instead of dropping it whole
+            cut = 0
+            if excess_lines > 0:
+                for _ in range(excess_lines):
+                    cut = text.index('\n', cut) + 1
+            if excess_bytes > 0:
+                cut = max(cut, self._char_offset_for_bytes(text, excess_bytes))
+            remaining = text[cut:]
+            removed_size = size - _text_size(remaining)
+            removed_lines = lines - remaining.count('\n')
+            self._drop(removed_size, removed_lines)
+            if remaining:
+                self._chunks[0] = (remaining, size - removed_size, lines - removed_lines)
+            else:
+                self._chunks.popleft()
+        self._trim_index()
+
+    @staticmethod
+    def _char_offset_for_bytes(text: str, byte_count: int) -> int:
+        """Return the smallest character offset whose prefix is at least byte_count bytes"""
+        if text.isascii():
+            return min(byte_count, len(text))
+        encoded = text.encode('utf-8', errors='replace')[:byte_count]
+        offset = len(encoded.decode('utf-8', errors='ignore'))
+        if _text_size(text[:offset]) < byte_count:
+            offset += 1
+        return min(offset, len(text))
+
+    def _drop(self, size: int, lines: int) -> None:
+        self._size -= size
+        self._lines -= lines
+        self._truncated_bytes += size
+
+    def _spill(self) -> None:
+        """Move the in-memory chunks to a temp file (lock must be held)"""
+        self._file = tempfile.TemporaryFile(prefix="cli2gui-output-")
+        for text, _, _ in self._chunks:
+            self._file.write(text.encode('utf-8', errors='replace'))
+        self._chunks.clear()
+        self._start = 0
+        self._end = self._file.tell()
+        self._size = self._end
+
+    def _append_to_disk(self, data: bytes, lines: int) -> None:
+        """Write encoded output to the disk backing (lock must be held)"""
+        self._file.write(data)
+        self._end += len(data)
+        self._size += len(data)
+        self._lines += lines
+
+        if self._size > self.max_disk_bytes:
+            target = self.max_disk_bytes - min(CHUNK_SIZE * 16, self.max_disk_bytes // 4)
+            new_start = self._end - target
+            view = self._view()
+            self._lines -= view[self._start:new_start].count(b'\n')
+            self._truncated_bytes += new_start - self._start
+            self._start = new_start
+            self._size = self._end - self._start
+            self._trim_index()
+
+            # Compact once the dead prefix outweighs the live data
+            if self._start > self._size:
+                self._compact()
+
+    def _compact(self) -> None:
+        """Copy the retained data to a fresh temp file (lock must be held)"""
+        view = self._view()
+        new_file = tempfile.TemporaryFile(prefix="cli2gui-output-")
+        for offset in range(self._start, self._end, CHUNK_SIZE * 16):
+            new_file.write(view[offset:min(offset + CHUNK_SIZE * 16, self._end)])
+        self._close_file()
+        self._file = new_file
+        self._start = 0
+        self._end = self._size
+
+    def _view(self) -> mmap.mmap:
+        """Return a read-only mmap covering everything written so far (lock must be held)"""
+        self._file.flush()
+        if self._mmap is None or len(self._mmap) < self._end:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._end, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _read_disk(self, start: int, end: int) -> str:
+        """Decode retained bytes in [start, end) from the disk backing (lock must be held)"""
+        if start >= end:
+            return ""
+        view = self._view()
+        return view[self._start + start:self._start + end].decode('utf-8', errors='replace')
+
+    def _close_file(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._start = 0
+        self._end = 0
@@ -0,0 +1,242 @@
+import html
+import re
+
+import streamlit as st
+
+from ansi import ansi_to_html
+
+# Lines shown at once, and extra lines rendered above and below them
+DEFAULT_VIEWPORT_LINES = 40
+DEFAULT_OVERSCAN_LINES = 20
+
+# Outputs with fewer lines than this are cheap enough to render whole
+VIRTUALIZE_THRESHOLD_LINES = 500
+
+LINE_HEIGHT_EM = 1.4
+
+# Hits listed under the search box
+SEARCH_PREVIEW_HITS = 20
+
+# Hits held at once; Prev and Next page through the rest
+SEARCH_PAGE_HITS = 200
+
+
+def is_long_output(source) -> bool:
+    """True when an output source has too many lines to render whole"""
+    if source is None:
+        return False
+    first_line, end_line = source.line_span()
+    return end_line - first_line > VIRTUALIZE_THRESHOLD_LINES
+
+
+def _state(key: str, name: str, default):
+    state_key = f"{key}_{name}"
+    if state_key not in st.session_state:
+        st.session_state[state_key] = default
+    return state_key
+
+
+def _load_page(results: dict, page: int, search_from) -> None:
+    """Replace the held hits with a page of them; the page after the last known one starts where it ended"""
+    if page == len(results["pages"]):
+        results["pages"].append(results["next"])
+    results["page"] = page
+    results["hits"], results["next"] = search_from(results["pages"][page])
+
+
+def _load_next_page(results: dict, search_from) -> None:
+    """Move to the following page, or back to the first one after the last"""
+    page = results["page"]
+    if len(results["hits"]) == SEARCH_PAGE_HITS:
+        _load_page(results, page + 1, search_from)
+        if results["hits"]:
+            return
+        del results["pages"][page + 1:]
+    # A lone first page is still held, unless the empty page after it replaced it
+    if page or not results["hits"]:
+        _load_page(results, 0, search_from)
+
+
+def _load_last_page(results: dict, search_from) -> None:
+    """Move to the last page by searching through the pages after the current one"""
+    while len(results["hits"]) == SEARCH_PAGE_HITS:
+        page = results["page"]
+        _load_page(results, page + 1, search_from)
+        if not results["hits"]:
+            del results["pages"][page + 1:]
+            _load_page(results, page, search_from)
+            break
+
+
+def output_search(source, key: str):
+    """
+    Search box for an output source with an OutputStore-style search().
+    Hits are found incrementally: each run only scans output that arrived
+    since the last one. At most SEARCH_PAGE_HITS hits are held; stepping
+    past either end of them searches the neighbouring page again.
+    Returns (line to highlight, whether to jump to it).
+    """
+    col1, col2, col3 = st.columns([4, 1, 1])
+    with col1:
+        query = st.text_input(
+            "Search output",
+            key=f"{key}_query",
+            placeholder="🔎 Search output (e.g. ERROR or a node name)",
+            label_visibility="collapsed"
+        )
+    with col2:
+        use_regex = st.checkbox("Regex", key=f"{key}_regex")
+    with col3:
+        ignore_case = st.checkbox("Ignore case", key=f"{key}_ignore_case", value=True)
+    if not query:
+        return None, False
+
+    signature = (query, use_regex, ignore_case, id(source))
+    results_key = _state(key, "results", None)
+    index_key = _state(key, "index", 0)
+    results = st.session_state[results_key]
+    if results is None or results["signature"] != signature or source.end_offset < results["next"]:
+        # New query, or the output was cleared for a new command.
+        # pages holds the offset each page of hits is searched from.
+        results = {"signature": signature, "pages": [0], "page": 0, "hits": [], "next": 0}
+        st.session_state[index_key] = 0
+        jump = True
+    else:
+        jump = False
+
+    def search_from(start, max_results=SEARCH_PAGE_HITS):
+        return source.search(query, regex=use_regex, ignore_case=ignore_case,
+                             max_results=max_results, start=start)
+
+    try:
+        # Only the held page grows, and only until it is full
+        if len(results["hits"]) < SEARCH_PAGE_HITS:
+            hits, results["next"] = search_from(results["next"], SEARCH_PAGE_HITS - len(results["hits"]))
+            results["hits"].extend(hits)
+    except re.error as e:
+        st.error(f"Invalid regular expression: {str(e)}")
+        return None, False
+    st.session_state[results_key] = results
+
+    if not results["hits"]:
+        st.caption("No matches")
+        return None, False
+
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("◀ Prev", key=f"{key}_prev", use_container_width=True):
+            if st.session_state[index_key] > 0:
+                st.session_state[index_key] -= 1
+            else:
+                if results["page"]:
+                    _load_page(results, results["page"] - 1, search_from)
+                else:
+                    _load_last_page(results, search_from)
+                st.session_state[index_key] = len(results["hits"]) - 1
+            jump = True
+    with col2:
+        if st.button("Next ▶", key=f"{key}_next", use_container_width=True):
+            if st.session_state[index_key] < len(results["hits"]) - 1:
+                st.session_state[index_key] += 1
+            else:
+                _load_next_page(results, search_from)
+                st.session_state[index_key] = 0
+            jump = True
+
+    hits = results["hits"]
+    if not hits:
+        # The page searched again lost its hits to evicted output
+        return None, False
+    current = min(max(0, st.session_state[index_key]), len(hits) - 1)
+    # Earlier pages are always full; a full page may have more after it
+    skipped = results["page"] * SEARCH_PAGE_HITS
+    more = "+" if len(hits) == SEARCH_PAGE_HITS else ""
+    with col3:
+        st.caption(f"Match {skipped + current + 1} of {skipped + len(hits)}{more} (line {hits[current].line + 1})")
+
+    with st.expander(f"Matching lines ({skipped + len(hits)}{more})", expanded=False):
+        preview = "\n".join(
+            f"{hit.line + 1:>8}  {hit.text}" for hit in hits[:SEARCH_PREVIEW_HITS]
+        )
+        st.code(preview + ("\n..." if len(hits) > SEARCH_PREVIEW_HITS else ""))
+
+    return hits[current].line, jump
+
+
+def output_viewer(source, key: str, viewport_lines: int = DEFAULT_VIEWPORT_LINES,
+                  overscan_lines: int = DEFAULT_OVERSCAN_LINES, highlight_line: int = None,
+                  scroll_to: int = None) -> None:
+    """
+    Show a window of a large output instead of the whole text.
+    source is anything with line_span() and read_lines(first, count), such
+    as an OutputStore; only the viewport and the overscan around it are read
+    and sent to the browser. In follow-tail mode the window sticks to the end
+    of the output while it grows. highlight_line marks a line and scroll_to
+    moves the window so that a line is in the middle of it.
+    """
+    first_line, end_line = source.line_span()
+    top_key = _state(key, "top", first_line)
+    follow_key = _state(key, "follow", True)
+
+    if scroll_to is not None:
+        st.session_state[follow_key] = False
+        st.session_state[top_key] = scroll_to - viewport_lines // 2
+
+    last_top = max(first_line, end_line - viewport_lines)
+    col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 2])
+    with col1:
+        if st.button("⏮ Top", key=f"{key}_first", use_container_width=True):
+            st.session_state[follow_key] = False
+            st.session_state[top_key] = first_line
+    with col2:
+        if st.button("▲ Page", key=f"{key}_page_up", use_container_width=True):
+            st.session_state[follow_key] = False
+            st.session_state[top_key] -= viewport_lines
+    with col3:
+        if st.button("▼ Page", key=f"{key}_page_down", use_container_width=True):
+            st.session_state[top_key] += viewport_lines
+    with col4:
+        if st.button("⏭ End", key=f"{key}_last", use_container_width=True):
+            st.session_state[follow_key] = True
+    with col5:
+        st.checkbox("Follow tail", key=follow_key)
+
+    if st.session_state[follow_key]:
+        st.session_state[top_key] = last_top
+    top = min(max(st.session_state[top_key], first_line), last_top)
+    st.session_state[top_key] = top
+
+    # Read the viewport plus overscan so small scrolls stay within what was sent.
+    # Following the tail, the overscan goes above the viewport and the box
+    # starts scrolled to the bottom; otherwise it goes below.
+    following = st.session_state[follow_key]
+    if following:
+        read_start = max(first_line, top - overscan_lines)
+        read_end = end_line
+    else:
+        read_start = top
+        read_end = min(end_line, top + viewport_lines + overscan_lines)
+    lines = source.read_lines(read_start, read_end - read_start)
+
+    gutter_width = len(str(max(end_line, 1)))
+    rows = []
+    for number, line in enumerate(lines, start=read_start + 1):
+        gutter = f'<span style="opacity:0.5;user-select:none">{number:>{gutter_width}} </span>'
+        body = ansi_to_html(line) if "\x1b" in line else html.escape(line, quote=False)
+        if highlight_line is not None and number - 1 == highlight_line:
+            body = f'<mark>{body}</mark>'
+        rows.append(gutter + body)
+
+    direction = "column-reverse" if following else "column"
+    st.markdown(
+        f'<div style="display:flex;flex-direction:{direction};'
+        f'max-height:{viewport_lines * LINE_HEIGHT_EM}em;overflow-y:auto">'
+        f'<pre class="terminal-output" style="line-height:{LINE_HEIGHT_EM}em;margin:0">'
+        + "\n".join(rows) +
+        '</pre></div>',
+        unsafe_allow_html=True
+    )
+    st.caption(
+        f"Lines {top + 1}–{min(end_line, top + viewport_lines)} of {end_line}"
+        + (f" ({first_line} earlier lines dropped)" if first_line else "")
+    )
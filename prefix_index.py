@@ -0,0 +1,189 @@
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Candidates cached at every node of the trie
+DEFAULT_TOP_K = 16
+
+
+class _Entry:
+    __slots__ = ("command", "description", "keys", "uses", "last_used", "order")
+
+    def __init__(self, command: str, description: str, order: int):
+        self.command = command
+        self.description = description
+        self.keys: List[str] = []
+        self.uses = 0
+        self.last_used = 0.0
+        self.order = order
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, list] = {}  # first character -> [edge label, child]
+        self.top: List[_Entry] = []          # best candidates in this subtree, best first
+
+
+class PrefixCursor(NamedTuple):
+    """
+    Where a prefix ends in the trie: the node below it, and what is left of
+    the edge label leading to that node. node is None when no key has the
+    prefix.
+    """
+    prefix: str
+    node: Optional[_Node]
+    remainder: str
+
+
+class PrefixIndex:
+    """
+    Prefix trie over completion candidates.
+    Edges carry whole runs of characters, so the trie has at most two nodes
+    per key. A candidate can be reached through several keys (a command and
+    its aliases), and every node caches the top_k candidates below it ranked
+    by use count and last use (or last use first with recency_first), so a
+    lookup is a walk down the prefix and costs the same however many
+    candidates there are. Usage only ever grows, which keeps the caches
+    exact when a candidate is used: it can only move up.
+    """
+
+    def __init__(self, top_k: int = DEFAULT_TOP_K, recency_first: bool = False):
+        self.top_k = top_k
+        self.recency_first = recency_first
+        self._root = _Node()
+        self._entries: Dict[str, _Entry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, command: str) -> bool:
+        return command in self._entries
+
+    def _rank(self, entry: _Entry) -> tuple:
+        if self.recency_first:
+            return (-entry.last_used, -entry.uses, entry.order)
+        return (-entry.uses, -entry.last_used, entry.order)
+
+    def add(self, command: str, description: str = "", keys: Iterable[str] = ()) -> None:
+        """Add a candidate reachable through its own text and any extra keys"""
+        entry = self._entries.get(command)
+        if entry is None:
+            entry = self._entries[command] = _Entry(command, description, len(self._entries))
+        for key in (command, *keys):
+            if key and key not in entry.keys:
+                entry.keys.append(key)
+                for node in self._insert(key):
+                    self._promote(node, entry)
+
+    def record_use(self, command: str, count: int = 1, when: Optional[float] = None) -> bool:
+        """Count uses of a candidate; returns False when it is not indexed"""
+        entry = self._entries.get(command)
+        if entry is None:
+            return False
+        entry.uses += count
+        entry.last_used = max(entry.last_used, when if when is not None else time.time())
+        for key in entry.keys:
+            for node in self._path(key):
+                self._promote(node, entry)
+        return True
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """Best candidates with a key starting with prefix, as (command, description)"""
+        return self.complete_at(self.find(prefix), limit)
+
+    def complete_at(self, cursor: PrefixCursor, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """Best candidates at a cursor from find() or extend()"""
+        if cursor.node is None:
+            return []
+        top = cursor.node.top if limit is None else cursor.node.top[:limit]
+        return [(entry.command, entry.description) for entry in top]
+
+    def find(self, prefix: str) -> PrefixCursor:
+        """Locate a prefix, walking down from the root"""
+        return self.extend(PrefixCursor("", self._root, ""), prefix)
+
+    def extend(self, cursor: PrefixCursor, text: str) -> PrefixCursor:
+        """
+        Locate cursor.prefix + text, walking on from the cursor instead of
+        the root. A cursor is only valid until the next add(), which may
+        split the edge it points into.
+        """
+        prefix = cursor.prefix + text
+        node, remainder, rest = cursor.node, cursor.remainder, text
+        if node is None:
+            return PrefixCursor(prefix, None, "")
+
+        # Finish the edge the cursor is on
+        if remainder:
+            common = min(len(remainder), len(rest))
+            if remainder[:common] != rest[:common]:
+                return PrefixCursor(prefix, None, "")
+            remainder, rest = remainder[common:], rest[common:]
+
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                return PrefixCursor(prefix, None, "")
+            label, child = edge
+            if rest.startswith(label):
+                rest = rest[len(label):]
+            elif label.startswith(rest):
+                remainder = label[len(rest):]
+                rest = ""
+            else:
+                return PrefixCursor(prefix, None, "")
+            node = child
+        return PrefixCursor(prefix, node, remainder)
+
+    def _promote(self, node: _Node, entry: _Entry) -> None:
+        """Place an entry whose rank improved into a node's cache"""
+        top = node.top
+        if entry not in top:
+            if len(top) < self.top_k:
+                top.append(entry)
+            elif self._rank(entry) < self._rank(top[-1]):
+                top[-1] = entry
+            else:
+                return
+        top.sort(key=self._rank)
+
+    def _insert(self, key: str) -> List[_Node]:
+        """Add a key to the trie and return the nodes along its path, root first"""
+        node = self._root
+        path = [node]
+        rest = key
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                child = _Node()
+                node.children[rest[0]] = [rest, child]
+                path.append(child)
+                break
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(rest))
+            while common < limit and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge; the new node covers the same subtree as the old child
+                middle = _Node()
+                middle.top = list(child.top)
+                middle.children[label[common]] = [label[common:], child]
+                edge[0], edge[1] = label[:common], middle
+                child = middle
+            node = child
+            path.append(node)
+            rest = rest[common:]
+        return path
+
+    def _path(self, key: str) -> List[_Node]:
+        """Nodes along the path of a key already in the trie, root first"""
+        node = self._root
+        path = [node]
+        rest = key
+        while rest:
+            label, node = node.children[rest[0]]
+            path.append(node)
+            rest = rest[len(label):]
+        return path
@@ -0,0 +1,227 @@
+import codecs
+import fcntl
+import os
+import pty
+import select
+import shlex
+import signal
+import struct
+import subprocess
+import termios
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+# How long to wait for an interrupted command before restarting the shell
+INTERRUPT_GRACE_PERIOD = 2.0
+
+READ_SIZE = 64 * 1024
+
+# The tty line discipline truncates canonical input lines beyond this size,
+# which leaves room for commands up to MAX_COMMAND_SIZE once framed
+MAX_FRAME_SIZE = 4000
+MAX_COMMAND_SIZE = MAX_FRAME_SIZE - 200
+
+# Non-interactive read/eval loop run by the shell. Commands are evaluated
+# inside a function so that the INT trap can abandon the rest of an
+# interrupted command with status 130 while the shell itself survives.
+SHELL_LOOP = (
+    '__cli2gui_run() { eval "$1"; }; '
+    'trap "return 130 2>/dev/null" INT; '
+    'while IFS= read -r __cli2gui_line; do eval "$__cli2gui_line"; done'
+)
+
+
+def _acquire_controlling_terminal():
+    """Make the PTY on stdin the controlling terminal so Ctrl-C reaches the shell"""
+    fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+
+class PersistentShell:
+    """
+    A long-lived bash process behind a PTY.
+    Each command is framed on a single input line that evals it and then
+    prints a random sentinel with the exit code and working directory, so
+    commands start without a fork/exec of a new shell and cd/export carry
+    over between them. If the shell exits it is restarted on the next
+    command with the last known working directory.
+    """
+
+    def __init__(self, shell: str = "/bin/bash"):
+        self.shell = shell
+        self._process = None
+        self._master_fd = None
+        self._marker = None
+        self._cwd = os.getcwd()
+        self._lock = threading.Lock()
+        self._busy = False
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    @property
+    def cwd(self) -> str:
+        """Working directory reported after the last command"""
+        return self._cwd
+
+    def start(self) -> None:
+        """Spawn the shell if it is not already running"""
+        if self.alive:
+            return
+        self.close()
+
+        master_fd, slave_fd = pty.openpty()
+        term_size = struct.pack('HHHH', 24, 80, 0, 0)
+        fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, term_size)
+
+        # No echo of the framed input and no \n -> \r\n translation on output
+        attrs = termios.tcgetattr(slave_fd)
+        attrs[1] &= ~termios.ONLCR
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(slave_fd, termios.TCSANOW, attrs)
+
+        env = os.environ.copy()
+        env.pop('PROMPT_COMMAND', None)
+        try:
+            self._process = subprocess.Popen(
+                [self.shell, '--noprofile', '--norc', '-c', SHELL_LOOP],
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                cwd=self._cwd,
+                env=env,
+                start_new_session=True,
+                preexec_fn=_acquire_controlling_terminal
+            )
+        finally:
+            os.close(slave_fd)
+
+        self._master_fd = master_fd
+        self._marker = f"__CLI2GUI_DONE_{uuid.uuid4().hex}__".encode()
+
+    def run(self, command: str, on_output: Callable[[str], None],
+            on_poll: Optional[Callable[[], None]] = None, poll_interval: float = 0.1) -> int:
+        """
+        Run a command, streaming its output to on_output, and return its exit code.
+        on_poll is called after every read and at least every poll_interval seconds.
+        Raises ValueError for commands too long to frame on one tty line.
+        """
+        if len(command.encode()) > MAX_COMMAND_SIZE:
+            raise ValueError("Command is too long for the persistent shell")
+
+        with self._lock:
+            self.start()
+            self._busy = True
+            try:
+                return self._run(command, on_output, on_poll, poll_interval)
+            finally:
+                self._busy = False
+
+    def interrupt(self) -> None:
+        """Send Ctrl-C to the running command, restarting the shell if it does not stop"""
+        if not self._busy or self._master_fd is None:
+            return
+        self._write(b"\x03")
+
+        deadline = time.time() + INTERRUPT_GRACE_PERIOD
+        while self._busy and time.time() < deadline:
+            time.sleep(0.05)
+        if self._busy:
+            self._kill()
+
+    def close(self) -> None:
+        """Stop the shell and release the PTY"""
+        self._kill()
+        if self._master_fd is not None:
+            try:
+                os.close(self._master_fd)
+            except OSError:
+                pass
+            self._master_fd = None
+
+    def _run(self, command, on_output, on_poll, poll_interval) -> int:
+        marker = self._marker
+        frame = (
+            f"__cli2gui_run {shlex.quote(command)}; __cli2gui_rc=$?; "
+            f"printf '\\n%s %d %s\\n' '{marker.decode()}' \"$__cli2gui_rc\" \"$PWD\"\n"
+        )
+        self._write(frame.encode())
+
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = b""
+        sentinel = b"\n" + marker
+
+        while True:
+            ready, _, _ = select.select([self._master_fd], [], [], poll_interval)
+            data = b""
+            if ready:
+                try:
+                    data = os.read(self._master_fd, READ_SIZE)
+                except OSError:
+                    data = b""
+                if not data:
+                    # The shell exited (e.g. the command ran `exit`)
+                    text = decoder.decode(pending, final=True)
+                    if text:
+                        on_output(text)
+                    return self._reap()
+            elif not self.alive:
+                return self._reap()
+
+            pending += data
+            index = pending.find(sentinel)
+            if index >= 0:
+                line_end = pending.find(b"\n", index + len(sentinel))
+                if line_end >= 0:
+                    text = decoder.decode(pending[:index], final=True)
+                    if text:
+                        on_output(text)
+                    return self._parse_trailer(pending[index + len(sentinel):line_end])
+            else:
+                # Hold back anything that could be the start of the sentinel
+                safe = max(0, len(pending) - len(sentinel))
+                if safe:
+                    text = decoder.decode(pending[:safe])
+                    if text:
+                        on_output(text)
+                    pending = pending[safe:]
+
+            if on_poll:
+                on_poll()
+
+    def _parse_trailer(self, trailer: bytes) -> int:
+        """Parse ' <exit code> <cwd>' printed after the sentinel"""
+        parts = trailer.decode('utf-8', errors='replace').lstrip(" ").split(" ", 1)
+        if len(parts) == 2:
+            self._cwd = parts[1]
+        try:
+            return int(parts[0])
+        except ValueError:
+            return -1
+
+    def _reap(self) -> int:
+        """Collect the exit status of a shell that has gone away"""
+        returncode = self._process.wait() if self._process else -1
+        self.close()
+        return returncode
+
+    def _write(self, data: bytes) -> None:
+        while data:
+            written = os.write(self._master_fd, data)
+            data = data[written:]
+
+    def _kill(self) -> None:
+        if self._process is None:
+            return
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self._process.wait()
+        self._process = None
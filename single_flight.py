@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, List
+
+from async_executor import AsyncCommandSession, get_shared_loop
+from command_cache import get_result_cache, normalize_command
+from output_store import OutputStore
+
+# Subscriber callback receiving ('output' | 'status' | 'error', data) events
+EventCallback = Callable[[str, object], None]
+
+
+class Flight:
+    """One shared execution of a command and the subscribers watching it"""
+
+    def __init__(self, key: str, command: str, generation=None):
+        self.key = key
+        self.command = command
+        # Cache generation of the command's category when it started
+        self.generation = generation
+        self.started_at = time.time()
+        self.output = OutputStore()
+        self.session = AsyncCommandSession(command, interactive=False)
+        self.subscribers: List[EventCallback] = []
+        self.lock = threading.Lock()
+
+    def dispatch(self, msg_type: str, data) -> None:
+        """Record an event and fan it out to every subscriber"""
+        with self.lock:
+            if msg_type == 'output':
+                self.output.append(data)
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(msg_type, data)
+            except Exception:
+                # A broken subscriber must not stop the others from being fed
+                pass
+
+
+class SingleFlight:
+    """
+    Process-wide de-duplication of identical in-flight read-only commands.
+    The first caller starts the command; everyone who asks for the same
+    normalized command line while it runs subscribes to the same stream
+    and gets the output produced so far replayed on joining.
+    """
+
+    def __init__(self):
+        self._loop = get_shared_loop()
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def should_share(self, command: str) -> bool:
+        """Only read-only nsds commands are safe to share between callers"""
+        return get_result_cache().is_cacheable(command)
+
+    def join(self, command: str, callback: EventCallback) -> Flight:
+        """Subscribe to the in-flight run of a command, starting it if needed"""
+        key = normalize_command(command)
+        generation = get_result_cache().generation(command)
+        with self._lock:
+            flight = self._flights.get(key)
+            # A run that started before a mutating command is not shared;
+            # it finishes for its own subscribers
+            if flight is None or flight.generation != generation:
+                flight = Flight(key, command, generation)
+                flight.subscribers.append(callback)
+                self._flights[key] = flight
+                asyncio.run_coroutine_threadsafe(self._run(flight), self._loop)
+                return flight
+
+            # Replay under the flight lock so no event is missed or repeated
+            with flight.lock:
+                replay = flight.output.getvalue()
+                if replay:
+                    callback('output', replay)
+                flight.subscribers.append(callback)
+            return flight
+
+    def leave(self, flight: Flight, callback: EventCallback) -> None:
+        """Unsubscribe; the command is terminated once nobody is watching it"""
+        with self._lock:
+            with flight.lock:
+                if callback in flight.subscribers:
+                    flight.subscribers.remove(callback)
+                abandoned = not flight.subscribers
+            if abandoned and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            else:
+                abandoned = False
+
+        if abandoned:
+            asyncio.run_coroutine_threadsafe(flight.session.terminate(), self._loop)
+
+    def in_flight(self) -> List[Flight]:
+        with self._lock:
+            return list(self._flights.values())
+
+    async def _run(self, flight: Flight) -> None:
+        final_events = []
+        try:
+            await flight.session.start()
+            async for msg_type, data in flight.session.events():
+                if msg_type == 'output':
+                    flight.dispatch(msg_type, data)
+                else:
+                    final_events.append((msg_type, data))
+        finally:
+            # Retire the flight before the final events so later callers start afresh
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            if not final_events:
+                final_events.append(('error', "Shared command ended unexpectedly"))
+            for msg_type, data in final_events:
+                flight.dispatch(msg_type, data)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight group"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
@@ -2,10 +2,29 @@ import streamlit as st
 import time
 from datetime import datetime
 from command_executor import CommandExecutor
+from job_scheduler import JobScheduler, QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED
+from command_cache import get_result_cache
+from command_validator import get_command_validator
+from history_store import get_history_store
+from output_parser import parse_output
+from ansi import ansi_to_html
+from output_store import OutputStore
+from output_viewer import output_viewer, output_search, is_long_output
+from fanout import FanOutExecutor, NODE_VERBS, DEFAULT_WINDOW, parse_nodes
 from nsds_commands import CommandStructure
 from styles import apply_styles
+from terminal_screen import SCREEN_SCROLLBACK_LINES
 from queue import Empty
 
+# Fan-out pane refresh while nodes are running
+FANOUT_REFRESH_INTERVAL = 0.5
+
+# Entries shown in the sidebar history
+HISTORY_SIDEBAR_LIMIT = 50
+
+# Best matches shown for a command search
+SEARCH_RESULTS_LIMIT = 50
+
 def initialize_session_state():
     """Initialize session state variables"""
     if 'command_history' not in st.session_state:
@@ -14,6 +33,15 @@ def initialize_session_state():
         st.session_state.command_executor = CommandExecutor()
     if 'last_output' not in st.session_state:
         st.session_state.last_output = ''
+    if 'last_output_html' not in st.session_state:
+        st.session_state.last_output_html = ''
+    if 'output_source' not in st.session_state:
+        # Line-indexed output shown through the windowed viewer when it is long
+        st.session_state.output_source = None
+    if 'screen_history' not in st.session_state:
+        # Raw output of a PTY session, paged through the viewer once the
+        # screen only carries its recent scrollback
+        st.session_state.screen_history = None
     if 'progress_value' not in st.session_state:
         st.session_state.progress_value = 0.0
     if 'selected_category' not in st.session_state:
@@ -24,40 +52,146 @@ def initialize_session_state():
         st.session_state.voice_command_pending = None
     if 'command_input_default' not in st.session_state:
         st.session_state.command_input_default = ''
+    if 'history_store' not in st.session_state:
+        st.session_state.history_store = get_history_store()
+    if 'job_scheduler' not in st.session_state:
+        st.session_state.job_scheduler = JobScheduler(history_store=st.session_state.history_store)
+    if 'result_cache' not in st.session_state:
+        st.session_state.result_cache = get_result_cache()
+    if 'running_command' not in st.session_state:
+        st.session_state.running_command = None
+    if 'running_started_at' not in st.session_state:
+        st.session_state.running_started_at = None
+    if 'running_generation' not in st.session_state:
+        st.session_state.running_generation = None
+    if 'cached_result' not in st.session_state:
+        st.session_state.cached_result = None
+    if 'fanout_executor' not in st.session_state:
+        st.session_state.fanout_executor = FanOutExecutor(history_store=st.session_state.history_store)
+    if 'current_fanout' not in st.session_state:
+        st.session_state.current_fanout = None
+    if 'parsed_output' not in st.session_state:
+        st.session_state.parsed_output = None
+    if 'command_status' not in st.session_state:
+        # (success, text) of the last finished command, shown until the next one starts
+        st.session_state.command_status = None
 
 def format_timestamp():
     """Return formatted current timestamp"""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def update_ui_from_queue(output_placeholder, progress_placeholder, status_placeholder):
-    """Update UI elements from command output queue"""
+def session_user():
+    """The signed-in user of this session, or None when the app has no login"""
+    return st.user.get("email")
+
+def render_output(output_placeholder):
+    """Show the output with its ANSI colours, windowed when it is long or being searched"""
+    source = st.session_state.output_source
+    if source is None:
+        history = st.session_state.screen_history
+        with output_placeholder.container():
+            if history is not None and history.line_span()[1] > SCREEN_SCROLLBACK_LINES:
+                with st.expander("Earlier output", expanded=False):
+                    output_viewer(history, key="screen_history_viewer")
+            st.markdown(
+                f'<pre class="terminal-output">{st.session_state.last_output_html}</pre>',
+                unsafe_allow_html=True
+            )
+        return
+
+    with output_placeholder.container():
+        highlight, jump = output_search(source, key="output_search")
+        if highlight is not None or is_long_output(source):
+            # The viewer can scroll to and mark the current match
+            output_viewer(source, key="output_viewer", highlight_line=highlight,
+                          scroll_to=highlight if jump else None)
+        else:
+            st.markdown(
+                f'<pre class="terminal-output">{st.session_state.last_output_html}</pre>',
+                unsafe_allow_html=True
+            )
+
+def update_ui_from_queue(output_placeholder, progress_placeholder, status_placeholder, time_budget=0.05):
+    """
+    Update UI elements from command output queue.
+    Drains every queued message within the time budget and renders each
+    element at most once, so a fast producer never outruns the UI.
+    """
     try:
-        # Limit the number of messages processed in each update to prevent blocking
-        max_messages = 10
-        msg_count = 0
-        
-        while msg_count < max_messages:
+        output_changed = False
+        status = None
+        deadline = time.monotonic() + time_budget
+
+        while time.monotonic() < deadline:
             try:
                 msg_type, data = st.session_state.command_executor._output_queue.get_nowait()
-                msg_count += 1
-                
-                if msg_type == 'output':
-                    st.session_state.last_output = st.session_state.command_executor.get_output()
-                    output_placeholder.code(st.session_state.last_output)
-                elif msg_type == 'progress':
-                    st.session_state.progress_value = data
-                    if data > 0:
-                        progress_placeholder.progress(data)
-                elif msg_type == 'status':
-                    is_success, text = data
-                    if is_success:
-                        status_placeholder.success(text)
-                    else:
-                        status_placeholder.error(text)
-                elif msg_type == 'error':
-                    status_placeholder.error(data)
             except Empty:
                 break
+
+            if msg_type == 'output':
+                output_changed = True
+            elif msg_type == 'status':
+                status = data
+            elif msg_type == 'error':
+                status = (False, data)
+
+        if output_changed:
+            executor = st.session_state.command_executor
+            # PTY sessions redraw in place, so show their screen rather than the raw stream
+            screen_html = executor.get_screen_html()
+            st.session_state.output_source = None if screen_html is not None else executor.get_output_store()
+            st.session_state.screen_history = executor.get_output_store() if screen_html is not None else None
+            if screen_html is not None:
+                st.session_state.last_output_html = screen_html
+            elif not is_long_output(st.session_state.output_source):
+                # Long outputs are read a window at a time instead of joined whole
+                st.session_state.last_output = executor.get_output()
+                st.session_state.last_output_html = executor.get_styled_output()
+            render_output(output_placeholder)
+
+        # Progress is read from the executor's latest-value slot, not the queue
+        progress = st.session_state.command_executor.get_progress()
+        if progress != st.session_state.progress_value:
+            st.session_state.progress_value = progress
+            if progress > 0:
+                progress_placeholder.progress(progress)
+        if status is not None:
+            is_success, text = status
+            if not is_success and st.session_state.running_command:
+                # Point out a likely typo in the command that failed
+                is_valid, message = get_command_validator().validate_command(st.session_state.running_command)
+                if not is_valid:
+                    text = f"{text}\n{message}"
+                    status = (is_success, text)
+            st.session_state.command_status = status
+            if is_success:
+                status_placeholder.success(text)
+            else:
+                status_placeholder.error(text)
+
+            # Parse tabular output once per run and keep read-only results
+            # (with their parsed form) around for repeated status/list/show checks
+            if st.session_state.running_command:
+                # Reads that ran alongside a mutating command may have seen the old state
+                st.session_state.result_cache.note_executed(st.session_state.running_command)
+                output = st.session_state.command_executor.get_output()
+                st.session_state.parsed_output = parse_output(st.session_state.running_command, output)
+                st.session_state.result_cache.put(
+                    st.session_state.running_command,
+                    output,
+                    is_success,
+                    text,
+                    parsed=st.session_state.parsed_output,
+                    generation=st.session_state.running_generation
+                )
+                st.session_state.history_store.record(
+                    st.session_state.running_command,
+                    started_at=st.session_state.running_started_at,
+                    duration=time.time() - st.session_state.running_started_at,
+                    exit_code=st.session_state.command_executor.get_return_code(),
+                    user=session_user()
+                )
+                st.session_state.running_command = None
     except Exception as e:
         st.error(f"Error updating UI: {str(e)}")
 
@@ -101,7 +235,7 @@ def nsds_command_center():
     if search_query:
         with st.sidebar.status("🔍 Searching...") as status:
             st.sidebar.markdown("### Search Results")
-            results = st.session_state.nsds_commands.search_commands(search_query)
+            results = st.session_state.nsds_commands.search_commands(search_query, SEARCH_RESULTS_LIMIT)
             status.update(label="✅ Search complete", state="complete")
 
             if results:
@@ -144,10 +278,14 @@ def nsds_command_center():
 
     # Move command history to bottom of sidebar
     st.sidebar.markdown("---")
-    if st.session_state.command_history:
+    # History is read from the persistent store, so it survives refreshes and restarts
+    recent_history = st.session_state.history_store.recent(HISTORY_SIDEBAR_LIMIT)
+    if recent_history:
         with st.sidebar.expander("Command History", expanded=False):
-            for cmd in reversed(st.session_state.command_history):
-                st.text(f"[{cmd['timestamp']}] {cmd['command']}")
+            for entry in recent_history:
+                timestamp = datetime.fromtimestamp(entry.started_at).strftime("%Y-%m-%d %H:%M:%S")
+                exit_label = "" if entry.exit_code is None else f" (exit {entry.exit_code})"
+                st.text(f"[{timestamp}] {entry.command}{exit_label}")
 
     # Main panel content - show category details
     if st.session_state.selected_category:
@@ -251,6 +389,37 @@ def terminal_page():
     with col3:
         execute = st.button("Execute", key="execute_button", type="primary", use_container_width=True)
 
+    # Opt-in persistent shell keeps cd/export state between commands
+    persistent_shell = st.checkbox(
+        "Keep shell session",
+        value=st.session_state.command_executor.uses_persistent_shell(),
+        key="persistent_shell_toggle",
+        help="Run commands in one long-lived shell so cd and environment changes carry over"
+    )
+    if (persistent_shell != st.session_state.command_executor.uses_persistent_shell()
+            and not st.session_state.command_executor.is_running()):
+        # The old executor's shell and PTY would otherwise live on until the process exits
+        st.session_state.command_executor.close()
+        st.session_state.command_executor = CommandExecutor(persistent_shell=persistent_shell)
+    if persistent_shell:
+        st.caption(f"📁 {st.session_state.command_executor.get_working_directory()}")
+
+    # Background execution lets long commands run alongside the terminal
+    run_background = st.button(
+        "Run in Background",
+        key="background_button",
+        help="Run the command as a background job so other commands can run meanwhile"
+    )
+    if run_background and command.strip():
+        job_id = st.session_state.job_scheduler.submit(command, user=session_user())
+        st.session_state.command_history.append({
+            'command': command,
+            'timestamp': format_timestamp()
+        })
+        st.success(f"Started background job #{job_id}")
+    elif run_background:
+        st.error("Please enter a command")
+
     # Stop button (only shown when command is running)
     if st.session_state.command_executor.is_running():
         if st.button("Stop", key="stop_button", type="secondary"):
@@ -285,8 +454,13 @@ def terminal_page():
     progress_placeholder = st.empty()
     status_placeholder = st.empty()
 
+    # Cached results can be refreshed by re-running the command
+    refresh = False
+    if st.session_state.cached_result is not None:
+        refresh = st.button("🔄 Refresh", key="refresh_cached_result", help="Re-run the command instead of using the cached result")
+
     # Execute command if requested
-    if execute and command.strip():
+    if (execute or refresh) and command.strip():
         try:
             # Add command to history
             cmd_entry = {
@@ -297,28 +471,205 @@ def terminal_page():
 
             # Reset output state
             st.session_state.last_output = ''
+            st.session_state.last_output_html = ''
+            st.session_state.output_source = None
+            st.session_state.screen_history = None
             st.session_state.progress_value = 0.0
+            st.session_state.cached_result = None
+            st.session_state.parsed_output = None
+            st.session_state.command_status = None
+
+            cache = st.session_state.result_cache
+            cached = None if refresh else cache.get(command)
+            if cached is not None:
+                st.session_state.last_output = cached.output
+                st.session_state.last_output_html = ansi_to_html(cached.output)
+                st.session_state.output_source = OutputStore()
+                st.session_state.output_source.append(cached.output)
+                st.session_state.cached_result = cached
+                st.session_state.parsed_output = cached.parsed
+                # Served from the cache, so there is no run time to record
+                st.session_state.history_store.record(command, exit_code=0, user=session_user())
+            else:
+                # Mutating commands make cached results in their category stale
+                cache.note_executed(command)
 
-            # Execute command
-            with st.spinner("Executing command..."):
-                st.session_state.command_executor.execute_command(command)
+                # Execute command
+                generation = cache.generation(command)
+                with st.spinner("Executing command..."):
+                    if st.session_state.command_executor.execute_command(command):
+                        st.session_state.running_command = command
+                        st.session_state.running_generation = generation
+                        st.session_state.running_started_at = time.time()
 
         except Exception as e:
             st.error(f"Failed to execute command: {str(e)}")
     elif execute:
         st.error("Please enter a command")
 
-    # Update UI elements
-    if st.session_state.command_executor.is_running():
+    # Background jobs are listed below the output placeholders
+    background_jobs_panel()
+
+    # Per-node fan-out; only its fragment reruns while nodes are running
+    fanout_form()
+    fanout = st.session_state.current_fanout
+    run_every = FANOUT_REFRESH_INTERVAL if fanout is not None and not fanout.finished else None
+    st.fragment(fanout_pane, run_every=run_every)()
+
+    # Update UI elements. The executor clears its running flag right after
+    # queueing the final output and status, so keep draining until the queue is empty
+    executor = st.session_state.command_executor
+    if executor.is_running() or not executor._output_queue.empty():
         update_ui_from_queue(output_placeholder, progress_placeholder, status_placeholder)
         # Use st.experimental_rerun() instead of rerun() with delay, which can cause issues
         st.rerun()
 
     # Display current output
-    if st.session_state.last_output:
-        output_placeholder.code(st.session_state.last_output)
+    if st.session_state.last_output or st.session_state.output_source is not None:
+        render_output(output_placeholder)
+    if st.session_state.cached_result is not None:
+        status_placeholder.info(f"⏱️ {st.session_state.cached_result.age_label()}")
+    elif st.session_state.command_status is not None:
+        is_success, text = st.session_state.command_status
+        if is_success:
+            status_placeholder.success(text)
+        else:
+            status_placeholder.error(text)
     if st.session_state.progress_value > 0:
         progress_placeholder.progress(st.session_state.progress_value)
+    if st.session_state.parsed_output is not None:
+        structured_output_view(st.session_state.parsed_output)
+
+def structured_output_view(parsed):
+    """Sortable, filterable tables for nsds output parsed into columns"""
+    with st.expander("📊 Table view", expanded=True):
+        if parsed.fields:
+            st.table({'Field': list(parsed.fields), 'Value': list(parsed.fields.values())})
+        for index, table in enumerate(parsed.tables):
+            st.markdown(f"**{table.title or f'Table {index + 1}'}** ({table.row_count} rows)")
+            query = st.text_input(
+                "Filter rows",
+                key=f"table_filter_{index}",
+                placeholder="Filter rows...",
+                label_visibility="collapsed"
+            )
+            st.dataframe(table.filter(query), use_container_width=True, hide_index=True)
+
+def background_jobs_panel():
+    """List background jobs with their output and a cancel button"""
+    scheduler = st.session_state.job_scheduler
+    jobs = scheduler.list_jobs()
+    if not jobs:
+        return
+
+    st.markdown("### Background Jobs")
+    st.caption(
+        f"{scheduler.running_count()} running, {scheduler.queued_count()} queued "
+        f"(max {scheduler.max_concurrency} at a time)"
+    )
+
+    state_icons = {QUEUED: "⏳", RUNNING: "▶️", COMPLETED: "✅"}
+    for job in jobs:
+        icon = state_icons.get(job.state, "❌")
+        duration = job.duration()
+        label = f"{icon} #{job.id} {job.command} [{job.state}]"
+        if duration is not None:
+            label += f" {duration:.1f}s"
+
+        with st.expander(label, expanded=False):
+            if job.status_text:
+                st.text(job.status_text)
+            output_html = job.get_styled_output()
+            if output_html:
+                st.markdown(
+                    f'<pre class="terminal-output">{output_html}</pre>',
+                    unsafe_allow_html=True
+                )
+            if not job.finished and st.button("Cancel", key=f"cancel_job_{job.id}"):
+                scheduler.cancel(job.id)
+                st.rerun()
+
+    if any(job.finished for job in jobs):
+        if st.button("Clear finished jobs", key="clear_finished_jobs"):
+            scheduler.clear_finished()
+            st.rerun()
+
+def fanout_form():
+    """Inputs for running a node command across many nodes at once"""
+    with st.expander("🌐 Run on multiple nodes", expanded=st.session_state.current_fanout is not None):
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            verb = st.selectbox("Node command", NODE_VERBS, key="fanout_verb")
+        with col2:
+            window = st.number_input(
+                "Parallel nodes", min_value=1, max_value=64, value=DEFAULT_WINDOW,
+                key="fanout_window", help="How many nodes run the command at the same time"
+            )
+        nodes_text = st.text_area(
+            "Nodes",
+            key="fanout_nodes",
+            placeholder="node1, node2, node3 or node[1-50]",
+            help="Comma or whitespace separated; numeric ranges like node[1-50] are expanded"
+        )
+
+        fanout = st.session_state.current_fanout
+        if st.button("Run on nodes", key="fanout_run", type="primary",
+                     disabled=fanout is not None and not fanout.finished):
+            nodes = parse_nodes(nodes_text)
+            if not nodes:
+                st.error("Please enter at least one node")
+                return
+            executor = st.session_state.fanout_executor
+            if fanout is not None:
+                executor.forget(fanout)
+            st.session_state.current_fanout = executor.start(verb, nodes, int(window), user=session_user())
+            st.session_state.command_history.append({
+                'command': f"nsds node {verb} [{len(nodes)} nodes]",
+                'timestamp': format_timestamp()
+            })
+
+def fanout_pane():
+    """Summary table and per-node output of the current fan-out"""
+    fanout = st.session_state.current_fanout
+    if fanout is None:
+        return
+
+    counts = fanout.counts()
+    st.markdown(f"### nsds node {fanout.verb} on {len(fanout.runs)} nodes")
+    st.caption(
+        f"{counts[COMPLETED]} succeeded, {counts[FAILED]} failed, {counts[RUNNING]} running, "
+        f"{counts[QUEUED]} queued, {counts[CANCELLED]} cancelled "
+        f"({fanout.window} at a time, {fanout.duration():.1f}s)"
+    )
+    if not fanout.finished:
+        if st.button("Cancel remaining nodes", key=f"cancel_fanout_{fanout.id}"):
+            st.session_state.fanout_executor.cancel(fanout)
+        st.progress((len(fanout.runs) - counts[QUEUED] - counts[RUNNING]) / len(fanout.runs))
+
+    st.dataframe(fanout.summary(), use_container_width=True, hide_index=True)
+
+    state_icons = {QUEUED: "⏳", RUNNING: "▶️", COMPLETED: "✅", CANCELLED: "⏹️"}
+    for run in fanout.runs:
+        icon = state_icons.get(run.state, "❌")
+        label = f"{icon} {run.node} [{run.state}]"
+        if run.returncode is not None:
+            label += f" exit {run.returncode}"
+        with st.expander(label, expanded=False):
+            if run.status_text:
+                st.text(run.status_text)
+            output_html = run.get_styled_output()
+            if output_html:
+                st.markdown(
+                    f'<pre class="terminal-output">{output_html}</pre>',
+                    unsafe_allow_html=True
+                )
+
+    if fanout.finished and st.session_state.get('fanout_polling') == fanout.id:
+        # Rerun the whole page once so the form is re-enabled and the pane stops polling
+        st.session_state.fanout_polling = None
+        st.rerun()
+    elif not fanout.finished:
+        st.session_state.fanout_polling = fanout.id
 
 def main():
     try:
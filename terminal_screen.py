@@ -0,0 +1,323 @@
+import threading
+from collections import deque
+from typing import List, Tuple
+
+from ansi import (AnsiTokenizer, DEFAULT_STYLE, Style, TEXT, CSI, ESC,
+                  apply_sgr, parse_params, spans_to_html)
+
+DEFAULT_COLUMNS = 80
+DEFAULT_ROWS = 24
+DEFAULT_MAX_SCROLLBACK = 5000
+
+# Scrollback lines sent with each screen update; older output is paged
+# through the output viewer instead of being re-sent on every update
+SCREEN_SCROLLBACK_LINES = 200
+
+# A character cell: the character and the style it was drawn with
+Cell = Tuple[str, Style]
+
+BLANK: Cell = (" ", DEFAULT_STYLE)
+
+# Private modes that switch to the alternate screen used by full-screen programs
+_ALTERNATE_SCREEN_MODES = ("?47", "?1047", "?1049")
+
+
+def _blank_row(columns: int) -> List[Cell]:
+    return [BLANK] * columns
+
+
+def _row_html(row: List[Cell]) -> str:
+    """Render a row of cells, merging runs of the same style and dropping trailing blanks"""
+    end = len(row)
+    while end and row[end - 1] == BLANK:
+        end -= 1
+    spans = []
+    for char, style in row[:end]:
+        if spans and spans[-1][1] == style:
+            spans[-1][0].append(char)
+        else:
+            spans.append(([char], style))
+    return spans_to_html(["".join(chars), style] for chars, style in spans)
+
+
+class TerminalScreen:
+    """
+    Screen model for PTY sessions.
+    PTY output is interpreted the way a VT100-style terminal would: carriage
+    returns, cursor movement and erase sequences overwrite cells in a fixed
+    grid instead of piling up, lines scrolled off the top go to a bounded
+    scrollback, and the alternate screen used by full-screen programs never
+    reaches the scrollback. Each row's HTML is only re-rendered after it
+    changes.
+    """
+
+    def __init__(self, columns: int = DEFAULT_COLUMNS, rows: int = DEFAULT_ROWS,
+                 max_scrollback: int = DEFAULT_MAX_SCROLLBACK):
+        self.columns = columns
+        self.rows = rows
+        self._tokenizer = AnsiTokenizer()
+        self._scrollback = deque(maxlen=max_scrollback)  # rendered HTML per line
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.style = DEFAULT_STYLE
+        self._buffer = [_blank_row(self.columns) for _ in range(self.rows)]
+        self._row_cache = [None] * self.rows
+        self._saved_primary = None
+        self.cursor_row = 0
+        self.cursor_col = 0
+        self._saved_cursor = (0, 0, DEFAULT_STYLE)
+        self._top = 0
+        self._bottom = self.rows - 1
+        self._wrap_pending = False
+
+    @property
+    def alternate_screen(self) -> bool:
+        return self._saved_primary is not None
+
+    def feed(self, text: str) -> None:
+        """Apply a chunk of PTY output to the screen"""
+        with self._lock:
+            for kind, value, final in self._tokenizer.feed(text):
+                if kind == TEXT:
+                    self._write_text(value)
+                elif kind == CSI:
+                    self._csi(value, final)
+                elif kind == ESC:
+                    self._escape(value)
+
+    def render_html(self, scrollback_lines: int = None) -> str:
+        """Return the scrollback (or its last scrollback_lines lines) and the screen as HTML"""
+        with self._lock:
+            history = list(self._scrollback)
+            if scrollback_lines is not None:
+                history = history[-scrollback_lines:] if scrollback_lines else []
+            screen = [self._render_row(row) for row in range(self.rows)]
+            # Blank rows below the last line written are not worth showing
+            while screen and not screen[-1] and len(screen) > self.cursor_row + 1:
+                screen.pop()
+            return "\n".join(history + screen)
+
+    def text(self) -> str:
+        """Plain text of the visible screen"""
+        with self._lock:
+            return "\n".join("".join(char for char, _ in row).rstrip() for row in self._buffer)
+
+    def scrollback_size(self) -> int:
+        return len(self._scrollback)
+
+    def _render_row(self, row: int) -> str:
+        html = self._row_cache[row]
+        if html is None:
+            html = self._row_cache[row] = _row_html(self._buffer[row])
+        return html
+
+    def _touch(self, row: int) -> None:
+        self._row_cache[row] = None
+
+    def _write_text(self, text: str) -> None:
+        for char in text:
+            if char >= " ":
+                self._put(char)
+            elif char == "\r":
+                self.cursor_col = 0
+                self._wrap_pending = False
+            elif char in "\n\x0b\x0c":
+                self._linefeed()
+            elif char == "\b":
+                self.cursor_col = max(0, self.cursor_col - 1)
+                self._wrap_pending = False
+            elif char == "\t":
+                self.cursor_col = min(self.columns - 1, (self.cursor_col // 8 + 1) * 8)
+            # Other control characters (bell, shift in/out, ...) draw nothing
+
+    def _put(self, char: str) -> None:
+        if self._wrap_pending:
+            self.cursor_col = 0
+            self._linefeed()
+        self._buffer[self.cursor_row][self.cursor_col] = (char, self.style)
+        self._touch(self.cursor_row)
+        if self.cursor_col == self.columns - 1:
+            # Wrap only when the next character arrives, as terminals do
+            self._wrap_pending = True
+        else:
+            self.cursor_col += 1
+
+    def _linefeed(self) -> None:
+        self._wrap_pending = False
+        if self.cursor_row == self._bottom:
+            self._scroll_up(1)
+        elif self.cursor_row < self.rows - 1:
+            self.cursor_row += 1
+
+    def _reverse_linefeed(self) -> None:
+        self._wrap_pending = False
+        if self.cursor_row == self._top:
+            self._scroll_down(1)
+        elif self.cursor_row > 0:
+            self.cursor_row -= 1
+
+    def _scroll_up(self, count: int) -> None:
+        """Scroll the scrolling region up, saving lines leaving the top of the primary screen"""
+        count = min(count, self._bottom - self._top + 1)
+        for _ in range(count):
+            row = self._buffer.pop(self._top)
+            html = self._row_cache.pop(self._top)
+            if self._top == 0 and not self.alternate_screen:
+                self._scrollback.append(html if html is not None else _row_html(row))
+            self._buffer.insert(self._bottom, _blank_row(self.columns))
+            self._row_cache.insert(self._bottom, None)
+
+    def _scroll_down(self, count: int) -> None:
+        count = min(count, self._bottom - self._top + 1)
+        for _ in range(count):
+            del self._buffer[self._bottom]
+            del self._row_cache[self._bottom]
+            self._buffer.insert(self._top, _blank_row(self.columns))
+            self._row_cache.insert(self._top, None)
+
+    def _erase(self, row: int, start: int, end: int) -> None:
+        cells = self._buffer[row]
+        cells[start:end] = [BLANK] * (end - start)
+        self._touch(row)
+
+    def _move_to(self, row: int, col: int) -> None:
+        self.cursor_row = min(max(row, 0), self.rows - 1)
+        self.cursor_col = min(max(col, 0), self.columns - 1)
+        self._wrap_pending = False
+
+    def _csi(self, parameters: str, final: str) -> None:
+        if final == "m":
+            self.style = apply_sgr(self.style, parse_params(parameters))
+            return
+        if final in "hl":
+            if parameters in _ALTERNATE_SCREEN_MODES:
+                self._set_alternate_screen(final == "h")
+            return
+        if parameters.startswith(("?", ">", "=")):
+            # Other private modes (cursor visibility, bracketed paste, ...) do not affect cells
+            return
+
+        params = parse_params(parameters)
+        first = params[0]
+        count = max(first, 1)
+        row, col = self.cursor_row, self.cursor_col
+
+        if final == "A":
+            self._move_to(max(row - count, self._top if row >= self._top else 0), col)
+        elif final in "Be":
+            self._move_to(min(row + count, self._bottom if row <= self._bottom else self.rows - 1), col)
+        elif final in "Ca":
+            self._move_to(row, col + count)
+        elif final == "D":
+            self._move_to(row, col - count)
+        elif final == "E":
+            self._move_to(row + count, 0)
+        elif final == "F":
+            self._move_to(row - count, 0)
+        elif final in "G`":
+            self._move_to(row, count - 1)
+        elif final == "d":
+            self._move_to(count - 1, col)
+        elif final in "Hf":
+            self._move_to(count - 1, max(params[1], 1) - 1 if len(params) > 1 else 0)
+        elif final == "J":
+            if first == 0:
+                self._erase(row, col, self.columns)
+                for below in range(row + 1, self.rows):
+                    self._erase(below, 0, self.columns)
+            elif first == 1:
+                for above in range(row):
+                    self._erase(above, 0, self.columns)
+                self._erase(row, 0, col + 1)
+            elif first == 2:
+                for every in range(self.rows):
+                    self._erase(every, 0, self.columns)
+            elif first == 3:
+                self._scrollback.clear()
+        elif final == "K":
+            if first == 0:
+                self._erase(row, col, self.columns)
+            elif first == 1:
+                self._erase(row, 0, col + 1)
+            elif first == 2:
+                self._erase(row, 0, self.columns)
+        elif final == "X":
+            self._erase(row, col, min(self.columns, col + count))
+        elif final == "P":
+            cells = self._buffer[row]
+            del cells[col:col + count]
+            cells.extend([BLANK] * (self.columns - len(cells)))
+            self._touch(row)
+        elif final == "@":
+            cells = self._buffer[row]
+            cells[col:col] = [BLANK] * count
+            del cells[self.columns:]
+            self._touch(row)
+        elif final in "LM" and self._top <= row <= self._bottom:
+            top = self._top
+            self._top = row
+            if final == "L":
+                self._scroll_down(count)
+            else:
+                self._scroll_up_in_place(count)
+            self._top = top
+            self.cursor_col = 0
+        elif final == "S":
+            self._scroll_up(count)
+        elif final == "T":
+            self._scroll_down(count)
+        elif final == "r":
+            top = max(first, 1) - 1
+            bottom = (params[1] if len(params) > 1 and params[1] else self.rows) - 1
+            if 0 <= top < bottom < self.rows:
+                self._top, self._bottom = top, bottom
+                self._move_to(0, 0)
+        elif final == "s":
+            self._saved_cursor = (row, col, self.style)
+        elif final == "u":
+            self._restore_cursor()
+
+    def _scroll_up_in_place(self, count: int) -> None:
+        """Delete lines at the cursor without sending them to the scrollback"""
+        count = min(count, self._bottom - self._top + 1)
+        for _ in range(count):
+            del self._buffer[self._top]
+            del self._row_cache[self._top]
+            self._buffer.insert(self._bottom, _blank_row(self.columns))
+            self._row_cache.insert(self._bottom, None)
+
+    def _escape(self, sequence: str) -> None:
+        code = sequence[1:]
+        if code == "7":
+            self._saved_cursor = (self.cursor_row, self.cursor_col, self.style)
+        elif code == "8":
+            self._restore_cursor()
+        elif code == "D":
+            self._linefeed()
+        elif code == "E":
+            self.cursor_col = 0
+            self._linefeed()
+        elif code == "M":
+            self._reverse_linefeed()
+        elif code == "c":
+            self._reset()
+        # Charset selection, OSC titles and keypad modes do not affect cells
+
+    def _restore_cursor(self) -> None:
+        row, col, self.style = self._saved_cursor
+        self._move_to(row, col)
+
+    def _set_alternate_screen(self, enabled: bool) -> None:
+        if enabled == self.alternate_screen:
+            return
+        if enabled:
+            self._saved_primary = (self._buffer, self._row_cache, self.cursor_row, self.cursor_col)
+            self._buffer = [_blank_row(self.columns) for _ in range(self.rows)]
+            self._row_cache = [None] * self.rows
+        else:
+            self._buffer, self._row_cache, row, col = self._saved_primary
+            self._saved_primary = None
+            self._move_to(row, col)
+        self._top, self._bottom = 0, self.rows - 1
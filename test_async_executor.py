@@ -0,0 +1,29 @@
+import threading
+import time
+
+from async_executor import SyncCommandExecutor, get_shared_loop
+
+CONCURRENT_COMMANDS = 100
+
+
+def test_concurrent_commands_share_threads():
+    get_shared_loop()
+    baseline = threading.active_count()
+
+    executors = [SyncCommandExecutor() for _ in range(CONCURRENT_COMMANDS)]
+    for executor in executors:
+        assert executor.execute_command("sleep 1")
+
+    # Wait until every child has been spawned, then count while they all run
+    deadline = time.monotonic() + 10
+    while any(executor._session.returncode is None and executor._session._process is None
+              for executor in executors) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    running = threading.active_count()
+
+    deadline = time.monotonic() + 30
+    while any(executor.is_running() for executor in executors) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert running - baseline < 5
+    assert all(executor.get_return_code() == 0 for executor in executors)
@@ -0,0 +1,22 @@
+import pytest
+
+from output_store import OutputStore
+
+LOG = 'ok\nERROR one\nfine\nERROR two\nxERROR\n'
+
+
+@pytest.mark.parametrize("spilled", [False, True])
+def test_search_anchors_match_each_line(spilled):
+    store = OutputStore(max_bytes=16, spill_to_disk=True) if spilled else OutputStore()
+    store.append(LOG)
+    assert store.spilled == spilled
+
+    hits, _ = store.search('^ERROR', regex=True)
+    assert [(hit.line, hit.text) for hit in hits] == [(1, 'ERROR one'), (3, 'ERROR two')]
+
+    hits, _ = store.search('two$', regex=True)
+    assert [(hit.line, hit.text) for hit in hits] == [(3, 'ERROR two')]
+
+    hits, _ = store.search('ERROR$', regex=True)
+    assert [(hit.line, hit.text) for hit in hits] == [(4, 'xERROR')]
+    store.close()